@@ -0,0 +1,177 @@
+"""Runtime configuration for the DocAI backend, read from environment variables."""
+import os
+
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# NLP models
+SPACY_MODEL = os.environ.get("DOCAI_SPACY_MODEL", "en_core_web_sm")
+SPACY_AUTO_DOWNLOAD = _env_flag("DOCAI_SPACY_AUTO_DOWNLOAD", False)
+EMBEDDING_MODEL = os.environ.get("DOCAI_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+FALLBACK_EMBEDDING_MODEL = os.environ.get(
+    "DOCAI_FALLBACK_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+
+# Persistent embedding cache (see app/services/embedding_cache.py)
+EMBEDDING_CACHE_ENABLED = _env_flag("DOCAI_EMBEDDING_CACHE", True)
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "DOCAI_EMBEDDING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "docai", "embeddings")
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("DOCAI_EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# In-process cache of finished summaries (see app/services/result_cache.py)
+RESULT_CACHE_ENABLED = _env_flag("DOCAI_RESULT_CACHE", True)
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("DOCAI_RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_TTL = float(os.environ.get("DOCAI_RESULT_CACHE_TTL", "21600"))  # seconds
+
+# Summarization jobs (see app/services/summary_jobs.py): threads running the CPU stages,
+# jobs accepted before new ones are refused, and seconds a finished job stays queryable
+JOB_WORKERS = int(os.environ.get("DOCAI_JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+JOB_MAX_PENDING = int(os.environ.get("DOCAI_JOB_MAX_PENDING", "64"))
+JOB_TTL = float(os.environ.get("DOCAI_JOB_TTL", "3600"))
+MAX_UPLOAD_BYTES = int(os.environ.get("DOCAI_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Origins allowed to call the API from a browser (the Vite dev server by default), comma-separated
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get("DOCAI_CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
+    if origin.strip()
+]
+
+# Batch summarization (see app/services/batch_summarizer.py): threads reading and chunking
+# documents, texts per pooled encode call, seconds a partial batch waits for more texts,
+# processes running the cluster selection
+BATCH_WORKERS = int(os.environ.get("DOCAI_BATCH_WORKERS", str(min(8, os.cpu_count() or 1))))
+BATCH_EMBED_BATCH_SIZE = int(os.environ.get("DOCAI_BATCH_EMBED_BATCH_SIZE", "1024"))
+BATCH_EMBED_MAX_WAIT = float(os.environ.get("DOCAI_BATCH_EMBED_MAX_WAIT", "0.05"))
+BATCH_CLUSTER_WORKERS = int(os.environ.get("DOCAI_BATCH_CLUSTER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Bulk deck generation (see app/services/pptx_generator.py): worker processes, address-space
+# limit of each worker in MB (0 for none), and decks a worker renders before it is replaced
+PPTX_WORKERS = int(os.environ.get("DOCAI_PPTX_WORKERS", str(min(4, os.cpu_count() or 1))))
+PPTX_WORKER_MAX_MEMORY_MB = int(os.environ.get("DOCAI_PPTX_WORKER_MAX_MEMORY_MB", "1024"))
+PPTX_DECKS_PER_WORKER = int(os.environ.get("DOCAI_PPTX_DECKS_PER_WORKER", "200"))
+
+# File storage (see app/services/storage.py): "dropbox", or "local" (a directory, for tests
+# and offline work); transfer part size in bytes (a multiple of 4 MiB for Dropbox), parts
+# transferred in parallel per file, pooled HTTP connections and seconds per request
+STORAGE_BACKEND = os.environ.get("DOCAI_STORAGE_BACKEND", "dropbox")
+STORAGE_LOCAL_ROOT = os.environ.get(
+    "DOCAI_STORAGE_LOCAL_ROOT", os.path.join(os.path.expanduser("~"), ".local", "share", "docai", "storage")
+)
+STORAGE_CHUNK_SIZE = int(os.environ.get("DOCAI_STORAGE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+STORAGE_PARALLEL_PARTS = int(os.environ.get("DOCAI_STORAGE_PARALLEL_PARTS", "4"))
+STORAGE_MAX_CONNECTIONS = int(os.environ.get("DOCAI_STORAGE_MAX_CONNECTIONS", "16"))
+STORAGE_TIMEOUT = float(os.environ.get("DOCAI_STORAGE_TIMEOUT", "100"))
+# A refresh token (with the app key and secret) is preferred over a short-lived access token.
+DROPBOX_ACCESS_TOKEN = os.environ.get("DROPBOX_ACCESS_TOKEN", "")
+DROPBOX_REFRESH_TOKEN = os.environ.get("DROPBOX_REFRESH_TOKEN", "")
+DROPBOX_APP_KEY = os.environ.get("DROPBOX_APP_KEY", "")
+DROPBOX_APP_SECRET = os.environ.get("DROPBOX_APP_SECRET", "")
+
+# Upload metadata (see app/services/upload_metadata.py): "firestore" (or its emulator, with
+# FIRESTORE_EMULATOR_HOST set) or "memory"; uploads per page, seconds a cached page is
+# served and users whose pages are cached
+METADATA_BACKEND = os.environ.get("DOCAI_METADATA_BACKEND", "firestore")
+FIRESTORE_PROJECT = os.environ.get("DOCAI_FIRESTORE_PROJECT", "")
+UPLOADS_COLLECTION = os.environ.get("DOCAI_UPLOADS_COLLECTION", "uploads")
+UPLOADS_PAGE_SIZE = int(os.environ.get("DOCAI_UPLOADS_PAGE_SIZE", "50"))
+UPLOADS_CACHE_TTL = float(os.environ.get("DOCAI_UPLOADS_CACHE_TTL", "300"))
+UPLOADS_CACHE_USERS = int(os.environ.get("DOCAI_UPLOADS_CACHE_USERS", "10000"))
+
+# Extractive engine (see app/services/extractive.py): answer "extractive" requests locally
+# instead of through the LLM; fall back to it when the LLM call fails, or has not answered
+# after EXTRACTIVE_FALLBACK_AFTER seconds (0 waits for the gateway's own timeouts and retries);
+# sentence scoring ("auto", "lexrank" or "centroid") and the weight of centrality against
+# redundancy when picking sentences (1 ignores redundancy)
+EXTRACTIVE_LOCAL = _env_flag("DOCAI_EXTRACTIVE_LOCAL", True)
+EXTRACTIVE_FALLBACK = _env_flag("DOCAI_EXTRACTIVE_FALLBACK", True)
+EXTRACTIVE_FALLBACK_AFTER = float(os.environ.get("DOCAI_EXTRACTIVE_FALLBACK_AFTER", "0"))
+EXTRACTIVE_METHOD = os.environ.get("DOCAI_EXTRACTIVE_METHOD", "auto")
+EXTRACTIVE_DIVERSITY = float(os.environ.get("DOCAI_EXTRACTIVE_DIVERSITY", "0.7"))
+
+# Pipeline instrumentation (see app/services/instrumentation.py): per-stage timings, memory and
+# counts, exported at GET /metrics; peak memory from tracemalloc instead of the RSS (slower,
+# for benchmarks); stages run under cProfile ("embed,cluster", or "*" for all) and the
+# directory their profiles are dumped to (kept in memory only when empty)
+METRICS_ENABLED = _env_flag("DOCAI_METRICS_ENABLED", True)
+METRICS_TRACEMALLOC = _env_flag("DOCAI_METRICS_TRACEMALLOC", False)
+PROFILE_STAGES = os.environ.get("DOCAI_PROFILE_STAGES", "")
+PROFILE_DIR = os.environ.get("DOCAI_PROFILE_DIR", "")
+
+# Embedding backend (see app/services/embedding_backends.py): "torch" (fp32), "torch-int8",
+# "onnx" or "onnx-int8"; padded tokens and texts per batch; intra-op threads per worker for
+# torch or ONNX Runtime (0 keeps the library default; DOCAI_TORCH_THREADS is still read);
+# the ONNX exports to load from the model repository, and for models shipping no int8
+# export, the quantization config ("avx2", "avx512", "avx512_vnni" or "arm64") and directory
+# of the local one
+EMBEDDING_BACKEND = os.environ.get("DOCAI_EMBEDDING_BACKEND", "torch")
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("DOCAI_EMBEDDING_BATCH_TOKENS", "8192"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get("DOCAI_EMBEDDING_MAX_BATCH_SIZE", "128"))
+EMBEDDING_THREADS = int(os.environ.get("DOCAI_EMBEDDING_THREADS", os.environ.get("DOCAI_TORCH_THREADS", "0")))
+EMBEDDING_ONNX_FILE = os.environ.get("DOCAI_EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+EMBEDDING_ONNX_INT8_FILE = os.environ.get("DOCAI_EMBEDDING_ONNX_INT8_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+EMBEDDING_ONNX_QUANTIZATION = os.environ.get("DOCAI_EMBEDDING_ONNX_QUANTIZATION", "avx2")
+EMBEDDING_ONNX_DIR = os.environ.get(
+    "DOCAI_EMBEDDING_ONNX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "docai", "onnx")
+)
+
+# Document outlines (see app/services/outline.py): outlines kept in memory, the directory
+# they are persisted to (memory only when empty) and how much larger than the body text a
+# PDF line's font must be to count as a heading (for PDFs without bookmarks)
+OUTLINE_CACHE_ENTRIES = int(os.environ.get("DOCAI_OUTLINE_CACHE_ENTRIES", "256"))
+OUTLINE_CACHE_DIR = os.environ.get(
+    "DOCAI_OUTLINE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "docai", "outlines")
+)
+OUTLINE_HEADING_FONT_RATIO = float(os.environ.get("DOCAI_OUTLINE_HEADING_FONT_RATIO", "1.15"))
+
+# Document ingestion (see app/services/ingestion.py)
+INGEST_WORKERS = int(os.environ.get("DOCAI_INGEST_WORKERS", str(min(8, os.cpu_count() or 1))))
+INGEST_PAGES_PER_TASK = int(os.environ.get("DOCAI_INGEST_PAGES_PER_TASK", "16"))
+INGEST_PARALLEL_MIN_PAGES = int(os.environ.get("DOCAI_INGEST_PARALLEL_MIN_PAGES", "64"))
+
+# Long-document strategy: "select" (central chunks, one LLM call), "map_reduce", or
+# "auto" (map-reduce only when the chunks don't fit in the prompt budget)
+SUMMARY_MODE = os.environ.get("DOCAI_SUMMARY_MODE", "auto")
+MAP_REDUCE_GROUP_BY = os.environ.get("DOCAI_MAP_REDUCE_GROUP_BY", "cluster")  # or "window"
+MAP_REDUCE_GROUP_TOKENS = int(os.environ.get("DOCAI_MAP_REDUCE_GROUP_TOKENS", "6000"))
+MAP_REDUCE_FAN_OUT = int(os.environ.get("DOCAI_MAP_REDUCE_FAN_OUT", "8"))
+MAP_REDUCE_MAX_DEPTH = int(os.environ.get("DOCAI_MAP_REDUCE_MAX_DEPTH", "3"))
+MAP_REDUCE_PARTIAL_WORDS = int(os.environ.get("DOCAI_MAP_REDUCE_PARTIAL_WORDS", "250"))
+
+# Cluster-count search (see app/services/cluster_selection.py): "fast" or "exhaustive"
+CLUSTER_SELECTION = os.environ.get("DOCAI_CLUSTER_SELECTION", "fast")
+CLUSTER_FIT_SAMPLE_SIZE = int(os.environ.get("DOCAI_CLUSTER_FIT_SAMPLE_SIZE", "4000"))
+CLUSTER_SCORE_SAMPLE_SIZE = int(os.environ.get("DOCAI_CLUSTER_SCORE_SAMPLE_SIZE", "1500"))
+CLUSTER_TIME_BUDGET = float(os.environ.get("DOCAI_CLUSTER_TIME_BUDGET", "0"))  # seconds, 0 = no limit
+CLUSTER_MINIBATCH_THRESHOLD = int(os.environ.get("DOCAI_CLUSTER_MINIBATCH_THRESHOLD", "20000"))
+
+# Load every model at startup (in the gunicorn master when preloading) instead of on first request.
+PRELOAD_MODELS = _env_flag("DOCAI_PRELOAD_MODELS", True)
+
+# LLM provider (see app/services/llm_gateway.py): "cohere", or "stub" for the offline stub server
+LLM_PROVIDER = os.environ.get("DOCAI_LLM_PROVIDER", "cohere")
+LLM_STUB_URL = os.environ.get("DOCAI_LLM_STUB_URL", "http://127.0.0.1:8100")
+LLM_MAX_CONCURRENCY = int(os.environ.get("DOCAI_LLM_MAX_CONCURRENCY", "32"))
+LLM_TIMEOUT = float(os.environ.get("DOCAI_LLM_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.environ.get("DOCAI_LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("DOCAI_LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("DOCAI_LLM_RETRY_MAX_DELAY", "20"))
+COHERE_BASE_URL = os.environ.get("DOCAI_COHERE_BASE_URL", "")
+COHERE_API_KEY = os.environ.get("COHERE_API_KEY", "")
+COHERE_MODEL = os.environ.get("DOCAI_COHERE_MODEL", "command-a-03-2025")
+LLM_MAX_OUTPUT_TOKENS = int(os.environ.get("DOCAI_LLM_MAX_OUTPUT_TOKENS", "2300"))
+# Context window override in tokens; 0 uses token_budget.CONTEXT_WINDOWS for the model.
+LLM_CONTEXT_WINDOW = int(os.environ.get("DOCAI_LLM_CONTEXT_WINDOW", "0"))
+# Cap on prompt tokens (cost control, and how much of a long document "select" mode
+# keeps); 0 fills the whole context window, e.g. 256k tokens for command-a.
+LLM_MAX_PROMPT_TOKENS = int(os.environ.get("DOCAI_LLM_MAX_PROMPT_TOKENS", "8000"))
+# Fraction of the window kept free for tokenizer differences (tiktoken vs the provider's).
+LLM_TOKEN_SAFETY_MARGIN = float(os.environ.get("DOCAI_LLM_TOKEN_SAFETY_MARGIN", "0.05"))
+
+# Forked workers must not inherit a live tokenizers thread pool.
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
@@ -0,0 +1,32 @@
+"""
+DocAI API entry point.
+
+Run a single process with `uvicorn app.main:app`, or several workers sharing
+the preloaded models with `gunicorn -c gunicorn.conf.py`.
+"""
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from app import config
+from app.routes import metrics, summary
+from app.services import ingestion, llm_gateway, model_registry, storage, summary_jobs
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # No-op when the gunicorn master already loaded the models before forking.
+    if config.PRELOAD_MODELS:
+        model_registry.warm_up()
+    yield
+    summary_jobs.shutdown()
+    ingestion.shutdown_pool()
+    llm_gateway.close()
+    storage.close()
+
+
+app = FastAPI(title="DocAI", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=config.CORS_ORIGINS, allow_methods=["*"], allow_headers=["*"])
+app.include_router(summary.router)
+app.include_router(metrics.router)
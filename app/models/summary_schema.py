@@ -0,0 +1,39 @@
+"""Request and response models of the summarization API (app/routes/summary.py)."""
+from typing import List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+class SummaryOptions(BaseModel):
+    """Settings of one summary, as accepted by `summarize_document`."""
+
+    summary_format: str = "paragraph"  # "paragraph" or "bullet points"
+    summary_length: Union[int, str] = 150  # words, or "low" / "moderate" / "high"
+    summary_tone: str = "neutral"
+    language: str = "english"
+    vocabulary: Literal["abstractive", "extractive"] = "abstractive"
+    themes: Optional[List[str]] = None
+    paragraph_title: Optional[str] = None
+    mode: Optional[Literal["auto", "select", "map_reduce"]] = None
+
+
+class JobCreated(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "done", "failed", "cancelled"]
+    stage: Optional[str] = None
+    summary: str = ""
+    error: Optional[str] = None
+    cached: bool = False
+    engine: Optional[str] = None  # "llm", "extractive", "fallback" (extractive, LLM unavailable) or "cache"
+    created_at: float
+    metrics: Optional[dict] = None  # wall time and per-stage totals (see instrumentation.Trace.report)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    options: SummaryOptions = Field(default_factory=SummaryOptions)
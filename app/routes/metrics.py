@@ -0,0 +1,21 @@
+"""
+Pipeline metrics for Prometheus.
+
+    GET /metrics    per-stage durations (histogram), CPU time, peak memory and counters
+
+Aggregated over the process: with several gunicorn workers, each scrape
+reaches one worker.
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services import instrumentation
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(
+        instrumentation.get_metrics().prometheus_text(), media_type="text/plain; version=0.0.4"
+    )
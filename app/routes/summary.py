@@ -0,0 +1,167 @@
+"""
+Summarization API.
+
+    POST   /summary/jobs              start a job (multipart: file or text, options as JSON)
+    GET    /summary/jobs/{id}         job status and the summary written so far
+    GET    /summary/jobs/{id}/events  Server-Sent Events: status, progress, token, done, error
+    DELETE /summary/jobs/{id}         cancel a job
+    GET    /summary/stats             result cache, job and pipeline stage counters
+
+The POST returns at once; the CPU stages run on the job pool and the LLM
+answer is streamed token by token over the events endpoint, which can be
+resumed with the standard Last-Event-ID header.
+"""
+import json
+import os
+import tempfile
+from typing import Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+from app import config
+from app.models.summary_schema import JobCreated, JobStatus, SummaryOptions
+from app.services import ingestion, instrumentation, result_cache, summary_jobs
+
+HEARTBEAT_SECONDS = 15
+
+router = APIRouter(prefix="/summary", tags=["summary"])
+
+
+def _save_upload(upload):
+    """Copies an upload to a temporary file with the same extension, enforcing the size limit."""
+    extension = os.path.splitext(upload.filename or "")[1].lower()
+    if extension not in ingestion.SUPPORTED_EXTENSIONS:
+        raise HTTPException(415, "Unsupported file format. Use TXT, PDF, or DOCX.")
+
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix="docai-", suffix=extension, delete=False) as target:
+        try:
+            while True:
+                block = upload.file.read(1 << 20)
+                if not block:
+                    break
+                size += len(block)
+                if size > config.MAX_UPLOAD_BYTES:
+                    raise HTTPException(413, f"File larger than {config.MAX_UPLOAD_BYTES} bytes.")
+                target.write(block)
+        except BaseException:
+            target.close()
+            os.remove(target.name)
+            raise
+    return target.name
+
+
+def _get_job(job_id):
+    job = summary_jobs.get_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown job: {job_id}")
+    return job
+
+
+def _job_status(job):
+    return JobStatus(
+        job_id=job.id,
+        status=job.status,
+        stage=job.stage,
+        summary=job.summary,
+        error=job.error,
+        cached=job.cached,
+        engine=job.engine,
+        metrics=job.trace.report(),
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        options=SummaryOptions(**{name: value for name, value in job.options.items() if name != "structure"}),
+    )
+
+
+@router.post("/jobs", response_model=JobCreated, status_code=202)
+async def create_job(
+    file: Optional[UploadFile] = File(None),
+    text: Optional[str] = Form(None),
+    options: str = Form("{}"),
+    structure_file: Optional[UploadFile] = File(None),
+):
+    """Starts a summarization job and returns its id without waiting for the pipeline."""
+    if file is None and not (text and text.strip()):
+        raise HTTPException(422, "Upload a file or provide text.")
+    try:
+        summary_options = SummaryOptions.model_validate_json(options)
+    except ValidationError as exc:
+        raise HTTPException(422, json.loads(exc.json()))
+
+    paths = []
+    try:
+        file_path = await run_in_threadpool(_save_upload, file) if file is not None else None
+        if file_path:
+            paths.append(file_path)
+        structure = await run_in_threadpool(_save_upload, structure_file) if structure_file is not None else None
+        if structure:
+            paths.append(structure)
+
+        job_options = dict(summary_options.model_dump(), structure=structure)
+        job = summary_jobs.get_jobs().submit(
+            file_path, text if file_path is None else None, job_options,
+            cleanup=lambda: summary_jobs.remove_files(paths),
+        )
+    except summary_jobs.JobQueueFull as exc:
+        summary_jobs.remove_files(paths)
+        raise HTTPException(503, str(exc), headers={"Retry-After": "5"})
+    except BaseException:
+        summary_jobs.remove_files(paths)
+        raise
+
+    return JobCreated(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"{router.prefix}/jobs/{job.id}",
+        events_url=f"{router.prefix}/jobs/{job.id}/events",
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    return _job_status(_get_job(job_id))
+
+
+@router.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    job = _get_job(job_id)
+    await summary_jobs.get_jobs().cancel(job)
+    return _job_status(job)
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Streams the job's events as Server-Sent Events, from the start or after Last-Event-ID."""
+    job = _get_job(job_id)
+    try:
+        start = int(request.headers.get("last-event-id", "-1")) + 1
+    except ValueError:
+        start = 0
+
+    async def events():
+        async for item in job.follow(start, heartbeat=HEARTBEAT_SECONDS):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id, event, data = item
+            yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats")
+async def stats():
+    return {
+        "result_cache": result_cache.get_result_cache().stats(),
+        "jobs": summary_jobs.get_jobs().stats(),
+        "stages": instrumentation.get_metrics().snapshot(),
+    }
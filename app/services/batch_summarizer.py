@@ -0,0 +1,481 @@
+"""
+Batch summarization of whole folders of documents.
+
+    python -m app.services.batch_summarizer ./reports --output summaries.jsonl
+    python -m app.services.batch_summarizer manifest.jsonl --output summaries.jsonl --length moderate
+
+The input is a directory (searched recursively for TXT, PDF and DOCX files) or
+a manifest: one path per line, or JSON lines `{"path": ..., "id": ..., "options": {...}}`
+with per-document options. Relative paths are resolved from the manifest's folder.
+
+Documents flow through three pools at once:
+
+- reader threads read, sentence-split and chunk several documents concurrently;
+- their `encode` calls are pooled across documents by `EmbeddingBatcher` into
+  large batches (one model, loaded once);
+- cluster selection runs on a process pool, and the LLM calls (final prompts,
+  and the map-reduce levels of long documents) go through the gateway with at
+  most `llm_concurrency` in flight. Final prompts wait in a queue for a free
+  slot, so finished documents keep being recorded meanwhile ("extractive"
+  documents are summarized locally by the reader threads and skip the LLM).
+
+Every finished document is appended to the output JSON lines file at once,
+which doubles as the checkpoint: a rerun skips the documents already done
+(unless the file or its options changed) and retries the failed ones.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+from multiprocessing import get_context
+
+import numpy as np
+
+from app import config
+from app.services import ingestion, instrumentation, llm_gateway, model_registry
+from app.services.cluster_selection import select_clusters
+from app.services.summary_generator import embed_texts, extractive_summary, prepare_summary_prompt, read_document
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchDocument:
+    """
+    One document of a batch.
+
+    Attributes:
+        id (str): Identifier written with the result (the path relative to the input by default).
+        path (str): File to summarize.
+        options (dict): `summarize_document` options for this document.
+    """
+    id: str
+    path: str
+    options: dict = field(default_factory=dict)
+
+    def checkpoint_key(self):
+        """Changes when the file (size, modification time) or its options change."""
+        stat = os.stat(self.path)
+        options = json.dumps(self.options, sort_keys=True, default=str)
+        return f"{os.path.abspath(self.path)}|{stat.st_size}|{stat.st_mtime_ns}|{options}"
+
+
+def iter_directory(directory, options=None):
+    """Yields a BatchDocument for every supported file under `directory`, in path order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(ingestion.SUPPORTED_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield BatchDocument(os.path.relpath(path, directory), path, dict(options or {}))
+
+
+def iter_manifest(manifest_path, options=None):
+    """Yields the documents of a manifest (paths, or JSON lines with path / id / options)."""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding="utf-8") as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"path": line}
+            path = os.path.join(base, entry["path"])
+            document_options = dict(options or {}, **entry.get("options", {}))
+            yield BatchDocument(entry.get("id", entry["path"]), path, document_options)
+
+
+def load_checkpoint(output_path):
+    """Checkpoint keys of the documents already summarized in `output_path`."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as results:
+        for line in results:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash; that document is redone
+            if record.get("status") == "done":
+                done.add(record["key"])
+    return done
+
+
+class EmbeddingBatcher:
+    """
+    Pools `embed` calls made by many threads into large batches.
+
+    Callers block until their own rows are ready. A batch is encoded once it
+    holds `batch_size` texts or its first request has waited `max_wait` seconds.
+
+    Args:
+        embed (callable, optional): Function mapping texts to embeddings (defaults to `embed_texts`).
+        batch_size (int, optional): Texts per encode call. Defaults to config.BATCH_EMBED_BATCH_SIZE.
+        max_wait (float, optional): Seconds a partial batch waits. Defaults to config.BATCH_EMBED_MAX_WAIT.
+    """
+
+    def __init__(self, embed=None, batch_size=None, max_wait=None):
+        self.embed = embed or embed_texts
+        self.batch_size = batch_size or config.BATCH_EMBED_BATCH_SIZE
+        self.max_wait = config.BATCH_EMBED_MAX_WAIT if max_wait is None else max_wait
+        self.batches = 0
+        self.texts = 0
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def __call__(self, texts):
+        texts = list(texts)
+        if not texts:
+            return self.embed(texts)
+        future = Future()
+        self._requests.put((texts, future))
+        return future.result()
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            request = self._requests.get()
+            if request is None:
+                return
+            requests, size = [request], len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.batch_size:
+                try:
+                    request = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                requests.append(request)
+                size += len(request[0])
+            self._encode(requests)
+
+    def _encode(self, requests):
+        texts = [text for request_texts, _ in requests for text in request_texts]
+        try:
+            vectors = np.asarray(self.embed(texts))
+        except BaseException as exc:
+            for _, future in requests:
+                future.set_exception(exc)
+            return
+        self.batches += 1
+        self.texts += len(texts)
+        start = 0
+        for request_texts, future in requests:
+            future.set_result(vectors[start:start + len(request_texts)])
+            start += len(request_texts)
+
+
+class LLMSlots:
+    """
+    Bounds the LLM calls of a batch, whoever makes them.
+
+    Final calls are queued with `submit` and sent from the answer callbacks as
+    slots free up, so the dispatching thread never blocks on a slot. Map-reduce
+    levels go through `complete_many`, which waits for a slot per call in the
+    calling (reader) thread.
+
+    Args:
+        limit (int): LLM calls in flight at most.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._free = limit
+        self._queue = deque()
+        self._pending = 0  # queued or sent submit() calls whose callback has not returned
+        self._condition = threading.Condition()
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, prompt, on_answer, **kwargs):
+        """Queues a call; `on_answer(future)` is called once it is answered (or fails)."""
+        with self._condition:
+            self._queue.append((prompt, kwargs, on_answer))
+            self._pending += 1
+        self._dispatch()
+
+    def complete_many(self, prompts, **kwargs):
+        """`llm_gateway.complete_many`, holding one slot per call in flight."""
+        futures = []
+        try:
+            for prompt in prompts:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._free > 0)
+                    self._free -= 1
+                futures.append(self._send(prompt, kwargs, None))
+            return [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def wait(self, timeout=None):
+        """Waits for an answer (or `timeout` seconds)."""
+        with self._condition:
+            self._condition.wait(timeout)
+
+    def join(self):
+        """Waits until every submitted call has been answered and its callback has returned."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending == 0)
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if not self._queue or self._free == 0:
+                    return
+                self._free -= 1
+                prompt, kwargs, on_answer = self._queue.popleft()
+            self._send(prompt, kwargs, on_answer)
+
+    def _send(self, prompt, kwargs, on_answer):
+        try:
+            future = llm_gateway.submit(prompt, **kwargs)
+        except Exception as exc:
+            future = Future()
+            future.set_exception(exc)
+        future.add_done_callback(partial(self._answered, on_answer))
+        return future
+
+    def _answered(self, on_answer, future):
+        # A Future wakes its waiters before running its done callbacks, so the slot
+        # is released and the answer recorded here, not by whoever waits on it.
+        with self._condition:
+            self._free += 1
+            self._condition.notify_all()
+        try:
+            if on_answer is not None:
+                on_answer(future)
+        finally:
+            if on_answer is not None:
+                with self._condition:
+                    self._pending -= 1
+                    self._condition.notify_all()
+            self._dispatch()
+
+
+class BatchSummarizer:
+    """
+    Summarizes many documents with shared pools, appending results to a JSON lines file.
+
+    Args:
+        output_path (str): Results file, also used as the checkpoint.
+        workers (int, optional): Threads reading and chunking documents. Defaults to config.BATCH_WORKERS.
+        embed_batch_size (int, optional): Texts per pooled encode call.
+        cluster_workers (int, optional): Processes for cluster selection (0 runs it in the reader threads).
+        llm_concurrency (int, optional): LLM calls in flight (final and map-reduce). Defaults to config.LLM_MAX_CONCURRENCY.
+        report_interval (float): Seconds between progress lines.
+    """
+
+    def __init__(self, output_path, workers=None, embed_batch_size=None, cluster_workers=None,
+                 llm_concurrency=None, report_interval=10.0):
+        self.output_path = output_path
+        self.workers = workers or config.BATCH_WORKERS
+        self.embed_batch_size = embed_batch_size
+        self.cluster_workers = config.BATCH_CLUSTER_WORKERS if cluster_workers is None else cluster_workers
+        self.llm_concurrency = llm_concurrency or config.LLM_MAX_CONCURRENCY
+        self.report_interval = report_interval
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self._cluster_pool = None
+        self._llm = None
+
+    def _select(self, embeddings, n_clusters=None):
+        return self._cluster_pool.submit(select_clusters, embeddings, n_clusters=n_clusters).result()
+
+    def _prepare(self, document, embed):
+        """Returns (prompt, summary, seconds): the summary for local extractive documents, else the prompt."""
+        started = time.perf_counter()
+        options = document.options
+        if options.get("vocabulary") == "extractive" and config.EXTRACTIVE_LOCAL:
+            text = read_document(document.path, None, options.get("paragraph_title"))
+            summary = extractive_summary(
+                text, options.get("summary_length", 150), options.get("summary_format", "paragraph"), embed=embed,
+            )
+            return None, summary, time.perf_counter() - started
+        prompt = prepare_summary_prompt(
+            document.path, None, embed=embed, select=self._select if self._cluster_pool else None,
+            complete_many=self._llm.complete_many, **options,
+        )
+        return prompt, None, time.perf_counter() - started
+
+    def _write(self, output, record):
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        os.fsync(output.fileno())
+        if record["status"] == "done":
+            self.done += 1
+        else:
+            self.failed += 1
+
+    def run(self, documents):
+        """
+        Summarizes `documents` (an iterable of BatchDocument), skipping those already in the checkpoint.
+
+        Returns:
+            dict: Counts, elapsed seconds, docs/minute and pooling statistics.
+        """
+        started = time.perf_counter()
+        finished = load_checkpoint(self.output_path)
+        model_registry.warm_up()
+
+        batcher = EmbeddingBatcher(batch_size=self.embed_batch_size)
+        readers = ThreadPoolExecutor(self.workers, thread_name_prefix="batch-reader")
+        writer = ThreadPoolExecutor(1, thread_name_prefix="batch-writer")
+        if self.cluster_workers:
+            self._cluster_pool = ProcessPoolExecutor(self.cluster_workers, mp_context=get_context("spawn"))
+        llm = self._llm = LLMSlots(self.llm_concurrency)
+        output = open(self.output_path, "a", encoding="utf-8")
+
+        def record(document, key, status, **fields):
+            writer.submit(self._write, output, dict(id=document.id, path=document.path, key=key, status=status, **fields))
+
+        def on_answer(document, key, prepare_seconds, queued_at, future):
+            if future.exception() is not None:
+                record(document, key, "failed", error=repr(future.exception()))
+            else:
+                record(document, key, "done", summary=future.result(), prepare_seconds=round(prepare_seconds, 3),
+                       llm_seconds=round(time.perf_counter() - queued_at, 3))
+
+        pending = iter(documents)
+        in_flight = {}
+        last_report = time.perf_counter()
+        try:
+            while True:
+                # Keep the readers busy without holding every prompt of the batch in memory:
+                # no new document while a slot's worth of prompts already waits for the LLM.
+                while len(in_flight) < 2 * self.workers and llm.queued < self.llm_concurrency:
+                    document = next(pending, None)
+                    if document is None:
+                        break
+                    try:
+                        key = document.checkpoint_key()
+                    except OSError as exc:
+                        record(document, None, "failed", error=repr(exc))
+                        continue
+                    if key in finished:
+                        self.skipped += 1
+                        continue
+                    in_flight[readers.submit(self._prepare, document, batcher)] = (document, key)
+
+                if in_flight:
+                    ready, _ = wait(in_flight, timeout=self.report_interval, return_when=FIRST_COMPLETED)
+                elif llm.queued:
+                    ready = ()
+                    llm.wait(self.report_interval)  # until an answer frees a slot for the queue
+                else:
+                    break
+                for future in ready:
+                    document, key = in_flight.pop(future)
+                    if future.exception() is not None:
+                        record(document, key, "failed", error=repr(future.exception()))
+                        continue
+                    prompt, summary, prepare_seconds = future.result()
+                    if summary is not None:
+                        record(document, key, "done", summary=summary, prepare_seconds=round(prepare_seconds, 3))
+                        continue
+                    llm.submit(
+                        prompt, partial(on_answer, document, key, prepare_seconds, time.perf_counter()),
+                        max_tokens=config.LLM_MAX_OUTPUT_TOKENS, temperature=0.1,
+                    )
+
+                if time.perf_counter() - last_report >= self.report_interval:
+                    last_report = time.perf_counter()
+                    log.info(self._progress_line(started, len(in_flight), llm.pending))
+
+            llm.join()
+        finally:
+            readers.shutdown(wait=True)
+            writer.shutdown(wait=True)
+            output.close()
+            batcher.close()
+            if self._cluster_pool is not None:
+                self._cluster_pool.shutdown()
+                self._cluster_pool = None
+            self._llm = None
+
+        elapsed = time.perf_counter() - started
+        return {
+            "done": self.done,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "seconds": round(elapsed, 2),
+            "docs_per_minute": round(self.done * 60 / elapsed, 2) if elapsed else 0.0,
+            "embedding_batches": batcher.batches,
+            "texts_per_batch": round(batcher.texts / batcher.batches, 1) if batcher.batches else 0.0,
+            "stages": {
+                name: {"calls": stats["calls"], "seconds": round(stats["wall"], 2), "cpu_seconds": round(stats["cpu"], 2)}
+                for name, stats in instrumentation.get_metrics().snapshot().items()
+            },
+        }
+
+    def _progress_line(self, started, preparing, generating):
+        elapsed = time.perf_counter() - started
+        rate = self.done * 60 / elapsed if elapsed else 0.0
+        return (f"Batch: {self.done} done, {self.failed} failed, {self.skipped} skipped, "
+                f"{preparing} preparing, {generating} at the LLM ({rate:.1f} docs/min)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize every document of a folder or manifest.")
+    parser.add_argument("input", help="Directory, or manifest file (paths or JSON lines)")
+    parser.add_argument("--output", required=True, help="JSON lines results file (appended to, and used to resume)")
+    parser.add_argument("--workers", type=int, default=None, help="Reader/chunker threads")
+    parser.add_argument("--embed-batch-size", type=int, default=None)
+    parser.add_argument("--cluster-workers", type=int, default=None, help="Cluster-selection processes (0: in-thread)")
+    parser.add_argument("--llm-concurrency", type=int, default=None)
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    parser.add_argument("--format", dest="summary_format", default="paragraph")
+    parser.add_argument("--length", dest="summary_length", default="150",
+                        help="Words, or low / moderate / high")
+    parser.add_argument("--tone", dest="summary_tone", default="neutral")
+    parser.add_argument("--language", default="english")
+    parser.add_argument("--vocabulary", default="abstractive")
+    parser.add_argument("--mode", default=None, choices=["auto", "select", "map_reduce"])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    length = args.summary_length
+    options = {
+        "summary_format": args.summary_format,
+        "summary_length": int(length) if length.isdigit() else length,
+        "summary_tone": args.summary_tone,
+        "language": args.language,
+        "vocabulary": args.vocabulary,
+    }
+    if args.mode:
+        options["mode"] = args.mode
+    documents = iter_directory(args.input, options) if os.path.isdir(args.input) else iter_manifest(args.input, options)
+
+    summarizer = BatchSummarizer(
+        args.output, workers=args.workers, embed_batch_size=args.embed_batch_size,
+        cluster_workers=args.cluster_workers, llm_concurrency=args.llm_concurrency,
+        report_interval=args.report_interval,
+    )
+    stats = summarizer.run(documents)
+    print(json.dumps(stats, indent=2))
+    llm_gateway.close()
+    ingestion.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
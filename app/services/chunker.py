@@ -0,0 +1,158 @@
+"""
+Streaming semantic chunker.
+
+Sentences are segmented with a sentence-only spaCy pipeline over bounded text
+blocks (`nlp.pipe`), embedded a window at a time, and grouped into chunks from
+one vectorized pass of adjacent cosine similarities. Chunks are yielded as
+soon as they close, so memory stays flat however long the document is.
+"""
+import numpy as np
+
+from app import config
+from app.services import instrumentation, model_registry
+
+# Characters per block handed to spaCy; blocks end on line breaks so sentences rarely straddle them.
+BLOCK_CHARS = 50_000
+# Sentences embedded together; bounds the embeddings held in memory at once.
+WINDOW_SENTENCES = 512
+
+
+def _load_sentence_splitter():
+    import spacy
+
+    try:
+        # Only the statistical sentence recognizer, no tagger/parser/NER.
+        nlp = spacy.load(
+            config.SPACY_MODEL,
+            exclude=["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner"],
+        )
+        nlp.enable_pipe("senter")
+        list(nlp("First sentence. Second one.").sents)
+    except Exception:
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+    return nlp
+
+
+model_registry.register("sentencizer", _load_sentence_splitter)
+
+
+def iter_text_blocks(text, block_chars=BLOCK_CHARS):
+    """
+    Splits text into blocks of about `block_chars` characters, cut at line breaks.
+
+    Args:
+        text (str or iterable): The document, or an iterable of text pieces
+            (e.g. pages) that are re-blocked as they arrive.
+    """
+    pieces = [text] if isinstance(text, str) else text
+    pending = ""
+    for piece in pieces:
+        pending += piece if not pending else "\n" + piece
+        while len(pending) > block_chars:
+            cut = pending.rfind("\n", 0, block_chars)
+            if cut <= 0:
+                cut = pending.rfind(" ", 0, block_chars)
+            if cut <= 0:
+                cut = block_chars
+            yield pending[:cut]
+            pending = pending[cut:].lstrip("\n")
+    if pending.strip():
+        yield pending
+
+
+def iter_sentences(text, batch_size=8):
+    """Yields the stripped, non-empty sentences of `text` (a string or iterable of pieces)."""
+    nlp = model_registry.get("sentencizer")
+    for doc in nlp.pipe(iter_text_blocks(text), batch_size=batch_size):
+        for sent in doc.sents:
+            sentence = sent.text.strip()
+            if sentence:
+                yield sentence
+
+
+def count_tokens(sentences, model=None):
+    """Token counts of `sentences` with the embedding model's tokenizer (words if it has none)."""
+    model = model or model_registry.get_embedding_model()
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        return [len(sentence.split()) for sentence in sentences]
+    encoded = tokenizer(sentences, add_special_tokens=False, return_attention_mask=False)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def _windows(iterable, size):
+    window = []
+    for item in iterable:
+        window.append(item)
+        if len(window) == size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def iter_semantic_chunks(text, threshold=0.7, max_tokens=200, context=None, embed=None):
+    """
+    Yields coherent chunks of `text`, grouping consecutive sentences while they
+    stay similar to the previous sentence and the chunk fits in `max_tokens`.
+
+    Args:
+        text (str or iterable): The document, or an iterable of text pieces.
+        threshold (float): Cosine similarity needed to join the previous sentence.
+        max_tokens (int): Max tokenizer tokens per chunk.
+        context (PipelineContext, optional): Receives the sentences and their embeddings.
+            This keeps every sentence embedding in memory, so leave it out for flat memory.
+        embed (callable, optional): Function mapping a list of texts to embeddings
+            (defaults to the cached `summary_generator.embed_texts`).
+
+    Yields:
+        str: Text chunks, in document order.
+    """
+    if embed is None:
+        from app.services.summary_generator import embed_texts as embed
+
+    sentence_windows = []
+    embedding_windows = []
+    previous = None
+    current_chunk = []
+    current_tokens = 0
+
+    windows = instrumentation.timed("split", _windows(iter_sentences(text), WINDOW_SENTENCES), count=len)
+    for sentences in windows:
+        with instrumentation.stage("embed", items=len(sentences)) as span:
+            embeddings = np.asarray(embed(sentences), dtype=np.float32)
+            token_counts = count_tokens(sentences)
+            if span:
+                span.count(tokens=sum(token_counts))
+        if context is not None:
+            sentence_windows.append(sentences)
+            embedding_windows.append(embeddings)
+
+        # Cosine similarity of every sentence with the one before it, in one batch.
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        unit = embeddings / np.maximum(norms, 1e-12)
+        if previous is None:
+            similarities = np.empty(len(unit), dtype=np.float32)
+            similarities[0] = -1.0
+            similarities[1:] = np.einsum("ij,ij->i", unit[1:], unit[:-1])
+        else:
+            similarities = np.einsum("ij,ij->i", unit, np.vstack([previous, unit[:-1]]))
+        previous = unit[-1]
+
+        for sentence, similarity, sentence_tokens in zip(sentences, similarities.tolist(), token_counts):
+            if current_chunk and similarity >= threshold and current_tokens + sentence_tokens <= max_tokens:
+                current_chunk.append(sentence)
+                current_tokens += sentence_tokens
+            else:
+                if current_chunk:
+                    yield " ".join(current_chunk)
+                current_chunk = [sentence]
+                current_tokens = sentence_tokens
+
+    if current_chunk:
+        yield " ".join(current_chunk)
+
+    if context is not None:
+        context.sentences = [sentence for window in sentence_windows for sentence in window]
+        context.sentence_embeddings = np.concatenate(embedding_windows) if embedding_windows else None
@@ -0,0 +1,194 @@
+"""
+Choosing the number of clusters for the chunk embeddings.
+
+`exhaustive_selection` is the original search: a full `KMeans(n_init=10)` and an
+exact O(n^2) silhouette score for every k. `fast_selection` gets close to the
+same choice from shared work:
+
+- every candidate k is fitted on one random subsample of the chunks,
+- each fit is warm-started from the previous k's centers plus one split,
+- the silhouette of every k is scored against one precomputed distance matrix
+  over a smaller sample,
+- the search stops early once the time budget is spent,
+
+and only the winning k is fitted on all chunks, starting from its sample centers.
+"""
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app import config
+
+DEFAULT_K_RANGE = range(2, 10)
+
+
+@dataclass
+class ClusterSelection:
+    """Outcome of a cluster-count search."""
+    k: int
+    model: object
+    labels: np.ndarray
+    scores: dict = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+def _candidate_ks(n, k_range):
+    return [k for k in k_range if 2 <= k < n]
+
+
+def _fit_single(embeddings, k, random_state):
+    from sklearn.cluster import KMeans
+
+    k = max(1, min(k, len(embeddings)))
+    model = KMeans(n_clusters=k, random_state=random_state, n_init=10).fit(embeddings)
+    return ClusterSelection(k=k, model=model, labels=model.labels_)
+
+
+def exhaustive_selection(embeddings, k_range=DEFAULT_K_RANGE, random_state=42):
+    """
+    Fits `KMeans(n_init=10)` for every k and keeps the best exact silhouette score.
+
+    Returns:
+        ClusterSelection: The winning k with its fitted model and labels.
+    """
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    start = time.perf_counter()
+    best = None
+    scores = {}
+    for k in _candidate_ks(len(embeddings), k_range):
+        model = KMeans(n_clusters=k, random_state=random_state, n_init=10)
+        labels = model.fit_predict(embeddings)
+        scores[k] = silhouette_score(embeddings, labels)
+        if best is None or scores[k] > scores[best.k]:
+            best = ClusterSelection(k=k, model=model, labels=labels)
+
+    if best is None:
+        best = _fit_single(embeddings, 2, random_state)
+    best.scores = scores
+    best.seconds = time.perf_counter() - start
+    return best
+
+
+def _split_init(sample, centers, labels):
+    """Previous centers plus the sample point farthest from its own center."""
+    distances = np.linalg.norm(sample - centers[labels], axis=1)
+    return np.vstack([centers, sample[np.argmax(distances)]])
+
+
+def fast_selection(
+    embeddings,
+    k_range=DEFAULT_K_RANGE,
+    fit_sample_size=None,
+    score_sample_size=None,
+    time_budget=None,
+    n_init=3,
+    random_state=42,
+):
+    """
+    Picks k from warm-started fits on a subsample and a shared sampled silhouette.
+
+    Args:
+        embeddings (np.ndarray): Chunk embeddings, one row per chunk.
+        k_range (iterable): Candidate cluster counts, searched in ascending order.
+        fit_sample_size (int, optional): Chunks used to fit the candidates.
+        score_sample_size (int, optional): Chunks used for the silhouette score
+            (distance matrix is score_sample_size^2 floats).
+        time_budget (float, optional): Seconds after which no further k is tried.
+            At least the smallest k is always evaluated.
+        n_init (int): k-means++ restarts for the first (smallest) k.
+        random_state (int): Seed for sampling and initialization.
+
+    Returns:
+        ClusterSelection: The winning k with a model fitted on all embeddings.
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    from sklearn.metrics import pairwise_distances, silhouette_score
+
+    fit_sample_size = fit_sample_size or config.CLUSTER_FIT_SAMPLE_SIZE
+    score_sample_size = score_sample_size or config.CLUSTER_SCORE_SAMPLE_SIZE
+    time_budget = config.CLUSTER_TIME_BUDGET if time_budget is None else time_budget
+
+    start = time.perf_counter()
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = len(embeddings)
+    ks = _candidate_ks(n, sorted(k_range))
+    if not ks:
+        return _fit_single(embeddings, 2, random_state)
+
+    # Every candidate k needs more sampled chunks than clusters.
+    fit_sample_size = max(fit_sample_size, ks[-1] + 1)
+    rng = np.random.default_rng(random_state)
+    order = rng.permutation(n)[:fit_sample_size]
+    sample = embeddings[order]
+    score_n = min(score_sample_size, len(sample))
+    distances = pairwise_distances(sample[:score_n])
+
+    scores = {}
+    best_k, best_centers, best_model = None, None, None
+    centers = labels = None
+    for k in ks:
+        if k >= len(sample):
+            break
+        if centers is None:
+            model = KMeans(n_clusters=k, random_state=random_state, n_init=n_init)
+        else:
+            model = KMeans(n_clusters=k, init=_split_init(sample, centers, labels), n_init=1)
+        model.fit(sample)
+        centers, labels = model.cluster_centers_, model.labels_
+
+        score_labels = labels[:score_n]
+        if len(np.unique(score_labels)) < 2:
+            scores[k] = -1.0
+        else:
+            scores[k] = float(silhouette_score(distances, score_labels, metric="precomputed"))
+        if best_k is None or scores[k] > scores[best_k]:
+            best_k, best_centers, best_model = k, centers, model
+
+        if time_budget and time.perf_counter() - start > time_budget:
+            break
+
+    if best_model is None:
+        return _fit_single(embeddings, ks[0], random_state)
+    if len(sample) == n:
+        # The sample is the whole set: the winning fit is already final, just in sample order.
+        final_labels = np.empty(n, dtype=best_model.labels_.dtype)
+        final_labels[order] = best_model.labels_
+        final = best_model
+    else:
+        if n > config.CLUSTER_MINIBATCH_THRESHOLD:
+            final = MiniBatchKMeans(
+                n_clusters=best_k, init=best_centers, n_init=1, batch_size=1024, random_state=random_state
+            )
+        else:
+            final = KMeans(n_clusters=best_k, init=best_centers, n_init=1)
+        final_labels = final.fit_predict(embeddings)
+
+    return ClusterSelection(
+        k=best_k, model=final, labels=final_labels, scores=scores, seconds=time.perf_counter() - start
+    )
+
+
+def select_clusters(embeddings, n_clusters=None, method=None, random_state=42, **options):
+    """
+    Clusters the embeddings, choosing k with `method` when `n_clusters` is None.
+
+    Args:
+        embeddings (np.ndarray): Chunk embeddings.
+        n_clusters (int, optional): Fixed number of clusters (skips the search).
+        method (str, optional): "fast" or "exhaustive". Defaults to config.CLUSTER_SELECTION.
+        **options: Extra arguments for `fast_selection`.
+
+    Returns:
+        ClusterSelection
+    """
+    if n_clusters is not None:
+        return _fit_single(embeddings, n_clusters, random_state)
+    method = method or config.CLUSTER_SELECTION
+    if method == "exhaustive":
+        return exhaustive_selection(embeddings, random_state=random_state)
+    if method == "fast":
+        return fast_selection(embeddings, random_state=random_state, **options)
+    raise ValueError(f"Unknown cluster selection method: {method!r}. Use 'fast' or 'exhaustive'.")
@@ -0,0 +1,260 @@
+"""
+Embedding backends: how sentence embeddings are computed on CPU.
+
+Every backend wraps a SentenceTransformer-compatible model behind the same
+`encode(texts)` the pipeline already calls, and adds dynamic batching: texts
+are sorted by token length so each batch holds texts of similar length (little
+padding), and a batch grows until it reaches `config.EMBEDDING_BATCH_TOKENS`
+padded tokens, so short sentences go through in large batches and long chunks
+in small ones. Vectors come back in input order.
+
+Backends (config.EMBEDDING_BACKEND):
+
+- "torch": the fp32 PyTorch model (the reference);
+- "torch-int8": the same model with its linear layers dynamically quantized to int8;
+- "onnx": the model's ONNX export run by ONNX Runtime;
+- "onnx-int8": its int8-quantized ONNX export (quantized locally, once, when the
+  model repository does not ship one).
+
+ONNX Runtime thread pools do not survive fork, so ONNX sessions are created in
+each process on first use; `warm_up()` in the master only downloads (and
+quantizes) the model files. Vectors are cached under a name that includes the
+backend (see `EmbeddingBackend.cache_name`), since quantized vectors differ slightly.
+More backends can be added with `register_backend`.
+"""
+import glob
+import os
+import threading
+
+import numpy as np
+
+from app import config
+
+
+class EmbeddingBackend:
+    """
+    A SentenceTransformer-compatible model behind length-bucketed dynamic batching.
+
+    Args:
+        model_name (str): Model repository or path.
+        load (callable): Zero-argument function returning the model (an object
+            with SentenceTransformer's `encode` and, ideally, `tokenizer`).
+        variant (str): Backend name, appended to `model_name` in `cache_name` (None for the fp32 reference).
+        per_process (bool): Load the model in each process on first use instead of now.
+        batch_tokens (int): Padded tokens per batch. Defaults to config.EMBEDDING_BATCH_TOKENS.
+        max_batch_size (int): Texts per batch at most. Defaults to config.EMBEDDING_MAX_BATCH_SIZE.
+    """
+
+    def __init__(self, model_name, load, variant=None, per_process=False, batch_tokens=None, max_batch_size=None):
+        self.model_name = model_name
+        self.variant = variant
+        self.batch_tokens = batch_tokens or config.EMBEDDING_BATCH_TOKENS
+        self.max_batch_size = max_batch_size or config.EMBEDDING_MAX_BATCH_SIZE
+        self._load = load
+        self._lock = threading.Lock()
+        self._model = None
+        self._pid = None
+        if not per_process:
+            self._model, self._pid = load(), None
+
+    @property
+    def cache_name(self):
+        """Name the embedding cache stores this backend's vectors under."""
+        return self.model_name if self.variant is None else f"{self.model_name}@{self.variant}"
+
+    @property
+    def model(self):
+        model = self._model
+        if model is not None and self._pid in (None, os.getpid()):
+            return model
+        with self._lock:
+            if self._model is None or self._pid not in (None, os.getpid()):
+                self._model, self._pid = self._load(), os.getpid()
+            return self._model
+
+    @property
+    def tokenizer(self):
+        return getattr(self.model, "tokenizer", None)
+
+    def token_lengths(self, texts):
+        """Tokens each text is encoded to (truncated at the model's limit); characters / 4 without a tokenizer."""
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return [len(text) // 4 + 2 for text in texts]
+        limit = getattr(self.model, "max_seq_length", None) or 512
+        encoded = tokenizer(texts, truncation=True, max_length=limit, return_attention_mask=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def batches(self, lengths):
+        """
+        Index batches over texts of the given token lengths, shortest texts first.
+
+        A batch is closed when one more text would take it over `batch_tokens`
+        padded tokens (its size times its longest text) or `max_batch_size` texts.
+        """
+        order = np.argsort(lengths, kind="stable")
+        batch, longest = [], 0
+        for index in order:
+            length = max(int(lengths[index]), 1)
+            full = len(batch) == self.max_batch_size or (len(batch) + 1) * max(longest, length) > self.batch_tokens
+            if batch and full:
+                yield batch
+                batch, longest = [], 0
+            batch.append(int(index))
+            longest = max(longest, length)
+        if batch:
+            yield batch
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        """
+        Embeds `texts` (SentenceTransformer's `encode` signature).
+
+        Returns:
+            np.ndarray: One float32 row per text, in input order.
+        """
+        if isinstance(texts, str):
+            return self.encode([texts], **kwargs)[0]
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        kwargs.pop("batch_size", None)
+        kwargs.pop("show_progress_bar", None)
+        model = self.model
+        embeddings = None
+        for batch in self.batches(self.token_lengths(texts)):
+            vectors = np.asarray(
+                model.encode([texts[i] for i in batch], batch_size=len(batch), convert_to_numpy=True,
+                             show_progress_bar=False, **kwargs),
+                dtype=np.float32,
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[batch] = vectors
+        return embeddings
+
+    def set_threads(self, threads):
+        """Intra-op threads for this process (torch backends; ONNX sessions read config at creation)."""
+        if threads > 0 and self.variant in (None, "torch-int8"):
+            import torch
+
+            torch.set_num_threads(threads)
+
+
+def _torch(model_name):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _torch_int8(model_name):
+    import torch
+
+    model = _torch(model_name)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_session_options():
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    if config.EMBEDDING_THREADS > 0:
+        options.intra_op_num_threads = config.EMBEDDING_THREADS
+        options.inter_op_num_threads = 1
+    return options
+
+
+def _onnx(model_name, file_name):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(
+        model_name, device="cpu", backend="onnx",
+        model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider",
+                      "session_options": _onnx_session_options()},
+    )
+
+
+def _has_file(model_name, file_name):
+    """Whether the model (a local directory or a Hugging Face Hub repository) contains `file_name`."""
+    if os.path.isdir(model_name):
+        return os.path.isfile(os.path.join(model_name, file_name))
+    from huggingface_hub import file_exists
+
+    return file_exists(model_name, file_name)
+
+
+def _quantized_onnx_files(model_name):
+    """
+    (path, file name) of an int8 ONNX export of the model: the one its repository
+    ships (config.EMBEDDING_ONNX_INT8_FILE), else one quantized locally into
+    config.EMBEDDING_ONNX_DIR on the first call.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if _has_file(model_name, config.EMBEDDING_ONNX_INT8_FILE):
+        return model_name, config.EMBEDDING_ONNX_INT8_FILE
+    directory = os.path.join(config.EMBEDDING_ONNX_DIR, model_name.replace("/", "--"))
+    found = sorted(glob.glob(os.path.join(directory, "onnx", "*qint8*.onnx")))
+    if not found:
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        model.save(directory)
+        export_dynamic_quantized_onnx_model(model, config.EMBEDDING_ONNX_QUANTIZATION, directory)
+        found = sorted(glob.glob(os.path.join(directory, "onnx", "*qint8*.onnx")))
+    return directory, os.path.relpath(found[0], directory)
+
+
+def _make_torch(model_name):
+    return EmbeddingBackend(model_name, lambda: _torch(model_name))
+
+
+def _make_torch_int8(model_name):
+    return EmbeddingBackend(model_name, lambda: _torch_int8(model_name), variant="torch-int8")
+
+
+def _make_onnx(model_name):
+    _onnx(model_name, config.EMBEDDING_ONNX_FILE)  # fails now, not in the workers, if there is no export
+    return EmbeddingBackend(
+        model_name, lambda: _onnx(model_name, config.EMBEDDING_ONNX_FILE), variant="onnx", per_process=True,
+    )
+
+
+def _make_onnx_int8(model_name):
+    path, file_name = _quantized_onnx_files(model_name)
+    return EmbeddingBackend(model_name, lambda: _onnx(path, file_name), variant="onnx-int8", per_process=True)
+
+
+_backends = {
+    "torch": _make_torch,
+    "torch-int8": _make_torch_int8,
+    "onnx": _make_onnx,
+    "onnx-int8": _make_onnx_int8,
+}
+
+
+def register_backend(name, factory):
+    """
+    Registers an embedding backend.
+
+    Args:
+        name (str): Value of config.EMBEDDING_BACKEND selecting it.
+        factory (callable): Function of a model name returning an EmbeddingBackend.
+    """
+    _backends[name] = factory
+
+
+def load_backend(model_name, backend=None):
+    """
+    Loads `model_name` with an embedding backend.
+
+    Args:
+        model_name (str): Model repository or path.
+        backend (str, optional): Backend name. Defaults to config.EMBEDDING_BACKEND.
+
+    Returns:
+        EmbeddingBackend
+    """
+    backend = backend or config.EMBEDDING_BACKEND
+    if backend not in _backends:
+        raise ValueError(f"Unknown embedding backend: {backend!r}. Use one of: {', '.join(sorted(_backends))}.")
+    return _backends[backend](model_name)
@@ -0,0 +1,342 @@
+"""
+Persistent, content-addressed cache for sentence and chunk embeddings.
+
+Entries are keyed by (model name, hash of the whitespace-normalized text).
+Vectors live in one memory-mapped float32 file per model, with a fixed number
+of slots; a small SQLite index maps each key to its slot and tracks when it
+was last used, so the least recently used entries are evicted once a model's
+slots are full.
+
+Every operation runs inside a `BEGIN IMMEDIATE` transaction, which serializes
+access across threads and forked workers sharing the same cache directory.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from app import config
+
+_WHITESPACE = re.compile(r"\s+")
+# SQLite caps the number of bound parameters per statement.
+_SQL_BATCH = 500
+# A row pending for longer was left by a writer that died before writing its vector.
+_PENDING_TIMEOUT_NS = 60 * 1_000_000_000
+
+
+def normalize_text(text):
+    """Canonical form of a text for cache keys: NFC, collapsed whitespace, stripped."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text):
+    """16-byte content hash of the normalized text."""
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache with LRU eviction and hit/miss counters.
+
+    Args:
+        directory (str): Where the index and vector files are stored.
+        max_entries (int): Number of vectors kept per model before evicting.
+    """
+
+    def __init__(self, directory, max_entries=200_000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._vectors = {}
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                capacity INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                model TEXT NOT NULL,
+                key BLOB NOT NULL,
+                slot INTEGER NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, last_used);
+            """
+        )
+
+    def encode(self, model, model_name, texts, **encode_kwargs):
+        """
+        Embeds `texts`, calling `model.encode` only for texts not already cached.
+
+        Args:
+            model: Object with a SentenceTransformer-compatible `encode` method.
+            model_name (str): Name the vectors are cached under.
+            texts (list): Texts to embed.
+            **encode_kwargs: Extra arguments passed to `model.encode`.
+
+        Returns:
+            np.ndarray: One float32 row per input text, in input order.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [text_key(text) for text in texts]
+        found = self.get_many(model_name, keys)
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                missing.setdefault(key, i)
+
+        if missing:
+            new_vectors = np.asarray(
+                model.encode([texts[i] for i in missing.values()], convert_to_numpy=True, **encode_kwargs),
+                dtype=np.float32,
+            )
+            self.put_many(model_name, list(missing), new_vectors)
+            found.update(zip(missing, new_vectors))
+
+        return np.stack([found[key] for key in keys])
+
+    def get_many(self, model_name, keys):
+        """
+        Looks up keys and marks the hits as recently used.
+
+        Returns:
+            dict: Mapping of key to vector for every key found in the cache.
+        """
+        unique = list(dict.fromkeys(keys))
+        with self._transaction():
+            dim_capacity = self._model_shape(model_name)
+            rows = []
+            if dim_capacity is not None:
+                for start in range(0, len(unique), _SQL_BATCH):
+                    batch = unique[start:start + _SQL_BATCH]
+                    rows += self._db.execute(
+                        f"SELECT key, slot FROM entries WHERE model = ? AND last_used >= 0 "
+                        f"AND key IN ({','.join('?' * len(batch))})",
+                        [model_name, *batch],
+                    ).fetchall()
+            if rows:
+                now = time.time_ns()
+                self._db.executemany(
+                    "UPDATE entries SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model_name, key) for key, _ in rows],
+                )
+                vectors = self._open_vectors(model_name, *dim_capacity)
+                slots = np.fromiter((slot for _, slot in rows), dtype=np.int64, count=len(rows))
+                found = dict(zip((key for key, _ in rows), np.array(vectors[slots])))
+            else:
+                found = {}
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, model_name, keys, vectors):
+        """
+        Stores vectors under their keys, evicting least recently used entries if needed.
+
+        A slot still holding a committed entry (an evicted one, or the old vector of
+        a key being replaced) is only overwritten once the new index rows have
+        committed: until its vector is written, its row stays pending (`last_used`
+        of minus the time it was claimed) and invisible to `get_many`. A rolled-back
+        call so never leaves a committed entry pointing at another key's vector.
+
+        Pending rows of other writers are never evicted nor replaced (their keys
+        are skipped here), unless older than `_PENDING_TIMEOUT_NS`, i.e. left by a
+        writer that died. When too few slots can be freed, the last keys that
+        fit are stored and the others are not cached.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not keys:
+            return
+        # The last vector of a key given several times wins.
+        positions = list({key: position for position, key in enumerate(keys)}.values())
+        keys, vectors = [keys[position] for position in positions], vectors[positions]
+        with self._transaction():
+            dim_capacity = self._model_shape(model_name)
+            if dim_capacity is None:
+                dim_capacity = (vectors.shape[1], self.max_entries)
+                self._db.execute("INSERT INTO models VALUES (?, ?, ?)", (model_name, *dim_capacity))
+            dim, capacity = dim_capacity
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Cached vectors for {model_name!r} have dimension {dim}, got {vectors.shape[1]}")
+
+            now = time.time_ns()
+            stale = -(now - _PENDING_TIMEOUT_NS)
+            existing = []
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                existing += self._db.execute(
+                    f"SELECT key, slot, last_used FROM entries WHERE model = ? "
+                    f"AND key IN ({','.join('?' * len(batch))})",
+                    [model_name, *batch],
+                ).fetchall()
+            # Keys another writer is storing right now: left to it.
+            busy = {key for key, _, last_used in existing if last_used <= stale}
+            replaced = {slot for key, slot, _ in existing if key not in busy}
+            kept = [position for position, key in enumerate(keys) if key not in busy][-capacity:]
+            keys, vectors = [keys[position] for position in kept], vectors[kept]
+            if not keys:
+                return
+            self._db.executemany(
+                "DELETE FROM entries WHERE model = ? AND key = ?", [(model_name, key) for key in keys]
+            )
+            slots, evicted = self._allocate_slots(model_name, capacity, len(keys), stale)
+            if len(slots) < len(keys):
+                keys, vectors = keys[len(keys) - len(slots):], vectors[len(keys) - len(slots):]
+            if not keys:
+                return
+            reused = replaced | set(evicted)
+
+            store = self._open_vectors(model_name, dim, capacity)
+            free = [position for position, slot in enumerate(slots) if slot not in reused]
+            store[np.asarray([slots[position] for position in free], dtype=np.int64)] = vectors[free]
+            self._db.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                [(model_name, key, slot, -now if slot in reused else now) for key, slot in zip(keys, slots)],
+            )
+
+        pending = [position for position, slot in enumerate(slots) if slot in reused]
+        if not pending:
+            return
+        store[np.asarray([slots[position] for position in pending], dtype=np.int64)] = vectors[pending]
+        with self._transaction():
+            # Only rows still claimed by this call (same slot and claim time) become visible.
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE model = ? AND key = ? AND slot = ? AND last_used = ?",
+                [(time.time_ns(), model_name, keys[position], slots[position], -now) for position in pending],
+            )
+
+    def stats(self):
+        """Hit/miss counters of this process plus the number of stored entries per model."""
+        with self._transaction():
+            entries = dict(self._db.execute("SELECT model, COUNT(*) FROM entries GROUP BY model"))
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+    def clear(self):
+        """Removes every entry (the vector files are kept and overwritten)."""
+        with self._transaction():
+            self._db.execute("DELETE FROM entries")
+
+    def close(self):
+        with self._lock:
+            for vectors in self._vectors.values():
+                vectors.flush()
+            self._vectors.clear()
+            self._db.close()
+
+    def _transaction(self):
+        return _Transaction(self._db, self._lock)
+
+    def _model_shape(self, model_name):
+        return self._db.execute("SELECT dim, capacity FROM models WHERE model = ?", (model_name,)).fetchone()
+
+    def _allocate_slots(self, model_name, capacity, count, stale):
+        # Fill never-used slots at the end of the file first, then gaps left by deletions,
+        # and only then evict the least recently used entries. Pending rows are never
+        # evicted unless stale (claimed before -stale), so fewer than `count` slots may come back.
+        used, top = self._db.execute(
+            "SELECT COUNT(*), COALESCE(MAX(slot) + 1, 0) FROM entries WHERE model = ?", (model_name,)
+        ).fetchone()
+        free = list(range(top, min(capacity, top + count)))
+        if len(free) < count and used + len(free) < capacity:
+            taken = {slot for (slot,) in self._db.execute("SELECT slot FROM entries WHERE model = ?", (model_name,))}
+            for slot in range(top):
+                if slot not in taken:
+                    free.append(slot)
+                    if len(free) == count:
+                        break
+        if len(free) == count:
+            return free, []
+
+        evicted = self._db.execute(
+            "SELECT key, slot FROM entries WHERE model = ? AND last_used > ? ORDER BY last_used LIMIT ?",
+            (model_name, stale, count - len(free)),
+        ).fetchall()
+        self._db.executemany(
+            "DELETE FROM entries WHERE model = ? AND key = ?", [(model_name, key) for key, _ in evicted]
+        )
+        self.evictions += len(evicted)
+        evicted = [slot for _, slot in evicted]
+        return free + evicted, evicted
+
+    def _open_vectors(self, model_name, dim, capacity):
+        vectors = self._vectors.get(model_name)
+        if vectors is None:
+            slug = hashlib.blake2b(model_name.encode("utf-8"), digest_size=8).hexdigest()
+            path = os.path.join(self.directory, f"{slug}-{dim}.f32")
+            mode = "r+" if os.path.exists(path) else "w+"
+            vectors = np.memmap(path, dtype=np.float32, mode=mode, shape=(capacity, dim))
+            self._vectors[model_name] = vectors
+        return vectors
+
+
+class _Transaction:
+    """Holds the in-process lock and an immediate SQLite transaction."""
+
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._db.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._lock.release()
+            raise
+        return self._db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Returns the process-wide cache configured in app.config, or None when disabled.
+
+    A forked worker opens its own connection instead of reusing the parent's.
+    """
+    global _cache, _cache_pid
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = EmbeddingCache(config.EMBEDDING_CACHE_DIR, config.EMBEDDING_CACHE_MAX_ENTRIES)
+            _cache_pid = os.getpid()
+        return _cache
@@ -0,0 +1,162 @@
+"""
+Local extractive summarization: no LLM call, CPU only, in-process.
+
+The summary is made of the document's own sentences:
+
+- every sentence is scored by its centrality over the sentence embeddings the
+  pipeline already computes: LexRank (PageRank over the cosine-similarity
+  graph) up to `GRAPH_MAX_SENTENCES` sentences, the cosine similarity to the
+  document centroid beyond (the graph is quadratic in the sentence count);
+- sentences are picked greedily by Maximal Marginal Relevance, trading their
+  centrality against their similarity to the sentences already picked, until
+  the word target is reached;
+- the picked sentences are written back in document order, as one paragraph
+  or as bullet points.
+"""
+import numpy as np
+
+from app import config
+
+# Above this many sentences, the centroid score replaces the similarity graph.
+GRAPH_MAX_SENTENCES = 3000
+# Damping factor and convergence tolerance of the LexRank power iteration.
+DAMPING = 0.85
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 100
+# Sentences shorter than this (headings, page numbers, list stubs) are only picked as a last resort.
+MIN_SENTENCE_WORDS = 5
+# A candidate this similar to a picked sentence is a near-duplicate and is never picked.
+DUPLICATE_SIMILARITY = 0.95
+# The summary may overshoot the word target by this fraction to fit a sentence.
+LENGTH_TOLERANCE = 0.1
+
+
+def _unit(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def lexrank_scores(unit):
+    """
+    LexRank centrality of unit-normalized sentence embeddings.
+
+    The graph is continuous: each edge is weighted by the (non-negative)
+    cosine similarity of its two sentences, so no threshold has to be tuned
+    per embedding model.
+    """
+    n = len(unit)
+    weights = np.maximum(unit @ unit.T, 0.0)
+    np.fill_diagonal(weights, 0.0)
+    degrees = weights.sum(axis=1, keepdims=True)
+    # A sentence similar to nothing links to every sentence, as in PageRank.
+    transition = np.where(degrees > 0, weights / np.maximum(degrees, 1e-12), 1.0 / n).astype(np.float32)
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(MAX_ITERATIONS):
+        updated = (1 - DAMPING) / n + DAMPING * (transition.T @ scores)
+        converged = np.abs(updated - scores).sum() < TOLERANCE
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def centroid_scores(unit):
+    """Cosine similarity of each unit-normalized sentence embedding to the document centroid."""
+    centroid = unit.mean(axis=0)
+    return unit @ (centroid / max(float(np.linalg.norm(centroid)), 1e-12))
+
+
+def score_sentences(unit, method=None):
+    """
+    Centrality of each sentence.
+
+    Args:
+        unit (np.ndarray): Unit-normalized sentence embeddings, in document order.
+        method (str, optional): "lexrank", "centroid", or "auto" (LexRank up to
+            GRAPH_MAX_SENTENCES sentences). Defaults to config.EXTRACTIVE_METHOD.
+
+    Returns:
+        np.ndarray: One score per sentence, scaled to [0, 1].
+    """
+    method = method or config.EXTRACTIVE_METHOD
+    if method == "auto":
+        method = "lexrank" if len(unit) <= GRAPH_MAX_SENTENCES else "centroid"
+    if method == "lexrank":
+        scores = lexrank_scores(unit)
+    elif method == "centroid":
+        scores = centroid_scores(unit)
+    else:
+        raise ValueError(f"Unknown extractive method: {method!r}. Use 'auto', 'lexrank' or 'centroid'.")
+    low, high = float(scores.min()), float(scores.max())
+    return (scores - low) / (high - low) if high > low else np.ones_like(scores)
+
+
+def select_sentences(sentences, unit, scores, word_target, diversity=None):
+    """
+    Picks sentences by Maximal Marginal Relevance until `word_target` words.
+
+    Args:
+        sentences (list): The sentences, in document order.
+        unit (np.ndarray): Their unit-normalized embeddings.
+        scores (np.ndarray): Their centrality, in [0, 1].
+        word_target (int): Words wanted in the summary.
+        diversity (float, optional): Weight of centrality against redundancy with
+            the picked sentences (1 ignores redundancy). Defaults to config.EXTRACTIVE_DIVERSITY.
+
+    Returns:
+        list: Indices of the picked sentences, in document order.
+    """
+    diversity = config.EXTRACTIVE_DIVERSITY if diversity is None else diversity
+    lengths = np.array([len(sentence.split()) for sentence in sentences])
+    limit = word_target * (1 + LENGTH_TOLERANCE)
+    available = lengths > 0
+    # Short fragments only compete once the real sentences are used up.
+    relevance = scores - (lengths < MIN_SENTENCE_WORDS)
+    redundancy = np.zeros(len(sentences), dtype=np.float32)
+    picked = []
+    words = 0
+
+    while words < word_target and available.any():
+        marginal = diversity * relevance - (1 - diversity) * redundancy
+        marginal[~available] = -np.inf
+        best = int(np.argmax(marginal))
+        available[best] = False
+        if redundancy[best] >= DUPLICATE_SIMILARITY or (picked and words + lengths[best] > limit):
+            continue
+        picked.append(best)
+        words += int(lengths[best])
+        np.maximum(redundancy, unit @ unit[best], out=redundancy)
+
+    return sorted(picked)
+
+
+def format_summary(sentences, summary_format="paragraph"):
+    """Joins sentences as one paragraph, or as bullet points for "bullet points"."""
+    sentences = [" ".join(sentence.split()) for sentence in sentences]
+    if summary_format == "bullet points":
+        return "\n".join(f"- {sentence}" for sentence in sentences)
+    return " ".join(sentences)
+
+
+def summarize(sentences, embeddings, word_target, summary_format="paragraph", method=None, diversity=None):
+    """
+    Extractive summary of a document from its sentences and their embeddings.
+
+    Args:
+        sentences (list): The document's sentences, in order.
+        embeddings (np.ndarray): One embedding per sentence.
+        word_target (int): Approximate length of the summary in words
+            (see `summary_generator.adjust_summary_length`).
+        summary_format (str): "paragraph" or "bullet points".
+        method, diversity: See `score_sentences` and `select_sentences`.
+
+    Returns:
+        str: The summary (empty for a document without sentences).
+    """
+    if not sentences:
+        return ""
+    unit = _unit(embeddings)
+    scores = score_sentences(unit, method)
+    picked = select_sentences(sentences, unit, scores, word_target, diversity)
+    return format_summary([sentences[index] for index in picked], summary_format)
@@ -0,0 +1,275 @@
+"""
+Streaming document ingestion for TXT, PDF and DOCX files.
+
+`iter_segments` yields a document piece by piece (PDF pages, DOCX paragraphs,
+blocks of TXT lines) with the offset of each piece in the full text, so callers
+can chunk, index or summarize a range without materializing the whole file.
+`read_text` joins the segments only when the full text is actually needed.
+
+PDF pages are extracted with PyMuPDF (`fitz`), in parallel on a process pool
+for large files, keeping only a bounded number of page batches in flight.
+pypdf is used when PyMuPDF is not installed.
+"""
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+
+from app import config
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+TXT_BLOCK_CHARS = 64 * 1024
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+@dataclass
+class Segment:
+    """
+    One piece of a document.
+
+    Attributes:
+        text (str): Text of the piece.
+        index (int): Page number (PDF), paragraph number (DOCX) or block number (TXT), from 0.
+        offset (int): Character offset of `text` in `read_text(file_path)`.
+        style (str): DOCX paragraph style id (e.g. "Heading1"), None elsewhere.
+    """
+    text: str
+    index: int
+    offset: int = 0
+    style: str = None
+
+
+def iter_segments(file_path, start=0, stop=None, workers=None):
+    """
+    Yields the segments of a document in order.
+
+    Args:
+        file_path (str): Path to a TXT, PDF or DOCX file.
+        start (int): First segment to yield (page for PDF, paragraph for DOCX, block for TXT).
+        stop (int, optional): Segment to stop before. Defaults to the end of the document.
+        workers (int, optional): Processes for PDF extraction. Defaults to config.INGEST_WORKERS.
+
+    Offsets count from the first yielded segment, as if the range were the whole document.
+    """
+    lower = file_path.lower()
+    if lower.endswith(".txt"):
+        pieces = _iter_txt(file_path)
+    elif lower.endswith(".pdf"):
+        pieces = _iter_pdf(file_path, start, stop, workers)
+        start, stop = 0, None  # the PDF backend already restricted the page range
+    elif lower.endswith(".docx"):
+        pieces = _iter_docx(file_path, start, stop)
+    else:
+        raise ValueError("Unsupported file format. Use TXT, PDF, or DOCX.")
+
+    offset = 0
+    for segment in pieces:
+        if segment.index < start:
+            continue
+        if stop is not None and segment.index >= stop:
+            break
+        segment.offset = offset
+        offset += len(segment.text) + 1
+        yield segment
+
+
+def iter_text(file_path, start=0, stop=None):
+    """Yields only the text of each segment (e.g. to feed `chunker.iter_semantic_chunks`)."""
+    for segment in iter_segments(file_path, start, stop):
+        yield segment.text
+
+
+def read_text(file_path, start=0, stop=None):
+    """Returns the text of a document (or of a segment range), segments joined by newlines."""
+    return "\n".join(iter_text(file_path, start, stop))
+
+
+def count_segments(file_path):
+    """Number of pages of a PDF, or of body paragraphs / text blocks otherwise."""
+    if file_path.lower().endswith(".pdf"):
+        return _pdf_page_count(file_path)
+    return sum(1 for _ in iter_segments(file_path))
+
+
+# TXT
+
+def _iter_txt(file_path):
+    with open(file_path, "r", encoding="utf-8") as file:
+        block, size, index = [], 0, 0
+        for line in file:
+            block.append(line)
+            size += len(line)
+            if size >= TXT_BLOCK_CHARS:
+                yield Segment(text=_strip_newline("".join(block)), index=index)
+                block, size, index = [], 0, index + 1
+        if block:
+            yield Segment(text=_strip_newline("".join(block)), index=index)
+
+
+def _strip_newline(text):
+    return text[:-1] if text.endswith("\n") else text
+
+
+# DOCX
+
+def _iter_docx(file_path, start=0, stop=None):
+    """
+    Streams body paragraphs out of word/document.xml without building the python-docx object model.
+
+    Paragraphs before `start` are only counted, and parsing ends at `stop`.
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml:
+        stack = []
+        index = 0
+        for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+            if event == "start":
+                stack.append(element.tag)
+                continue
+            stack.pop()
+            if element.tag == f"{_W}p" and stack and stack[-1] == f"{_W}body":
+                if stop is not None and index >= stop:
+                    return
+                if index >= start:
+                    yield Segment(text=_paragraph_text(element), index=index, style=_paragraph_style(element))
+                index += 1
+            if stack and stack[-1] == f"{_W}body":
+                element.clear()  # keep memory flat: drop every finished top-level block
+
+
+def _paragraph_text(paragraph):
+    parts = []
+    for element in paragraph.iter():
+        if element.tag == f"{_W}t":
+            parts.append(element.text or "")
+        elif element.tag == f"{_W}tab":
+            parts.append("\t")
+        elif element.tag in (f"{_W}br", f"{_W}cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _paragraph_style(paragraph):
+    style = paragraph.find(f"{_W}pPr/{_W}pStyle")
+    return style.get(f"{_W}val") if style is not None else None
+
+
+# PDF
+
+def _import_pymupdf():
+    """PyMuPDF under its current name, or its legacy `fitz` alias; None if not installed."""
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf
+        except ImportError:
+            return None
+    return pymupdf
+
+
+def _pdf_page_count(file_path):
+    fitz = _import_pymupdf()
+    if fitz is None:
+        import pypdf
+
+        return len(pypdf.PdfReader(file_path).pages)
+    with fitz.open(file_path) as document:
+        return document.page_count
+
+
+def _extract_pdf_pages(file_path, start, stop):
+    """Worker task: text of pages [start, stop) as (page number, text) pairs."""
+    fitz = _import_pymupdf()
+    if fitz is None:
+        import pypdf
+
+        reader = pypdf.PdfReader(file_path)
+        return [(number, reader.pages[number].extract_text() or "") for number in range(start, stop)]
+    with fitz.open(file_path) as document:
+        return [(number, document.load_page(number).get_text("text")) for number in range(start, stop)]
+
+
+def _iter_pdf(file_path, start, stop, workers):
+    page_count = _pdf_page_count(file_path)
+    stop = page_count if stop is None else min(stop, page_count)
+    start = max(0, start)
+    batch = config.INGEST_PAGES_PER_TASK
+    ranges = [(first, min(first + batch, stop)) for first in range(start, stop, batch)]
+    workers = config.INGEST_WORKERS if workers is None else workers
+
+    if workers <= 1 or stop - start < config.INGEST_PARALLEL_MIN_PAGES:
+        for first, last in ranges:
+            for number, text in _extract_pdf_pages(file_path, first, last):
+                yield Segment(text=text, index=number)
+        return
+
+    # Sliding window of in-flight batches: pages come back in order and at most
+    # 2 * workers batches are held in memory, however fast the consumer is.
+    pool = _get_pool(workers)
+    pending = deque()
+    ranges = iter(ranges)
+    try:
+        for first, last in ranges:
+            pending.append(pool.submit(_extract_pdf_pages, file_path, first, last))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.submit(_extract_pdf_pages, file_path, *next_range))
+            for number, text in pages:
+                yield Segment(text=text, index=number)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+_pool = None
+_pool_pid = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def map_pdf_pages(task, file_path, workers=None):
+    """
+    Runs `task(file_path, start, stop)` (a picklable, module-level function) over
+    batches of the PDF's pages, on the extraction pool for large files.
+
+    Returns:
+        list: The task's results, in page order.
+    """
+    page_count = _pdf_page_count(file_path)
+    batch = config.INGEST_PAGES_PER_TASK
+    ranges = [(first, min(first + batch, page_count)) for first in range(0, page_count, batch)]
+    workers = config.INGEST_WORKERS if workers is None else workers
+    if workers <= 1 or page_count < config.INGEST_PARALLEL_MIN_PAGES:
+        return [task(file_path, first, last) for first, last in ranges]
+    pool = _get_pool(workers)
+    return [future.result() for future in [pool.submit(task, file_path, first, last) for first, last in ranges]]
+
+
+def _get_pool(workers):
+    """Process pool shared by all PDF reads of this process (spawned, so safe after threads exist)."""
+    global _pool, _pool_pid, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid() or _pool_workers < workers:
+            if _pool is not None and _pool_pid == os.getpid():
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _pool_pid, _pool_workers = os.getpid(), workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stops the PDF extraction pool (e.g. on application shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
@@ -0,0 +1,448 @@
+"""
+Per-stage instrumentation of the summarization pipeline.
+
+Every stage ("read", "split", "embed", "cluster", "select", "prompt", "llm",
+...) runs inside `stage(name)`, which measures:
+
+- wall time and CPU time: the CPU time of the calling thread, so that concurrent
+  requests don't inflate each other's spans, except for the stages in
+  `PROCESS_CPU_STAGES`, whose work also runs on torch / OpenMP intra-op threads
+  and which report the CPU time of the whole process (concurrent jobs included);
+- memory: by default the net growth of the process's resident memory over the
+  stage (current RSS at its end minus at its start, 0 if it shrank), which is
+  cheap but is not a peak, and counts concurrent jobs' allocations. The actual
+  peak of the Python and numpy allocations made during the stage needs
+  config.METRICS_TRACEMALLOC (precise, but slows allocation-heavy code down;
+  meant for benchmarks and profiling: see benchmarks/bench_pipeline.py --tracemalloc);
+- counters set by the stage itself: items processed, tokens, ...
+
+Each measurement (a `Span`) goes to:
+
+- the current `Trace`, if any (`with trace() as t:` around a call, or
+  `use_trace(t)` to continue one in another thread), for per-request reports;
+- the process-wide `Metrics`, exported as a dict (`snapshot()`) or in the
+  Prometheus text format (`prometheus_text()`, served at GET /metrics);
+- the registered hooks (`add_hook`): context managers entered around every
+  stage, e.g. `StageProfiler`, which runs chosen stages under cProfile
+  (enabled at startup by DOCAI_PROFILE_STAGES).
+
+With config.METRICS_ENABLED off, `stage()` returns a shared no-op span.
+"""
+import contextvars
+import cProfile
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+
+from app import config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Upper bounds (seconds) of the stage duration histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Stages that fan out to intra-op thread pools: their CPU time is the whole process's.
+PROCESS_CPU_STAGES = frozenset({"embed", "cluster"})
+
+_PAGE_MB = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024 if hasattr(os, "sysconf") else 0.0
+_statm = (None, None)  # (pid, descriptor of /proc/self/statm), reopened after a fork
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return 0.0
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rss_mb():
+    """Current resident memory of the process in MB (the peak RSS where /proc is unavailable)."""
+    global _statm
+    pid, descriptor = _statm
+    try:
+        if pid != os.getpid():
+            descriptor = os.open("/proc/self/statm", os.O_RDONLY)
+            _statm = (os.getpid(), descriptor)
+        return int(os.pread(descriptor, 128, 0).split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _peak_rss_mb()
+
+
+@dataclass
+class Span:
+    """
+    One run of a stage.
+
+    Attributes:
+        name (str): Stage name.
+        wall (float): Seconds elapsed.
+        cpu (float): CPU seconds used by the calling thread (by the process for `PROCESS_CPU_STAGES`).
+        peak_mb (float): Memory growth during the stage, in MB: the net RSS growth, or the
+            allocation peak with tracemalloc (see the module docstring).
+        counts (dict): Counters set by the stage (items, tokens, ...).
+    """
+    name: str
+    wall: float = 0.0
+    cpu: float = 0.0
+    peak_mb: float = 0.0
+    counts: dict = field(default_factory=dict)
+    _parent: object = field(default=None, repr=False)
+    _traced_peak: int = field(default=0, repr=False)
+
+    def __bool__(self):
+        return True
+
+    def count(self, **counts):
+        """Adds to the span's counters, e.g. `span.count(items=len(texts), tokens=n)`."""
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+        return self
+
+
+class _NullSpan:
+    """Stand-in span when instrumentation is off. Falsy, so `if span:` skips costly counts."""
+    name = None
+
+    def __bool__(self):
+        return False
+
+    def count(self, **counts):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """The spans of one request (or benchmark run), in the order they finished."""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.spans = []
+        self.started = time.perf_counter()
+        self.wall = None
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.wall = time.perf_counter() - self.started
+
+    def stages(self):
+        """
+        Totals per stage, in order of first appearance.
+
+        Returns:
+            dict: Stage name -> {"calls", "wall", "cpu", "peak_mb", and its counters}.
+        """
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            total = totals.setdefault(span.name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_mb": 0.0})
+            total["calls"] += 1
+            total["wall"] += span.wall
+            total["cpu"] += span.cpu
+            total["peak_mb"] = max(total["peak_mb"], span.peak_mb)
+            for name, value in span.counts.items():
+                total[name] = total.get(name, 0) + value
+        return totals
+
+    def report(self):
+        """JSON-friendly summary: total wall time and the rounded per-stage totals."""
+        stages = {
+            name: {key: round(value, 4) if isinstance(value, float) else value for key, value in total.items()}
+            for name, total in self.stages().items()
+        }
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.started
+        return {"wall": round(wall, 4), "stages": stages}
+
+
+class Metrics:
+    """Process-wide aggregates of every span, per stage."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            stats = self._stages.get(span.name)
+            if stats is None:
+                stats = self._stages[span.name] = {
+                    "calls": 0, "wall": 0.0, "cpu": 0.0, "peak_mb": 0.0, "counts": {},
+                    "buckets": [0] * len(BUCKETS),
+                }
+            stats["calls"] += 1
+            stats["wall"] += span.wall
+            stats["cpu"] += span.cpu
+            stats["peak_mb"] = max(stats["peak_mb"], span.peak_mb)
+            for name, value in span.counts.items():
+                stats["counts"][name] = stats["counts"].get(name, 0) + value
+            for index, bound in enumerate(BUCKETS):
+                if span.wall <= bound:
+                    stats["buckets"][index] += 1
+                    break
+
+    def snapshot(self):
+        """Stage name -> {"calls", "wall", "cpu", "peak_mb", "counts"} (copies)."""
+        with self._lock:
+            return {
+                name: {"calls": stats["calls"], "wall": stats["wall"], "cpu": stats["cpu"],
+                       "peak_mb": stats["peak_mb"], "counts": dict(stats["counts"])}
+                for name, stats in self._stages.items()
+            }
+
+    def prometheus_text(self, prefix="docai_stage"):
+        """The aggregates in the Prometheus text exposition format."""
+        with self._lock:
+            stages = {name: dict(stats, counts=dict(stats["counts"]), buckets=list(stats["buckets"]))
+                      for name, stats in self._stages.items()}
+        lines = [
+            f"# HELP {prefix}_seconds Wall time of the pipeline stages.",
+            f"# TYPE {prefix}_seconds histogram",
+        ]
+        for name, stats in stages.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats["buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_seconds_bucket{{stage="{name}",le="+Inf"}} {stats["calls"]}')
+            lines.append(f'{prefix}_seconds_sum{{stage="{name}"}} {stats["wall"]:.6f}')
+            lines.append(f'{prefix}_seconds_count{{stage="{name}"}} {stats["calls"]}')
+        lines += [f"# HELP {prefix}_cpu_seconds_total CPU time of the stages (thread, or process for fan-out stages).",
+                  f"# TYPE {prefix}_cpu_seconds_total counter"]
+        lines += [f'{prefix}_cpu_seconds_total{{stage="{name}"}} {stats["cpu"]:.6f}' for name, stats in stages.items()]
+        lines += [f"# HELP {prefix}_peak_memory_mb Largest memory growth of one run of the stage (net RSS, or tracemalloc peak).",
+                  f"# TYPE {prefix}_peak_memory_mb gauge"]
+        lines += [f'{prefix}_peak_memory_mb{{stage="{name}"}} {stats["peak_mb"]:.3f}' for name, stats in stages.items()]
+        counters = sorted({counter for stats in stages.values() for counter in stats["counts"]})
+        for counter in counters:
+            lines += [f"# HELP {prefix}_{counter}_total Stage counter: {counter}.",
+                      f"# TYPE {prefix}_{counter}_total counter"]
+            lines += [f'{prefix}_{counter}_total{{stage="{name}"}} {stats["counts"][counter]}'
+                      for name, stats in stages.items() if counter in stats["counts"]]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+_metrics = Metrics()
+_current_trace = contextvars.ContextVar("docai_trace", default=None)
+_current_span = contextvars.ContextVar("docai_span", default=None)
+_hooks = []
+
+
+def get_metrics():
+    """Returns the process-wide Metrics."""
+    return _metrics
+
+
+def add_hook(hook):
+    """
+    Registers a hook: a callable taking the Span about to run and returning a
+    context manager entered around the stage (its counters and timings are
+    only complete once the context exits).
+    """
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+@contextmanager
+def trace(name=None):
+    """Collects the spans of the calls made inside the block into a new Trace (yielded)."""
+    collected = Trace(name)
+    token = _current_trace.set(collected)
+    try:
+        yield collected
+    finally:
+        _current_trace.reset(token)
+        collected.finish()
+
+
+@contextmanager
+def use_trace(collected):
+    """Adds the spans of the block to an existing Trace (e.g. in a worker thread); no-op for None."""
+    if collected is None:
+        yield collected
+        return
+    token = _current_trace.set(collected)
+    try:
+        yield collected
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def _traced_memory_start(span):
+    _, peak = tracemalloc.get_traced_memory()
+    if span._parent is not None:
+        # The parent's peak so far, before the counter is reset for this span.
+        span._parent._traced_peak = max(span._parent._traced_peak, peak)
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+@contextmanager
+def _measure(name, counts):
+    span = Span(name, counts=dict(counts), _parent=_current_span.get())
+    span_token = _current_span.set(span)
+    traced = config.METRICS_TRACEMALLOC and tracemalloc.is_tracing()
+    traced_start = _traced_memory_start(span) if traced else 0
+    rss_start = _rss_mb()
+    cpu_clock = time.process_time if name in PROCESS_CPU_STAGES else time.thread_time
+    cpu_start = cpu_clock()
+    wall_start = time.perf_counter()
+    try:
+        if _hooks:
+            with ExitStack() as hooks:
+                for hook in list(_hooks):
+                    hooks.enter_context(hook(span))
+                yield span
+        else:
+            yield span
+    finally:
+        span.wall = time.perf_counter() - wall_start
+        span.cpu = cpu_clock() - cpu_start
+        if traced:
+            _, peak = tracemalloc.get_traced_memory()
+            span._traced_peak = max(span._traced_peak, peak)
+            span.peak_mb = max(0, span._traced_peak - traced_start) / 1024 / 1024
+            if span._parent is not None:
+                span._parent._traced_peak = max(span._parent._traced_peak, span._traced_peak)
+        else:
+            span.peak_mb = max(0.0, _rss_mb() - rss_start)
+        _current_span.reset(span_token)
+        span._parent = None
+        _metrics.record(span)
+        collected = _current_trace.get()
+        if collected is not None:
+            collected.add(span)
+
+
+def stage(name, **counts):
+    """
+    Context manager measuring one run of a pipeline stage; yields its Span.
+
+        with instrumentation.stage("embed", items=len(texts)) as span:
+            embeddings = model.encode(texts)
+            if span:
+                span.count(tokens=count_tokens(texts))
+
+    The span is falsy when instrumentation is off, so that costly counts can be skipped.
+    """
+    if not config.METRICS_ENABLED:
+        return _NULL_SPAN
+    return _measure(name, counts)
+
+
+def timed(name, iterable, count=None):
+    """
+    Yields the items of `iterable`, timing the production of each one as a run of
+    stage `name` (`count(item)` gives the item's "items" counter).
+
+    Meant for coarse iterators (e.g. windows of sentences): every item is a span.
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name) as span:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            if span and count is not None:
+                span.count(items=count(item))
+        yield item
+
+
+class StageProfiler:
+    """
+    Hook running stages under cProfile.
+
+    Args:
+        stages (iterable, optional): Stage names to profile; None for every stage.
+        directory (str, optional): Where to dump one `<stage>-<pid>-<n>.prof` file per run
+            (read them with pstats or snakeviz). Without it, the profiles are only merged
+            in memory (see `stats`).
+
+    Only the thread running the stage is profiled, and a stage nested in a
+    profiled one is part of the outer profile.
+    """
+
+    def __init__(self, stages=None, directory=None):
+        self.stages = set(stages) if stages else None
+        self.directory = directory
+        self._stats = {}
+        self._runs = 0
+        self._lock = threading.Lock()
+        self._active = threading.local()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def __call__(self, span):
+        if (self.stages is not None and span.name not in self.stages) or getattr(self._active, "on", False):
+            yield
+            return
+        profiler = cProfile.Profile()
+        self._active.on = True
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._active.on = False
+            with self._lock:
+                self._runs += 1
+                run = self._runs
+                if span.name in self._stats:
+                    self._stats[span.name].add(profiler)
+                else:
+                    self._stats[span.name] = pstats.Stats(profiler)
+            if self.directory:
+                profiler.dump_stats(os.path.join(self.directory, f"{span.name}-{os.getpid()}-{run}.prof"))
+
+    def profiled(self):
+        """Names of the stages profiled so far."""
+        with self._lock:
+            return list(self._stats)
+
+    def stats(self, name):
+        """The merged pstats.Stats of every profiled run of stage `name`, or None."""
+        with self._lock:
+            return self._stats.get(name)
+
+
+def _install_from_config():
+    if config.METRICS_TRACEMALLOC and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if config.PROFILE_STAGES:
+        stages = None if config.PROFILE_STAGES == "*" else [name.strip() for name in config.PROFILE_STAGES.split(",")]
+        add_hook(StageProfiler(stages, config.PROFILE_DIR))
+
+
+_install_from_config()
@@ -0,0 +1,366 @@
+"""
+Gateway to the LLM providers.
+
+One long-lived async client per provider runs on a dedicated event loop
+thread, so connections are reused across requests and the same gateway can
+be used from sync code (`complete`, `stream`) and from any asyncio loop
+(`acomplete`, `astream`). Calls go through:
+
+- a semaphore bounding concurrent requests per provider,
+- a per-attempt timeout,
+- retries with exponential backoff and full jitter on timeouts, connection
+  errors, 429 and 5xx responses,
+- a shared cool-down when the provider rate-limits us: a 429 (honoring its
+  Retry-After) pauses every caller instead of letting them all retry at once.
+
+Providers: "cohere" (the production API) and "stub", which talks to the
+offline stub server in app/services/llm_stub.py for load tests. Others can be
+added with `register_provider`.
+"""
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from app import config
+
+
+class LLMError(RuntimeError):
+    """Raised when a provider call fails and cannot (or can no longer) be retried."""
+
+
+class CohereProvider:
+    """Cohere v2 chat API through the SDK's async client."""
+
+    def __init__(self, api_key=None, model=None, base_url=None, timeout=None):
+        import cohere
+
+        self.model = model or config.COHERE_MODEL
+        kwargs = {"timeout": timeout or config.LLM_TIMEOUT}
+        if base_url or config.COHERE_BASE_URL:
+            kwargs["base_url"] = base_url or config.COHERE_BASE_URL
+        self.client = cohere.AsyncClientV2(api_key or config.COHERE_API_KEY, **kwargs)
+
+    async def complete(self, prompt, max_tokens, temperature):
+        response = await self.client.chat(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        return response.message.content[0].text
+
+    async def stream(self, prompt, max_tokens, temperature):
+        events = self.client.chat_stream(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        async for event in events:
+            if event.type == "content-delta":
+                yield event.delta.message.content.text
+
+    async def aclose(self):
+        wrapper = getattr(self.client, "_client_wrapper", None)
+        httpx_client = getattr(getattr(wrapper, "httpx_client", None), "httpx_client", None)
+        if httpx_client is not None:
+            await httpx_client.aclose()
+
+
+class StubProvider:
+    """Client for the local stub server (app/services/llm_stub.py), over one pooled HTTP connection pool."""
+
+    def __init__(self, base_url=None, timeout=None):
+        import httpx
+
+        self.client = httpx.AsyncClient(
+            base_url=base_url or config.LLM_STUB_URL,
+            timeout=timeout or config.LLM_TIMEOUT,
+            limits=httpx.Limits(max_connections=config.LLM_MAX_CONCURRENCY),
+        )
+
+    async def complete(self, prompt, max_tokens, temperature):
+        response = await self.client.post(
+            "/v1/chat", json={"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
+        )
+        response.raise_for_status()
+        return response.json()["text"]
+
+    async def stream(self, prompt, max_tokens, temperature):
+        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "stream": True}
+        async with self.client.stream("POST", "/v1/chat", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)["delta"]
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_providers = {
+    "cohere": CohereProvider,
+    "stub": StubProvider,
+}
+
+
+def register_provider(name, factory):
+    """Registers a provider factory (a zero-argument callable returning a provider)."""
+    _providers[name] = factory
+
+
+def _retry_info(exc):
+    """(retryable, retry_after seconds or None) for an exception raised by a provider."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True, None
+    status = getattr(exc, "status_code", None)
+    headers = getattr(exc, "headers", None)
+    response = getattr(exc, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+        headers = getattr(response, "headers", None)
+    if status is None:
+        try:
+            import httpx
+        except ImportError:
+            return False, None
+        return isinstance(exc, httpx.TransportError), None
+
+    retry_after = None
+    if headers:
+        try:
+            retry_after = float(headers.get("retry-after") or headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            retry_after = None
+    return status == 429 or status >= 500, retry_after
+
+
+class LLMGateway:
+    """
+    Bounded-concurrency, retrying front for one provider.
+
+    Args:
+        provider: Object with async `complete` / `stream` methods and `aclose`.
+        max_concurrency (int): Requests in flight at once.
+        timeout (float): Seconds per attempt (for streams: until the first token, then between tokens).
+        max_retries (int): Retries after the first attempt.
+    """
+
+    def __init__(self, provider, max_concurrency=None, timeout=None, max_retries=None):
+        self.provider = provider
+        self.timeout = timeout or config.LLM_TIMEOUT
+        self.max_retries = config.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency or config.LLM_MAX_CONCURRENCY)
+        self._cooldown_until = 0.0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def _wait_for_cooldown(self):
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _backoff(self, attempt, exc):
+        retryable, retry_after = _retry_info(exc)
+        if not retryable or attempt >= self.max_retries:
+            self.failures += 1
+            raise LLMError(f"LLM call failed after {attempt + 1} attempt(s): {exc!r}") from exc
+        self.retries += 1
+        delay = random.uniform(0, min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+        if retry_after is not None:
+            # Rate limited: everyone waits, not just this caller.
+            delay = max(delay, retry_after)
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + retry_after)
+        await asyncio.sleep(delay)
+
+    async def complete(self, prompt, max_tokens=None, temperature=0.1):
+        max_tokens = max_tokens or config.LLM_MAX_OUTPUT_TOKENS
+        async with self._semaphore:
+            self.calls += 1
+            for attempt in range(self.max_retries + 1):
+                await self._wait_for_cooldown()
+                try:
+                    return await asyncio.wait_for(
+                        self.provider.complete(prompt, max_tokens, temperature), self.timeout
+                    )
+                except Exception as exc:
+                    await self._backoff(attempt, exc)
+
+    async def stream(self, prompt, max_tokens=None, temperature=0.1):
+        """Yields text deltas. A failed stream is only retried if nothing was yielded yet."""
+        max_tokens = max_tokens or config.LLM_MAX_OUTPUT_TOKENS
+        async with self._semaphore:
+            self.calls += 1
+            for attempt in range(self.max_retries + 1):
+                await self._wait_for_cooldown()
+                started = False
+                deltas = self.provider.stream(prompt, max_tokens, temperature)
+                try:
+                    while True:
+                        try:
+                            delta = await asyncio.wait_for(deltas.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield delta
+                except Exception as exc:
+                    if started:
+                        self.failures += 1
+                        raise LLMError(f"LLM stream interrupted: {exc!r}") from exc
+                    await self._backoff(attempt, exc)
+                finally:
+                    await deltas.aclose()
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+
+class _GatewayLoop:
+    """Event loop thread that owns the gateways and their clients."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.gateways = {}
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-gateway", daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def _gateway_loop():
+    global _loop, _loop_pid
+    with _loop_lock:
+        # A forked worker gets its own loop thread and clients.
+        if _loop is None or _loop_pid != os.getpid():
+            _loop, _loop_pid = _GatewayLoop(), os.getpid()
+        return _loop
+
+
+def get_gateway(provider=None):
+    """Returns the process-wide gateway for `provider` (defaults to config.LLM_PROVIDER)."""
+    provider = provider or config.LLM_PROVIDER
+    gateway_loop = _gateway_loop()
+    gateway = gateway_loop.gateways.get(provider)
+    if gateway is None:
+        if provider not in _providers:
+            raise ValueError(f"Unknown LLM provider: {provider!r}")
+
+        async def create():
+            return gateway_loop.gateways.setdefault(provider, LLMGateway(_providers[provider]()))
+
+        gateway = gateway_loop.run(create()).result()
+    return gateway
+
+
+async def acomplete(prompt, provider=None, **kwargs):
+    """Completes `prompt` from any event loop."""
+    gateway = get_gateway(provider)
+    return await asyncio.wrap_future(_gateway_loop().run(gateway.complete(prompt, **kwargs)))
+
+
+def submit(prompt, provider=None, **kwargs):
+    """Starts completing `prompt` and returns a concurrent.futures.Future of the answer."""
+    gateway = get_gateway(provider)
+    return _gateway_loop().run(gateway.complete(prompt, **kwargs))
+
+
+def complete(prompt, provider=None, **kwargs):
+    """Completes `prompt` from sync code (blocks the calling thread only)."""
+    return submit(prompt, provider, **kwargs).result()
+
+
+def complete_many(prompts, provider=None, **kwargs):
+    """
+    Completes several prompts concurrently from sync code (bounded by the
+    gateway's semaphore) and returns the answers in prompt order.
+    """
+    futures = [submit(prompt, provider, **kwargs) for prompt in prompts]
+    try:
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+_END = object()
+
+
+def _pump(gateway, prompt, kwargs, put):
+    async def pump():
+        try:
+            async for delta in gateway.stream(prompt, **kwargs):
+                put(delta)
+        except BaseException as exc:
+            put(exc)
+            raise
+        finally:
+            put(_END)
+    return pump()
+
+
+async def astream(prompt, provider=None, **kwargs):
+    """Yields text deltas of `prompt` into any event loop."""
+    gateway = get_gateway(provider)
+    consumer_loop = asyncio.get_running_loop()
+    deltas = asyncio.Queue()
+    future = _gateway_loop().run(
+        _pump(gateway, prompt, kwargs, lambda item: consumer_loop.call_soon_threadsafe(deltas.put_nowait, item))
+    )
+    try:
+        while True:
+            item = await deltas.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+def stream(prompt, provider=None, **kwargs):
+    """Yields text deltas of `prompt` in sync code."""
+    gateway = get_gateway(provider)
+    deltas = queue.Queue()
+    future = _gateway_loop().run(_pump(gateway, prompt, kwargs, deltas.put))
+    try:
+        while True:
+            item = deltas.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+def close():
+    """Closes every provider client (e.g. on application shutdown)."""
+    global _loop
+    with _loop_lock:
+        gateway_loop, _loop = (_loop, None) if _loop_pid == os.getpid() else (None, None)
+    if gateway_loop is None:
+        return
+
+    async def close_all():
+        for gateway in gateway_loop.gateways.values():
+            await gateway.aclose()
+
+    gateway_loop.run(close_all()).result()
+    gateway_loop.loop.call_soon_threadsafe(gateway_loop.loop.stop)
@@ -0,0 +1,68 @@
+"""
+Offline stand-in for the LLM provider, for load tests and local development.
+
+    uvicorn app.services.llm_stub:app --port 8100
+    DOCAI_LLM_PROVIDER=stub DOCAI_LLM_STUB_URL=http://127.0.0.1:8100 uvicorn app.main:app
+
+It "summarizes" by echoing the first words of the prompt's TEXT section, with
+latency, streaming speed and failures configurable through the environment:
+
+    DOCAI_STUB_LATENCY            seconds before the first token (default 0.2)
+    DOCAI_STUB_TOKENS_PER_SECOND  streaming speed, 0 for instant (default 200)
+    DOCAI_STUB_ERROR_RATE         fraction of requests answered with 503 (default 0)
+    DOCAI_STUB_RATE_LIMIT_RATE    fraction answered with 429 + Retry-After (default 0)
+"""
+import asyncio
+import json
+import os
+import random
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+LATENCY = float(os.environ.get("DOCAI_STUB_LATENCY", "0.2"))
+TOKENS_PER_SECOND = float(os.environ.get("DOCAI_STUB_TOKENS_PER_SECOND", "200"))
+ERROR_RATE = float(os.environ.get("DOCAI_STUB_ERROR_RATE", "0"))
+RATE_LIMIT_RATE = float(os.environ.get("DOCAI_STUB_RATE_LIMIT_RATE", "0"))
+
+app = FastAPI(title="DocAI LLM stub")
+
+
+class ChatRequest(BaseModel):
+    prompt: str
+    max_tokens: int = 2300
+    temperature: float = 0.1
+    stream: bool = False
+
+
+def _answer(prompt, max_tokens):
+    text = prompt.split("TEXT:\n", 1)[-1]
+    words = text.split()[:max_tokens]
+    return words or ["(empty)"]
+
+
+@app.post("/v1/chat")
+async def chat(request: ChatRequest):
+    roll = random.random()
+    if roll < RATE_LIMIT_RATE:
+        return JSONResponse({"message": "rate limited"}, status_code=429, headers={"Retry-After": "1"})
+    if roll < RATE_LIMIT_RATE + ERROR_RATE:
+        return JSONResponse({"message": "unavailable"}, status_code=503)
+
+    await asyncio.sleep(LATENCY)
+    words = _answer(request.prompt, request.max_tokens)
+    if not request.stream:
+        if TOKENS_PER_SECOND:
+            await asyncio.sleep(len(words) / TOKENS_PER_SECOND)
+        return {"text": " ".join(words)}
+
+    async def events():
+        for i, word in enumerate(words):
+            delta = word if i == 0 else " " + word
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+            if TOKENS_PER_SECOND:
+                await asyncio.sleep(1 / TOKENS_PER_SECOND)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,202 @@
+"""
+Hierarchical map-reduce summarization for documents beyond the context window.
+
+Map: the chunks are grouped (per cluster, or in consecutive windows) into
+groups that fit `config.MAP_REDUCE_GROUP_TOKENS`, and every group is
+summarized in parallel through the LLM gateway.
+
+Reduce: partial summaries are merged `fan_out` at a time, level by level and
+in order of the groups' first chunks, until one call can take them all. Cluster
+groups mix chunks from all over the document, so their reduce prompts present
+the parts as themes of the document rather than as consecutive parts. That last call uses the
+caller's PromptBuilder settings (length, format, tone, language, vocabulary,
+structure). Latency grows with the depth of the tree, not with document length.
+"""
+import logging
+
+from app import config
+from app.services import instrumentation, llm_gateway, token_budget
+
+log = logging.getLogger(__name__)
+
+MAP_INSTRUCTION = (
+    "You are summarizing one part of a longer document. Write a faithful, self-contained summary "
+    "of this part that keeps every key fact, figure, name and conclusion, so that it can later be "
+    "combined with the summaries of the other parts."
+)
+REDUCE_INSTRUCTION = (
+    "You are given consecutive partial summaries of a longer document, in order. Merge them into one "
+    "coherent summary that keeps the key ideas of every part and removes repetition."
+)
+FINAL_INSTRUCTION = (
+    "You are an expert at summarizing long documents. The text below consists of consecutive partial "
+    "summaries of one document, in order. Your task is to generate a **well-structured summary** of the "
+    "whole document while keeping the key ideas and removing unnecessary details."
+)
+THEMATIC_REDUCE_INSTRUCTION = (
+    "You are given partial summaries of a longer document, each covering one of its topics. Merge them "
+    "into one coherent summary that keeps the key ideas of every topic and removes repetition."
+)
+THEMATIC_FINAL_INSTRUCTION = (
+    "You are an expert at summarizing long documents. The text below consists of partial summaries of "
+    "one document, each covering one of its topics, roughly in the order they first appear. Your task is "
+    "to generate a **well-structured summary** of the whole document while keeping the key ideas and "
+    "removing unnecessary details."
+)
+PART_SEPARATOR = "\n\n---\n\n"
+
+
+def plan_groups(context, max_group_tokens, group_by="cluster"):
+    """
+    Splits the chunks into map groups of at most `max_group_tokens` tokens.
+
+    Args:
+        context (PipelineContext): Chunks with their token counts (and labels for "cluster").
+        max_group_tokens (int): Token budget of one group.
+        group_by (str): "cluster" (each cluster separately, in document order)
+            or "window" (consecutive chunks).
+
+    Returns:
+        list: Groups of chunk indices, each in document order, sorted by their first chunk.
+    """
+    if group_by == "cluster" and context.labels is not None:
+        clusters = {}
+        for idx, cluster_id in enumerate(context.labels):
+            clusters.setdefault(cluster_id, []).append(idx)
+        sequences = list(clusters.values())
+    elif group_by in ("cluster", "window"):
+        sequences = [list(range(len(context.chunks)))]
+    else:
+        raise ValueError(f"Unknown map-reduce grouping: {group_by!r}. Use 'cluster' or 'window'.")
+
+    groups = []
+    for sequence in sequences:
+        group, group_tokens = [], 0
+        for idx in sequence:
+            tokens = context.chunk_tokens[idx] + 1
+            if group and group_tokens + tokens > max_group_tokens:
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(idx)
+            group_tokens += tokens
+        if group:
+            groups.append(group)
+    groups.sort(key=lambda group: group[0])
+    return groups
+
+
+def _build(instruction, text, summary_length, options, format_type="paragraph", structure=None):
+    from app.services.summary_generator import PromptBuilder
+
+    return PromptBuilder(text, instruction=instruction) \
+        .set_summary_length(summary_length) \
+        .set_format(format_type) \
+        .set_tone(options["tone"]) \
+        .set_language(options["language"]) \
+        .set_vocabulary(options["vocabulary"]) \
+        .set_structure(structure) \
+        .build()
+
+
+def _batches(parts, fan_out, max_tokens):
+    """Consecutive batches of at most `fan_out` parts and `max_tokens` tokens (never empty)."""
+    batch, batch_tokens = [], 0
+    for part in parts:
+        tokens = token_budget.count_tokens(part) + 3
+        if batch and (len(batch) == fan_out or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(part)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def map_reduce_prompt(context, summary_length, format_type, tone, language, vocabulary, structure,
+                      fan_out=None, max_depth=None, group_by=None, progress=None, complete_many=None):
+    """
+    Runs the map and reduce levels and returns the prompt of the final merge.
+
+    Args:
+        context (PipelineContext): The chunked document (chunk token counts are computed if missing).
+        summary_length, format_type, tone, language, vocabulary, structure: Final summary
+            settings, as for `summarize_with_together`.
+        fan_out (int, optional): Partial summaries merged per reduce call.
+        max_depth (int, optional): Reduce levels at `fan_out`; past them, every level
+            merges as many parts as fit in one prompt until they all fit the final one.
+        group_by (str, optional): "cluster" or "window" map groups.
+        progress (callable, optional): Called as `progress(stage, **details)` before
+            the map calls and every reduce level.
+        complete_many (callable, optional): Sends a level's prompts and returns the
+            answers in order. Defaults to `llm_gateway.complete_many`.
+
+    Returns:
+        str: The final prompt, with the caller's settings.
+    """
+    fan_out = max(2, fan_out or config.MAP_REDUCE_FAN_OUT)
+    max_depth = config.MAP_REDUCE_MAX_DEPTH if max_depth is None else max_depth
+    group_by = group_by or config.MAP_REDUCE_GROUP_BY
+    complete_many = complete_many or llm_gateway.complete_many
+    options = {"tone": tone, "language": language, "vocabulary": vocabulary}
+    partial_words = config.MAP_REDUCE_PARTIAL_WORDS
+    partial_tokens = max(256, int(partial_words * 2))
+
+    if context.chunk_tokens is None:
+        context.chunk_tokens = token_budget.count_tokens_batch(context.chunks)
+
+    # Map: summarize every group in parallel.
+    groups = plan_groups(context, config.MAP_REDUCE_GROUP_TOKENS, group_by)
+    if group_by == "cluster" and context.labels is not None:
+        reduce_instruction, final_instruction = THEMATIC_REDUCE_INSTRUCTION, THEMATIC_FINAL_INSTRUCTION
+    else:
+        reduce_instruction, final_instruction = REDUCE_INSTRUCTION, FINAL_INSTRUCTION
+    prompts = [
+        _build(MAP_INSTRUCTION, "\n".join(context.chunks[i] for i in group), partial_words, options)
+        for group in groups
+    ]
+    log.debug("Map-reduce: %d map calls", len(prompts))
+    if progress:
+        progress("map", calls=len(prompts))
+    with instrumentation.stage("map", items=len(prompts)):
+        parts = complete_many(prompts, max_tokens=partial_tokens)
+
+    # Reduce: merge fan_out partial summaries at a time until the final call can take them all.
+    final_scaffolding = _build(final_instruction, "", summary_length, options, format_type, structure)
+    final_budget = token_budget.prompt_budget(token_budget.count_tokens(final_scaffolding))
+    depth = 0
+    while len(parts) > 1:
+        # Past max_depth, each level merges as many parts as fit in one prompt, so that
+        # the tree still ends in a single final call without dropping any part.
+        forced = depth >= max_depth
+        batches = list(_batches(parts, len(parts) if forced else fan_out, final_budget))
+        if len(batches) == 1 or (forced and len(batches) == len(parts)):
+            break  # everything fits, or no two parts fit together any more
+        depth += 1
+        if forced:
+            log.warning("Map-reduce: %d parts left past max_depth=%d, extra level %d", len(parts), max_depth, depth)
+        log.debug("Map-reduce: level %d, %d reduce calls", depth, len(batches))
+        if progress:
+            progress("reduce", level=depth, calls=len(batches))
+        prompts = [_build(reduce_instruction, PART_SEPARATOR.join(batch), partial_words, options) for batch in batches]
+        with instrumentation.stage("reduce", items=len(prompts)):
+            parts = complete_many(prompts, max_tokens=partial_tokens)
+
+    # Final merge with the caller's settings.
+    kept = next(_batches(parts, len(parts), final_budget))
+    if len(kept) < len(parts):
+        log.warning("Map-reduce: %d of %d partial summaries don't fit the final prompt and are dropped",
+                    len(parts) - len(kept), len(parts))
+    merged = PART_SEPARATOR.join(kept)
+    return _build(final_instruction, merged, summary_length, options, format_type, structure)
+
+
+def map_reduce_summarize(context, summary_length, format_type, tone, language, vocabulary, structure, **options):
+    """
+    Summarizes every chunk of the document through a map-reduce tree of LLM calls.
+
+    Takes the arguments of `map_reduce_prompt` and returns the final summary.
+    """
+    final_prompt = map_reduce_prompt(
+        context, summary_length, format_type, tone, language, vocabulary, structure, **options
+    )
+    return llm_gateway.complete(final_prompt, max_tokens=config.LLM_MAX_OUTPUT_TOKENS, temperature=0.1)
@@ -0,0 +1,145 @@
+"""
+Process-wide registry for the NLP models used by the summarization pipeline.
+
+Each model is constructed once per process, on first use, and then shared by
+every request. spaCy and sentence-transformers are only imported when a model
+is actually loaded, so importing the pipeline stays cheap. The embedding model
+runs on the backend set by config.EMBEDDING_BACKEND (see embedding_backends.py).
+
+To share the weights between workers, call `warm_up()` in the master process
+before forking (see gunicorn.conf.py): the forked workers then see the already
+loaded models copy-on-write instead of each paying the load time again.
+"""
+import threading
+
+from app import config
+
+
+def _load_spacy():
+    import spacy
+
+    try:
+        return spacy.load(config.SPACY_MODEL)
+    except OSError:
+        if not config.SPACY_AUTO_DOWNLOAD:
+            raise
+        import spacy.cli
+
+        spacy.cli.download(config.SPACY_MODEL)
+        return spacy.load(config.SPACY_MODEL)
+
+
+def _load_embedding_model():
+    from app.services.embedding_backends import load_backend
+
+    try:
+        model = load_backend(config.EMBEDDING_MODEL)
+    except Exception:
+        print("Warning: BGE model not found, using MiniLM as fallback.")
+        model = load_backend(config.FALLBACK_EMBEDDING_MODEL)
+    # Vectors of different backends differ slightly, so they are cached apart.
+    _names["embedding"] = model.cache_name
+    return model
+
+
+_loaders = {
+    "nlp": _load_spacy,
+    "embedding": _load_embedding_model,
+}
+# Models loaded by `warm_up()` when no names are given. The full spaCy pipeline
+# is only loaded on demand; chunking uses the lighter "sentencizer".
+_preload = {"embedding"}
+_models = {}
+_names = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def register(name, loader, preload=True):
+    """
+    Registers a loader for a named model.
+
+    Args:
+        name (str): Registry key.
+        loader (callable): Zero-argument function returning the loaded model.
+        preload (bool): Whether `warm_up()` loads it by default.
+    """
+    with _registry_lock:
+        _loaders[name] = loader
+        if preload:
+            _preload.add(name)
+        else:
+            _preload.discard(name)
+        _models.pop(name, None)
+        _names.pop(name, None)
+
+
+def get(name):
+    """
+    Returns the model registered under `name`, loading it on first use.
+
+    Loading is thread-safe: concurrent callers for the same model wait for a
+    single load instead of constructing it several times.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        if name not in _loaders:
+            raise KeyError(f"Unknown model: {name!r}")
+        lock = _locks.setdefault(name, threading.Lock())
+
+    with lock:
+        model = _models.get(name)
+        if model is None:
+            model = _loaders[name]()
+            _models[name] = model
+    return model
+
+
+def get_nlp():
+    """Returns the shared full spaCy pipeline (sentence splitting uses the lighter "sentencizer")."""
+    return get("nlp")
+
+
+def get_embedding_model():
+    """Returns the shared sentence embedding model."""
+    return get("embedding")
+
+
+def get_model_name(name):
+    """
+    Returns the identifier the model registered under `name` was loaded from
+    (e.g. which embedding model was picked after a fallback), loading it if needed.
+    """
+    get(name)
+    return _names.get(name, name)
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def warm_up(names=None):
+    """
+    Loads models ahead of the first request.
+
+    Args:
+        names (list, optional): Models to load. Defaults to every model registered for preloading.
+    """
+    for name in names or sorted(_preload):
+        get(name)
+
+
+def after_fork():
+    """Per-worker setup to run right after a worker is forked from the master."""
+    if is_loaded("embedding"):
+        get_embedding_model().set_threads(config.EMBEDDING_THREADS)
+
+
+def clear():
+    """Drops every loaded model (mainly for tests and reloads)."""
+    with _registry_lock:
+        _models.clear()
+        _names.clear()
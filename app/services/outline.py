@@ -0,0 +1,503 @@
+"""
+Document outlines: where each section of a document starts and ends.
+
+An outline maps every heading of a document to the range of segments its
+section covers, so that a section can be read (and then chunked and embedded)
+on its own instead of parsing the whole document:
+
+- DOCX: paragraphs whose style is a heading ("heading 1".."heading 9", "Title",
+  or any style with an outline level, following `basedOn` inheritance), as
+  paragraph ranges;
+- PDF: the bookmarks when there are any, else lines set in a larger font than
+  the body text, as page ranges (the first and last page are trimmed at the
+  section's heading and the next one);
+- TXT, and pasted text: Markdown (`#`) and underlined headings and "Chapter"
+  / "Part" lines, as byte (character, for text) ranges.
+
+A section runs until the next heading of the same or a higher level, so it
+includes its subsections. Outlines are cached per file content hash, in memory
+and as JSON files in config.OUTLINE_CACHE_DIR.
+"""
+import difflib
+import json
+import os
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
+import zipfile
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass, field
+
+from app import config
+from app.services import ingestion, instrumentation
+from app.services.result_cache import hash_file
+
+# Bumped when the outline format or the heading detection changes, to ignore older cache files.
+OUTLINE_VERSION = 2
+# PDF lines longer than this are body text, whatever their font.
+MAX_HEADING_WORDS = 14
+# Distinct heading font sizes kept as levels (larger sizes first).
+MAX_FONT_LEVELS = 3
+# A large-font line repeated on more pages than this is a running header, not a heading.
+MAX_HEADING_REPEATS = 3
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_UNDERLINE = re.compile(r"^(=+|-+)\s*$")
+_CHAPTER = re.compile(r"^(chapter|part)\s+\S+.*$", re.IGNORECASE)
+
+
+@dataclass
+class Section:
+    """
+    One section of a document.
+
+    Attributes:
+        title (str): Heading text.
+        level (int): Heading level (0 for a document title, 1 for top-level headings).
+        start (int): First segment of the section: paragraph (DOCX), page (PDF) or byte/character offset (TXT).
+        stop (int): Segment to stop before, None for the end of the document.
+        next_title (str): Heading that ends the section (PDF pages are trimmed at it).
+    """
+    title: str
+    level: int
+    start: int
+    stop: int = None
+    next_title: str = None
+
+
+@dataclass
+class Outline:
+    """
+    Sections of a document, in document order.
+
+    Attributes:
+        unit (str): What `Section.start` / `stop` count: "paragraph", "page", "byte" or "char".
+        source (str): Where the headings came from: "styles", "bookmarks", "fonts" or "markup".
+        sections (list): Section objects.
+        file_hash (str): Content hash of the file (None for pasted text).
+    """
+    unit: str
+    source: str
+    sections: list = field(default_factory=list)
+    file_hash: str = None
+
+    def titles(self):
+        return [section.title for section in self.sections]
+
+    def find(self, title):
+        """
+        The section best matching `title`, or None.
+
+        Tries, in order: the same title (case and whitespace aside), a heading
+        starting with it ("chapter 7" finds "Chapter 7: Results"), a heading
+        containing it as whole words, then the closest heading (difflib ratio >= 0.8).
+        """
+        wanted = _normalize(title)
+        if not wanted:
+            return None
+        normalized = [_normalize(section.title) for section in self.sections]
+        for matches in (
+            lambda heading: heading == wanted,
+            lambda heading: heading.startswith(wanted) and not heading[len(wanted):len(wanted) + 1].isalnum(),
+            lambda heading: re.search(rf"(?<!\w){re.escape(wanted)}(?!\w)", heading) is not None,
+        ):
+            for section, heading in zip(self.sections, normalized):
+                if matches(heading):
+                    return section
+        close = difflib.get_close_matches(wanted, normalized, n=1, cutoff=0.8)
+        return self.sections[normalized.index(close[0])] if close else None
+
+    def to_dict(self):
+        return {"version": OUTLINE_VERSION, **asdict(self)}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data.pop("version", None)
+        data["sections"] = [Section(**section) for section in data["sections"]]
+        return cls(**data)
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower().strip(" .:")
+
+
+def _close_sections(headings, end=None):
+    """Sections from (title, level, start) headings: each ends at the next heading of the same or a higher level."""
+    sections = []
+    for position, (title, level, start) in enumerate(headings):
+        section = Section(title, level, start, end)
+        for next_title, next_level, next_start in headings[position + 1:]:
+            if next_level <= level:
+                # Never before the section's own start, whatever the headings' order.
+                section.stop, section.next_title = max(next_start, start), next_title
+                break
+        sections.append(section)
+    return sections
+
+
+# DOCX
+
+def _docx_heading_levels(archive):
+    """Style id -> heading level, from word/styles.xml."""
+    try:
+        root = ElementTree.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return {}
+    declared, based_on = {}, {}
+    for style in root.iter(f"{_W}style"):
+        if style.get(f"{_W}type") != "paragraph":
+            continue
+        style_id = style.get(f"{_W}styleId")
+        name = style.find(f"{_W}name")
+        name = (name.get(f"{_W}val") or "").lower() if name is not None else ""
+        outline_level = style.find(f"{_W}pPr/{_W}outlineLvl")
+        parent = style.find(f"{_W}basedOn")
+        if parent is not None:
+            based_on[style_id] = parent.get(f"{_W}val")
+        match = re.fullmatch(r"heading\s*(\d)", name)
+        if name == "title":
+            declared[style_id] = 0
+        elif match:
+            declared[style_id] = int(match.group(1))
+        elif outline_level is not None and int(outline_level.get(f"{_W}val", "9")) < 9:
+            declared[style_id] = int(outline_level.get(f"{_W}val")) + 1
+
+    levels = {}
+    for style_id in set(declared) | set(based_on):
+        seen, current = set(), style_id
+        while current is not None and current not in declared and current not in seen:
+            seen.add(current)
+            current = based_on.get(current)
+        if current in declared:
+            levels[style_id] = declared[current]
+    return levels
+
+
+def _docx_outline(file_path):
+    with zipfile.ZipFile(file_path) as archive:
+        levels = _docx_heading_levels(archive)
+    headings = []
+    count = 0
+    for segment in ingestion.iter_segments(file_path):
+        count += 1
+        if segment.style is None or not segment.text.strip():
+            continue
+        level = levels.get(segment.style)
+        if level is None:
+            # Documents without styles.xml still name their heading styles "Heading1".. "Heading9".
+            match = re.fullmatch(r"heading\s*(\d)", segment.style, re.IGNORECASE)
+            level = int(match.group(1)) if match else None
+        if level is not None:
+            headings.append((" ".join(segment.text.split()), level, segment.index))
+    return Outline("paragraph", "styles", _close_sections(headings, count))
+
+
+# PDF
+
+def _pdf_bookmarks(file_path):
+    """(title, level, page) of the PDF's bookmarks, in page order (a table of contents may be out of order)."""
+    pymupdf = ingestion._import_pymupdf()
+    if pymupdf is not None:
+        with pymupdf.open(file_path) as document:
+            bookmarks = [(title, level, page - 1) for level, title, page in document.get_toc() if page >= 1]
+        return sorted(bookmarks, key=lambda bookmark: bookmark[2])
+
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    bookmarks = []
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            page = reader.get_destination_page_number(item)
+            if page is not None and page >= 0:
+                bookmarks.append((item.title, level, page))
+
+    walk(reader.outline, 1)
+    return sorted(bookmarks, key=lambda bookmark: bookmark[2])
+
+
+def _pdf_font_lines(file_path, start, stop):
+    """
+    Worker task: the character-weighted font-size histogram of pages [start, stop),
+    and its lines as (page, size, text), text None for lines too long to be headings.
+    """
+    pymupdf = ingestion._import_pymupdf()
+    sizes = Counter()
+    lines = []
+    with pymupdf.open(file_path) as document:
+        for number in range(start, stop):
+            for block in document.load_page(number).get_text("dict")["blocks"]:
+                for line in block.get("lines", ()):
+                    spans = [span for span in line["spans"] if span["text"].strip()]
+                    if not spans:
+                        continue
+                    text = " ".join("".join(span["text"] for span in spans).split())
+                    size = round(max(span["size"] for span in spans), 1)
+                    sizes[size] += len(text)
+                    # Longer lines are kept only as separators: they cannot be headings.
+                    lines.append((number, size, text if len(text.split()) <= MAX_HEADING_WORDS else None))
+    return sizes, lines
+
+
+def _pdf_font_headings(file_path):
+    """(title, level, page) of the lines set in a larger font than the body text."""
+    if ingestion._import_pymupdf() is None:
+        return []  # pypdf has no font sizes
+    sizes, lines = Counter(), []
+    for batch_sizes, batch_lines in ingestion.map_pdf_pages(_pdf_font_lines, file_path):
+        sizes.update(batch_sizes)
+        lines.extend(batch_lines)
+    if not sizes:
+        return []
+    body = sizes.most_common(1)[0][0]
+    threshold = body * config.OUTLINE_HEADING_FONT_RATIO
+    heading_sizes = sorted({size for _, size, text in lines if text and size >= threshold}, reverse=True)
+    levels = {size: level for level, size in enumerate(heading_sizes[:MAX_FONT_LEVELS], start=1)}
+
+    candidates = []
+    previous_line = None
+    for position, (page, size, text) in enumerate(lines):
+        if text is None or size not in levels or not re.search(r"[^\W\d_]", text):
+            continue  # body text, or a page number
+        if candidates and previous_line == position - 1 and candidates[-1][1:] == (levels[size], page):
+            # A heading wrapped over several lines.
+            candidates[-1] = (f"{candidates[-1][0]} {text}", levels[size], page)
+        else:
+            candidates.append((text, levels[size], page))
+        previous_line = position
+    pages_per_title = Counter(_normalize(title) for title, _, _ in set(candidates))
+    return [heading for heading in candidates if pages_per_title[_normalize(heading[0])] <= MAX_HEADING_REPEATS]
+
+
+def _pdf_outline(file_path):
+    headings, source = _pdf_bookmarks(file_path), "bookmarks"
+    if not headings:
+        headings, source = _pdf_font_headings(file_path), "fonts"
+    sections = _close_sections(headings)
+    for section in sections:
+        if section.stop is not None:
+            # The next heading's page is read too, and cut at that heading.
+            section.stop += 1
+    return Outline("page", source, sections)
+
+
+# TXT and pasted text
+
+def _markup_headings(lines):
+    """(title, level, offset) of the headings in (offset, line) pairs."""
+    headings = []
+    previous = None
+    for offset, line in lines:
+        stripped = line.strip()
+        markdown = _MARKDOWN_HEADING.match(stripped)
+        if markdown:
+            headings.append((markdown.group(2), len(markdown.group(1)), offset))
+        elif previous is not None and previous[1].strip() and _UNDERLINE.match(stripped) and len(stripped) >= 3:
+            headings.append((previous[1].strip(), 1 if stripped[0] == "=" else 2, previous[0]))
+        elif _CHAPTER.match(stripped) and len(stripped.split()) <= MAX_HEADING_WORDS:
+            headings.append((stripped, 1, offset))
+        previous = (offset, line)
+    return headings
+
+
+def _iter_byte_lines(file_path):
+    with open(file_path, "rb") as file:
+        offset = 0
+        for line in file:
+            yield offset, line.decode("utf-8", errors="replace")
+            offset += len(line)
+
+
+def _iter_char_lines(text):
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        yield offset, line
+        offset += len(line)
+
+
+def _text_outline(file_path):
+    return Outline("byte", "markup", _close_sections(_markup_headings(_iter_byte_lines(file_path))))
+
+
+def text_outline(text):
+    """Outline of pasted text, in character offsets (not cached)."""
+    return Outline("char", "markup", _close_sections(_markup_headings(_iter_char_lines(text))))
+
+
+def build_outline(file_path):
+    """Builds the outline of a TXT, PDF or DOCX file (uncached; see `get_outline`)."""
+    lower = file_path.lower()
+    with instrumentation.stage("outline") as span:
+        if lower.endswith(".docx"):
+            outline = _docx_outline(file_path)
+        elif lower.endswith(".pdf"):
+            outline = _pdf_outline(file_path)
+        elif lower.endswith(".txt"):
+            outline = _text_outline(file_path)
+        else:
+            raise ValueError("Unsupported file format. Use TXT, PDF, or DOCX.")
+        span.count(items=len(outline.sections))
+    return outline
+
+
+class OutlineCache:
+    """
+    Outlines by file content hash: least recently used kept in memory, all persisted as JSON.
+
+    Args:
+        directory (str, optional): Where outlines are persisted; None keeps them in memory only.
+        max_entries (int): Outlines kept in memory.
+    """
+
+    def __init__(self, directory=None, max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._outlines = OrderedDict()
+        self._hashes = OrderedDict()  # (path, size, mtime) -> content hash, to skip rehashing
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def file_hash(self, file_path):
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(key)
+        if digest is None:
+            digest = hash_file(file_path)
+            with self._lock:
+                self._hashes[key] = digest
+                while len(self._hashes) > 4 * self.max_entries:
+                    self._hashes.popitem(last=False)
+        return digest
+
+    def get(self, file_path):
+        """The outline of `file_path`, built once per file content."""
+        digest = self.file_hash(file_path)
+        with self._lock:
+            outline = self._outlines.get(digest)
+            if outline is not None:
+                self._outlines.move_to_end(digest)
+                self.hits += 1
+                return outline
+        outline = self._load(digest)
+        if outline is None:
+            with self._lock:
+                self.misses += 1
+            outline = build_outline(file_path)
+            outline.file_hash = digest
+            self._save(outline)
+        with self._lock:
+            self._outlines[digest] = outline
+            self._outlines.move_to_end(digest)
+            while len(self._outlines) > self.max_entries:
+                self._outlines.popitem(last=False)
+        return outline
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _load(self, digest):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(digest), encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != OUTLINE_VERSION:
+            return None
+        with self._lock:
+            self.hits += 1
+        return Outline.from_dict(data)
+
+    def _save(self, outline):
+        if not self.directory:
+            return
+        path = self._path(outline.file_hash)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(outline.to_dict(), file, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._outlines)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_outline_cache():
+    """Returns the process-wide OutlineCache configured in app.config."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OutlineCache(config.OUTLINE_CACHE_DIR or None, config.OUTLINE_CACHE_ENTRIES)
+        return _cache
+
+
+def get_outline(file_path):
+    """The (cached) outline of a TXT, PDF or DOCX file."""
+    return get_outline_cache().get(file_path)
+
+
+def _find(outline, title):
+    section = outline.find(title)
+    if section is None:
+        available = ", ".join(repr(heading) for heading in outline.titles()[:20]) or "none"
+        raise ValueError(f"Section not found: {title!r}. Headings: {available}")
+    return section
+
+
+def _heading_pattern(title):
+    return re.compile(r"\s+".join(re.escape(word) for word in title.split()), re.IGNORECASE)
+
+
+def _trim_pages(text, section):
+    """Cuts page text before the section's heading and at the next heading."""
+    match = _heading_pattern(section.title).search(text)
+    begin = match.start() if match else 0
+    if section.next_title:
+        following = _heading_pattern(section.next_title).search(text, match.end() if match else 0)
+        if following:
+            return text[begin:following.start()].rstrip()
+    return text[begin:]
+
+
+def read_section(file_path, section, outline):
+    """Text of one section of a file, reading only its range."""
+    if outline.unit == "byte":
+        with open(file_path, "rb") as file:
+            file.seek(section.start)
+            size = -1 if section.stop is None else section.stop - section.start
+            return file.read(size).decode("utf-8", errors="replace").rstrip()
+    text = ingestion.read_text(file_path, section.start, section.stop)
+    return _trim_pages(text, section) if outline.unit == "page" else text
+
+
+def extract_section_from_file(file_path, paragraph_title):
+    """
+    Text of the section titled `paragraph_title` (see `Outline.find`), heading
+    included, reading only that section's pages, paragraphs or bytes.
+
+    Raises:
+        ValueError: When no heading matches (the message lists the document's headings).
+    """
+    outline = get_outline(file_path)
+    return read_section(file_path, _find(outline, paragraph_title), outline)
+
+
+def extract_section_from_text(text, paragraph_title):
+    """Like `extract_section_from_file`, for pasted text."""
+    section = _find(text_outline(text), paragraph_title)
+    return text[section.start:section.stop].rstrip()
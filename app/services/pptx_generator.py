@@ -0,0 +1,681 @@
+"""
+PowerPoint generation from a template deck.
+
+A template is a .pptx whose slides are examples of each slide type (by
+default slides 0-4 are "Title", 5-9 "Content1", 10-14 "Content2"). Text boxes
+whose whole text is a key ("title", "content1", ...) are placeholders, filled
+with the value of that key in the slide's spec while keeping the template
+run's formatting.
+
+`TemplateEngine` parses a template once and keeps it in memory, with:
+
+- a skeleton of the template without its slides (masters, layouts, theme),
+  from which every deck starts, so template slides never have to be removed;
+- a catalog of every template slide: its layout, shape tree, relationships
+  and placeholders (key, shape position, run properties).
+
+A deck is built by copying catalogued slide elements into new slide parts
+and re-pointing their relationships (pictures, media, charts, hyperlinks) to
+copies of the target parts, shared by every slide of the deck. Part names and
+relationships are allocated directly rather than through python-pptx's
+lookups, which scan the whole package on every call.
+
+`Deck` builds a python-pptx `Presentation` in memory. `DeckWriter` writes the
+same deck straight to a file or stream instead: skeleton parts first, then
+each slide (and the parts it brings) as soon as it is built, and the
+presentation part, its relationships and the content types last, so only
+one slide is ever held in memory. `build_presentations` renders many decks
+that way on a process pool whose workers parse the template once, run under
+an address-space limit and are replaced after a number of decks.
+"""
+import io
+import os
+import random
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from copy import deepcopy
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+
+try:
+    import resource
+except ImportError:  # not on Windows: no memory cap or peak RSS there
+    resource = None
+
+from pptx import Presentation
+from pptx.opc.constants import CONTENT_TYPE as CT
+from pptx.opc.constants import RELATIONSHIP_TARGET_MODE as RTM
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import CT_Relationships, serialize_part_xml
+from pptx.opc.package import PartFactory, _Relationship
+from pptx.opc.packuri import PackURI
+from pptx.opc.spec import default_content_types
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+from pptx.parts.slide import SlidePart
+
+from app import config
+from app.services.pptx_index import ShapeIndex
+
+# Template slide indices of each slide type.
+SLIDE_TYPE_RANGES = {
+    "Title": range(0, 5),
+    "Content1": range(5, 10),
+    "Content2": range(10, 15),
+}
+
+_R_NAMESPACE = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+# Relationships that are not copied with a slide: its layout (re-created) and notes.
+_SKIPPED_RELS = (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE)
+# Skeleton entries a DeckWriter rewrites once all slides are known.
+_CONTENT_TYPES = "[Content_Types].xml"
+_PRESENTATION = "ppt/presentation.xml"
+_PRESENTATION_RELS = "ppt/_rels/presentation.xml.rels"
+
+
+@dataclass
+class Placeholder:
+    """
+    A text box of a template slide that is filled by key.
+
+    Attributes:
+        key (str): Lowercased text of the box in the template.
+        position (int): Index of the shape in the slide's shape tree.
+        run_properties: `a:rPr` of the template's first run (None if it had no run).
+    """
+    key: str
+    position: int
+    run_properties: object = None
+
+
+@dataclass
+class TemplateSlide:
+    """
+    Everything needed to clone one template slide.
+
+    Attributes:
+        index (int): Position of the slide in the template.
+        layout_partname (str): Part name of its slide layout.
+        element: Its `p:sld` element (never modified).
+        rels (list): (rId, reltype, target part or external URL, is_external) of
+            every relationship except the layout and notes.
+        rel_refs (list): (node position in `element.iter()`, attribute, rId) of every
+            attribute referencing a relationship.
+        placeholders (dict): Key -> list of Placeholder.
+    """
+    index: int
+    layout_partname: str
+    element: object
+    rels: list
+    rel_refs: list
+    placeholders: dict = field(default_factory=dict)
+
+
+def _rel_refs(element):
+    return [
+        (position, name, value)
+        for position, node in enumerate(element.iter())
+        for name, value in node.attrib.items()
+        if name.startswith(_R_NAMESPACE)
+    ]
+
+
+def _catalog_slide(index, slide, shape_index):
+    shape_tree = slide._element.cSld.spTree
+
+    placeholders = {}
+    for key, rows in shape_index.placeholders(index).items():
+        for row in rows:
+            position = int(shape_index.position[row])
+            first_run = shape_tree[position].find(qn("p:txBody") + "/" + qn("a:p") + "/" + qn("a:r"))
+            run_properties = first_run.find(qn("a:rPr")) if first_run is not None else None
+            placeholders.setdefault(key, []).append(Placeholder(key, position, run_properties))
+
+    rels = [
+        (rel.rId, rel.reltype, rel.target_ref if rel.is_external else rel.target_part, rel.is_external)
+        for rel in slide.part.rels.values()
+        if rel.reltype not in _SKIPPED_RELS
+    ]
+    return TemplateSlide(
+        index=index,
+        layout_partname=slide.part.slide_layout.part.partname,
+        element=slide._element,
+        rels=rels,
+        rel_refs=_rel_refs(slide._element),
+        placeholders=placeholders,
+    )
+
+
+def _skeleton(blob):
+    """The template without its slides, serialized (the starting point of every deck)."""
+    prs = Presentation(io.BytesIO(blob))
+    slide_ids = prs.slides._sldIdLst
+    for slide_id in list(slide_ids):
+        prs.part.drop_rel(slide_id.rId)
+        slide_ids.remove(slide_id)
+    stream = io.BytesIO()
+    prs.save(stream)
+    return stream.getvalue()
+
+
+def _partname_template(partname):
+    """'/ppt/media/image3.png' -> '/ppt/media/image%d.png' (for `next_partname`)."""
+    return re.sub(r"\d*(\.\w+)$", r"%d\1", partname, count=1)
+
+
+def _next_partname(template, taken, next_numbers):
+    """Like `package.next_partname`, from the set of part names already `taken`."""
+    number = next_numbers.get(template, 1)
+    while template % number in taken:
+        number += 1
+    next_numbers[template] = number + 1
+    partname = PackURI(template % number)
+    taken.add(partname)
+    return partname
+
+
+def _fill(shape, placeholder, value):
+    """Replaces the runs of the first paragraph with one run of `value` in the template run's formatting."""
+    paragraph = shape.find(qn("p:txBody")).find(qn("a:p"))
+    for run in paragraph.findall(qn("a:r")):
+        paragraph.remove(run)
+    run = paragraph.add_r()
+    run.text = value
+    if placeholder.run_properties is not None:
+        run.insert(0, deepcopy(placeholder.run_properties))
+
+
+def _fill_slide(template, element, data):
+    """Fills the placeholders of a copy of a template slide from `data`."""
+    if not data:
+        return
+    shape_tree = element.cSld.spTree
+    lower = {str(key).lower(): value for key, value in data.items()}
+    for key, placeholders in template.placeholders.items():
+        if key in lower:
+            for placeholder in placeholders:
+                _fill(shape_tree[placeholder.position], placeholder, str(lower[key]))
+
+
+def _set_rel_ids(template, element, new_ids):
+    """Re-points the relationship references of a copy of a template slide (template rId -> new rId)."""
+    nodes = list(element.iter())
+    for position, name, rId in template.rel_refs:
+        if rId in new_ids:
+            nodes[position].set(name, new_ids[rId])
+
+
+def _add_rel(rels, rId, reltype, target, is_external=False):
+    """Adds a relationship under a given rId (python-pptx only allocates new ones)."""
+    rels._rels[rId] = _Relationship(
+        rels._base_uri, rId, reltype, target_mode=RTM.EXTERNAL if is_external else RTM.INTERNAL, target=target,
+    )
+
+
+class Deck:
+    """
+    A presentation being built from a template.
+
+    Args:
+        engine (TemplateEngine): The template.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.presentation = Presentation(io.BytesIO(engine.skeleton))
+        self._layouts = {
+            layout.part.partname: layout
+            for master in self.presentation.slide_masters
+            for layout in master.slide_layouts
+        }
+        self._copies = {}
+        self._partnames = {part.partname for part in self.presentation.part.package.iter_parts()}
+        self._next_numbers = {}
+        slide_ids = [slide_id.id for slide_id in self.presentation.slides._sldIdLst]
+        self._next_slide_id = max(slide_ids, default=255) + 1
+
+    def _next_partname(self, template):
+        """Like `package.next_partname`, without walking the package every time."""
+        return _next_partname(template, self._partnames, self._next_numbers)
+
+    def _copy_part(self, part):
+        """Copy of a template part (and of the parts it relates to) in this deck, made once."""
+        copy = self._copies.get(part.partname)
+        if copy is None:
+            partname = self._next_partname(_partname_template(part.partname))
+            package = self.presentation.part.package
+            copy = self._copies[part.partname] = PartFactory(partname, part.content_type, package, part.blob)
+            # The blob is copied as is, so its r:id / r:embed references need the template's rIds.
+            for rel in part.rels.values():
+                target = rel.target_ref if rel.is_external else self._copy_part(rel.target_part)
+                _add_rel(copy.rels, rel.rId, rel.reltype, target, rel.is_external)
+        return copy
+
+    def add_slide(self, template_index, data=None):
+        """
+        Appends a copy of a template slide, with its placeholders filled from `data`.
+
+        Args:
+            template_index (int): Template slide to copy.
+            data (dict, optional): Placeholder key (case-insensitive) -> text.
+
+        Returns:
+            pptx.slide.Slide: The new slide.
+        """
+        template = self.engine.slides[template_index]
+        prs = self.presentation
+
+        # A copy of the whole template slide (shapes, background, transition, timing)
+        element = deepcopy(template.element)
+        partname = self._next_partname("/ppt/slides/slide%d.xml")
+        slide_part = SlidePart(partname, CT.PML_SLIDE, prs.part.package, element)
+        slide_part.rels._add_relationship(RT.SLIDE_LAYOUT, self._layouts[template.layout_partname].part)
+        rId = prs.part.rels._add_relationship(RT.SLIDE, slide_part)
+        prs.slides._sldIdLst._add_sldId(id=self._next_slide_id, rId=rId)
+        self._next_slide_id += 1
+        if template.rel_refs:
+            self._relink(slide_part, template, element)
+        _fill_slide(template, element, data)
+        return slide_part.slide
+
+    def _relink(self, slide_part, template, element):
+        rels = slide_part.rels
+        new_ids = {}
+        for rId, reltype, target, is_external in template.rels:
+            if is_external:
+                new_ids[rId] = rels._add_relationship(reltype, target, is_external=True)
+            elif reltype == RT.SLIDE:
+                new_ids[rId] = ""  # jumps to template slides don't survive
+            else:
+                new_ids[rId] = rels._add_relationship(reltype, self._copy_part(target))
+        _set_rel_ids(template, element, new_ids)
+
+    def save(self, target):
+        """Writes the deck to a path or a binary stream."""
+        self.presentation.save(target)
+
+
+class DeckWriter:
+    """
+    A deck written to a file or stream as it is built, one slide in memory at a time.
+
+    Use it as a context manager, or call `close`, which writes the parts that
+    depend on every slide (presentation part and content types). When the block
+    raises, a deck written to a path is deleted rather than left truncated.
+
+    Args:
+        engine (TemplateEngine): The template.
+        target (str or file): Path or writable binary stream (it need not be seekable).
+    """
+
+    def __init__(self, engine, target):
+        self.engine = engine
+        self.slide_count = 0
+        self._path = target if isinstance(target, (str, os.PathLike)) else None
+        self._zip = zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED)
+        for name, blob in engine.skeleton_entries:
+            self._zip.writestr(name, blob)
+        self._partnames = {PackURI("/" + name) for name, _ in engine.skeleton_entries}
+        self._next_numbers = {}
+        self._copies = {}
+
+        self._presentation = parse_xml(engine.skeleton_presentation)
+        self._slide_ids = self._presentation.get_or_add_sldIdLst()
+        self._next_slide_id = max((slide_id.id for slide_id in self._slide_ids), default=255) + 1
+        self._presentation_rels = parse_xml(engine.skeleton_presentation_rels)
+        self._rel_ids = {rel.rId for rel in self._presentation_rels.relationship_lst}
+        self._content_types = parse_xml(engine.skeleton_content_types)
+        self._defaults = {default.extension.lower(): default.contentType for default in self._content_types.default_lst}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        self._zip.close()
+        if self._path is not None and os.path.exists(self._path):
+            os.remove(self._path)
+
+    def _write_part(self, partname, content_type, blob, rels=None):
+        self._zip.writestr(partname.membername, blob)
+        if rels is not None and len(rels):
+            self._zip.writestr(partname.rels_uri.membername, rels.xml_file_bytes)
+        extension = partname.ext.lower()
+        if self._defaults.get(extension) == content_type:
+            return
+        if extension not in self._defaults and (extension, content_type) in default_content_types:
+            self._defaults[extension] = content_type
+            self._content_types.add_default(extension, content_type)
+        else:
+            self._content_types.add_override(partname, content_type)
+
+    def _copy_part(self, part):
+        """Part name of this deck's copy of a template part, written (with its related parts) once."""
+        partname = self._copies.get(part.partname)
+        if partname is None:
+            partname = self._copies[part.partname] = _next_partname(
+                _partname_template(part.partname), self._partnames, self._next_numbers
+            )
+            rels = CT_Relationships.new()
+            # The blob is written as is, so its r:id / r:embed references need the template's rIds.
+            for rel in part.rels.values():
+                target = rel.target_ref if rel.is_external else self._copy_part(rel.target_part).relative_ref(partname.baseURI)
+                rels.add_rel(rel.rId, rel.reltype, target, rel.is_external)
+            self._write_part(partname, part.content_type, part.blob, rels)
+        return partname
+
+    def add_slide(self, template_index, data=None):
+        """
+        Writes a copy of a template slide, with its placeholders filled from `data`.
+
+        Args:
+            template_index (int): Template slide to copy.
+            data (dict, optional): Placeholder key (case-insensitive) -> text.
+        """
+        template = self.engine.slides[template_index]
+        element = deepcopy(template.element)
+        partname = _next_partname("/ppt/slides/slide%d.xml", self._partnames, self._next_numbers)
+
+        rels = CT_Relationships.new()
+        rels.add_rel("rId1", RT.SLIDE_LAYOUT, PackURI(template.layout_partname).relative_ref(partname.baseURI))
+        new_ids = {}
+        for rId, reltype, target, is_external in template.rels:
+            if reltype == RT.SLIDE and not is_external:
+                new_ids[rId] = ""  # jumps to template slides don't survive
+                continue
+            new_ids[rId] = f"rId{len(rels) + 1}"
+            if not is_external:
+                target = self._copy_part(target).relative_ref(partname.baseURI)
+            rels.add_rel(new_ids[rId], reltype, target, is_external)
+        _set_rel_ids(template, element, new_ids)
+        _fill_slide(template, element, data)
+        self._write_part(partname, CT.PML_SLIDE, serialize_part_xml(element), rels)
+
+        rId = self._next_rel_id()
+        self._presentation_rels.add_rel(rId, RT.SLIDE, partname.relative_ref(PackURI("/" + _PRESENTATION).baseURI))
+        self._slide_ids._add_sldId(id=self._next_slide_id, rId=rId)
+        self._next_slide_id += 1
+        self.slide_count += 1
+
+    def _next_rel_id(self):
+        number = len(self._rel_ids) + 1
+        while f"rId{number}" in self._rel_ids:
+            number += 1
+        rId = f"rId{number}"
+        self._rel_ids.add(rId)
+        return rId
+
+    def close(self):
+        """Writes the presentation part, its relationships and the content types, and closes the package."""
+        if self._zip.fp is None:
+            return
+        self._zip.writestr(_PRESENTATION, serialize_part_xml(self._presentation))
+        self._zip.writestr(_PRESENTATION_RELS, self._presentation_rels.xml_file_bytes)
+        self._zip.writestr(_CONTENT_TYPES, serialize_part_xml(self._content_types))
+        self._zip.close()
+
+
+class TemplateEngine:
+    """
+    A parsed template and its slide catalog.
+
+    The slide types are read from the template's shape index (see
+    `ShapeIndex.slide_types`); types the template doesn't reveal that way
+    fall back to SLIDE_TYPE_RANGES.
+
+    Args:
+        template_path (str): The template .pptx.
+    """
+
+    def __init__(self, template_path):
+        with open(template_path, "rb") as template:
+            blob = template.read()
+        self.template_path = template_path
+        self.index = ShapeIndex.from_bytes(blob)
+        self.slide_types = self.index.slide_types()
+        self.presentation = Presentation(io.BytesIO(blob))
+        self.slides = [
+            _catalog_slide(index, slide, self.index) for index, slide in enumerate(self.presentation.slides)
+        ]
+        self.skeleton = _skeleton(blob)
+        with zipfile.ZipFile(io.BytesIO(self.skeleton)) as skeleton:
+            self.skeleton_entries = [
+                (name, skeleton.read(name))
+                for name in skeleton.namelist()
+                if name not in (_CONTENT_TYPES, _PRESENTATION, _PRESENTATION_RELS)
+            ]
+            self.skeleton_presentation = skeleton.read(_PRESENTATION)
+            self.skeleton_presentation_rels = skeleton.read(_PRESENTATION_RELS)
+            self.skeleton_content_types = skeleton.read(_CONTENT_TYPES)
+
+    def new_deck(self):
+        return Deck(self)
+
+    def render(self, slides_content, rng=None):
+        """
+        Builds a deck from slide specs.
+
+        Args:
+            slides_content (list): Dicts with a "type" (see SLIDE_TYPE_RANGES) and the
+                text of each placeholder key, e.g. {"type": "Title", "title": "Overview"}.
+            rng (random.Random, optional): Picks the template slide of each type.
+
+        Returns:
+            Deck: The deck, ready to `save`.
+        """
+        deck = self.new_deck()
+        for slide_data in slides_content:
+            index = pick_template_slide_index(slide_data["type"], rng, self.slide_types)
+            deck.add_slide(index, slide_data)
+        return deck
+
+    def write(self, target, slides_content, rng=None):
+        """
+        Like `render`, but writes each slide to `target` (path or binary stream) as it is built.
+
+        Returns:
+            int: Number of slides written.
+        """
+        with DeckWriter(self, target) as deck:
+            for slide_data in slides_content:
+                index = pick_template_slide_index(slide_data["type"], rng, self.slide_types)
+                deck.add_slide(index, slide_data)
+        return deck.slide_count
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_template(template_path):
+    """Returns the engine of a template, parsed once per process (and again if the file changes)."""
+    stat = os.stat(template_path)
+    key = (os.path.abspath(template_path), stat.st_mtime_ns, stat.st_size)
+    with _templates_lock:
+        engine = _templates.get(key)
+        if engine is None:
+            engine = _templates[key] = TemplateEngine(template_path)
+        return engine
+
+
+@dataclass
+class DeckResult:
+    """
+    Outcome of one deck of `build_presentations`.
+
+    Attributes:
+        output_path (str): Where the deck was written.
+        slides (int): Slides written.
+        seconds (float): Rendering and writing time in the worker.
+        worker_peak_rss_mb (float): Peak resident memory of the worker process so far.
+        error (str): Why the deck failed, or None.
+    """
+    output_path: str
+    slides: int = 0
+    seconds: float = 0.0
+    worker_peak_rss_mb: float = 0.0
+    error: str = None
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def _init_deck_worker(template_path, max_memory_mb):
+    """Worker initializer: caps the address space, then parses the template once for this worker."""
+    if resource is not None and max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    get_template(template_path)
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _write_deck(template_path, output_path, slides_content):
+    start = time.perf_counter()
+    try:
+        slides = get_template(template_path).write(output_path, slides_content)
+    except Exception as exc:
+        # The deck fails alone: don't leave it truncated, and free what it held.
+        _remove(output_path)
+        if isinstance(exc, MemoryError):
+            error = "out of memory (worker memory limit reached)"
+        else:
+            error = f"{type(exc).__name__}: {exc}"
+        return DeckResult(output_path, error=error, worker_peak_rss_mb=_peak_rss_mb())
+    return DeckResult(output_path, slides, time.perf_counter() - start, _peak_rss_mb())
+
+
+def build_presentations(template_path, decks, workers=None, max_memory_mb=None, decks_per_worker=None):
+    """
+    Renders many decks with one template on a process pool, each written straight to its file.
+
+    Every worker parses the template once, runs with its address space capped
+    at `max_memory_mb` (a deck that exceeds it, or fails in any other way,
+    fails alone, with an error; a dying worker fails the decks queued at the time) and
+    is replaced after `decks_per_worker` decks, so that memory fragmentation
+    can't accumulate. At most two decks per worker are queued at a time, so
+    `decks` can be a lazy iterable of any length.
+
+    Args:
+        template_path (str): The template .pptx.
+        decks (iterable): (output_path, slides_content) pairs, see `TemplateEngine.render`.
+        workers (int, optional): Worker processes. Defaults to config.PPTX_WORKERS.
+        max_memory_mb (int, optional): Address-space limit per worker, 0 for none.
+            Defaults to config.PPTX_WORKER_MAX_MEMORY_MB.
+        decks_per_worker (int, optional): Decks a worker renders before it is replaced.
+            Defaults to config.PPTX_DECKS_PER_WORKER.
+
+    Yields:
+        DeckResult: One per deck, in completion order.
+    """
+    workers = workers or config.PPTX_WORKERS
+    max_memory_mb = config.PPTX_WORKER_MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb
+    decks_per_worker = decks_per_worker or config.PPTX_DECKS_PER_WORKER
+    template_path = os.path.abspath(template_path)
+
+    def new_pool():
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_deck_worker,
+            initargs=(template_path, max_memory_mb),
+            max_tasks_per_child=decks_per_worker,
+        )
+
+    def results(done):
+        for future in done:
+            output_path = pending.pop(future)
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer): every deck it had queued fails.
+                _remove(output_path)
+                yield DeckResult(output_path, error="worker process died")
+
+    pool = new_pool()
+    pending = {}
+    try:
+        for output_path, slides_content in decks:
+            slides_content = list(slides_content)
+            try:
+                future = pool.submit(_write_deck, template_path, output_path, slides_content)
+            except BrokenProcessPool:
+                pool.shutdown(wait=False)
+                pool = new_pool()
+                future = pool.submit(_write_deck, template_path, output_path, slides_content)
+            pending[future] = output_path
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from results(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from results(done)
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown()
+
+
+def pick_template_slide_index(slide_type, rng=None, slide_types=None):
+    """
+    Pick a random template slide index based on slide type.
+
+    Args:
+        slide_type (str): "Title", "Content1", ...
+        rng (random.Random, optional): Source of randomness.
+        slide_types (dict, optional): Slide type -> template slide indices (e.g.
+            `ShapeIndex.slide_types()`). Defaults to SLIDE_TYPE_RANGES.
+    """
+    choices = (slide_types or {}).get(slide_type) or SLIDE_TYPE_RANGES.get(slide_type)
+    if not choices:
+        raise ValueError("Unknown slide type " + slide_type)
+    return (rng or random).choice(choices)
+
+
+def fill_placeholders(slide, data):
+    """
+    Replace placeholder text while keeping all font properties from the template.
+
+    For slides not built by a `Deck` (which fills from its catalog instead).
+    """
+    for shape in slide.shapes:
+        if not shape.has_text_frame:
+            continue
+        key = shape.text_frame.text.strip().lower()
+        if key in data:
+            tx_body = shape._element.find(qn("p:txBody"))
+            first_run = tx_body.find(qn("a:p") + "/" + qn("a:r"))
+            run_properties = first_run.find(qn("a:rPr")) if first_run is not None else None
+            _fill(shape._element, Placeholder(key, 0, run_properties), str(data[key]))
+
+
+def build_presentation(template_path, slides_content, output_path):
+    """
+    Builds a deck from `slides_content` with the template at `template_path`.
+
+    Args:
+        template_path (str): The template .pptx (parsed once per process).
+        slides_content (list): Slide specs, see `TemplateEngine.render`.
+        output_path (str or file): Where to write the deck.
+
+    Returns:
+        pptx.presentation.Presentation: The generated presentation.
+    """
+    deck = get_template(template_path).render(slides_content)
+    deck.save(output_path)
+    return deck.presentation
@@ -0,0 +1,352 @@
+"""
+Shape index of a .pptx, built in one pass over each slide's XML part.
+
+Inspecting a template through python-pptx builds a proxy object for every
+shape and re-walks the slide for every question. `ShapeIndex` reads the
+package with zipfile and lxml only, visits every shape once (groups
+included) and keeps what the inspection queries need in flat, column-wise
+numpy arrays, one row per shape:
+
+- shapes are stored in document order, depth first, so the shapes of a slide
+  and the descendants of a group are contiguous ranges (`slide_starts`,
+  `subtree_end`);
+- `kind`, `flags`, `depth`, `parent` and `position` describe each shape;
+  names, texts and placeholder keys are parallel Python lists.
+
+Queries (counting and listing text boxes, counting pictures and picture
+fills, finding placeholders, telling slide types apart) are then slices and
+masks over those arrays. The answers match the python-pptx helpers in
+`Extra code/testppt.ipynb`.
+"""
+import io
+import os
+import posixpath
+import threading
+import zipfile
+from dataclasses import dataclass
+
+import numpy as np
+from lxml import etree
+
+_P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PR = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Shape kinds (the `kind` column), by element tag.
+SHAPE, GROUP, PICTURE, GRAPHIC_FRAME, CONNECTOR, CONTENT_PART = range(6)
+_KINDS = {
+    _P + "sp": SHAPE,
+    _P + "grpSp": GROUP,
+    _P + "pic": PICTURE,
+    _P + "graphicFrame": GRAPHIC_FRAME,
+    _P + "cxnSp": CONNECTOR,
+    _P + "contentPart": CONTENT_PART,
+}
+KIND_NAMES = ("shape", "group", "picture", "graphic_frame", "connector", "content_part")
+# Non-visual properties element of each kind (holds cNvPr and nvPr).
+_NON_VISUAL = tuple(
+    _P + tag for tag in ("nvSpPr", "nvGrpSpPr", "nvPicPr", "nvGraphicFramePr", "nvCxnSpPr", "nvContentPartPr")
+)
+_MEDIA_TAGS = tuple(_A + tag for tag in ("videoFile", "audioFile", "quickTimeFile"))
+
+# Bits of the `flags` column.
+HAS_TEXT_FRAME = 1  # a p:sp (python-pptx: `shape.has_text_frame`)
+TEXT_BOX = 2  # a p:sp with txBox="1" (`MSO_SHAPE_TYPE.TEXT_BOX` unless a placeholder)
+IMAGE = 4  # a picture that isn't a placeholder or a movie (`MSO_SHAPE_TYPE.PICTURE`)
+PICTURE_FILL = 8  # a p:sp filled with a picture (`shape.fill.type == MSO_FILL.PICTURE`)
+PLACEHOLDER = 16  # has a p:ph (layout placeholder)
+MEDIA = 32  # a movie or audio picture
+
+
+@dataclass
+class IndexedShape:
+    """
+    One shape of the index, as returned by the listing queries.
+
+    Attributes:
+        id (int): Row of the shape in the index.
+        slide (int): Slide index.
+        name (str): The shape's name (`p:cNvPr/@name`).
+        kind (str): One of KIND_NAMES.
+        depth (int): 0 for shapes directly on the slide, +1 per enclosing group.
+        position (int): Index of the shape among its parent element's children.
+        text (str): Text of its text frame ("" if none), as `shape.text`.
+        placeholder (str): Layout placeholder type ("body", "title", ...), or None.
+    """
+    id: int
+    slide: int
+    name: str
+    kind: str
+    depth: int
+    position: int
+    text: str
+    placeholder: str = None
+
+
+def _text(tx_body):
+    """Text of a `p:txBody` / `a:txBody`, as python-pptx's `text_frame.text`."""
+    paragraphs = []
+    for paragraph in tx_body.iterchildren(_A + "p"):
+        parts = []
+        for element in paragraph:
+            if element.tag in (_A + "r", _A + "fld"):
+                text = next(element.iterchildren(_A + "t"), None)
+                parts.append(text.text or "" if text is not None else "")
+            elif element.tag == _A + "br":
+                parts.append("\v")
+        paragraphs.append("".join(parts))
+    return "\n".join(paragraphs)
+
+
+def _slide_partnames(package):
+    """Part names of the slides in presentation order (via presentation.xml and its rels)."""
+    presentation = etree.fromstring(package.read("ppt/presentation.xml"))
+    rels = etree.fromstring(package.read("ppt/_rels/presentation.xml.rels"))
+    targets = {
+        rel.get("Id"): posixpath.normpath(posixpath.join("ppt", rel.get("Target")))
+        for rel in rels.iter(_PR + "Relationship")
+        if rel.get("TargetMode") != "External"
+    }
+    slide_ids = presentation.find(_P + "sldIdLst")
+    if slide_ids is None:
+        return []
+    return [targets[slide_id.get(_R + "id")].lstrip("/") for slide_id in slide_ids]
+
+
+class ShapeIndex:
+    """
+    Column-wise index of every shape of a presentation.
+
+    Build it with `ShapeIndex.from_file` / `from_bytes`, or `get_index` (cached per file).
+
+    Attributes:
+        slide_partnames (list): Zip member of each slide, in presentation order.
+        slide_starts (np.ndarray): Rows [slide_starts[i], slide_starts[i + 1]) are slide i's shapes.
+        kind, flags, depth (np.ndarray): int8/uint8 per shape, see the module constants.
+        parent (np.ndarray): Row of the enclosing group, -1 at the top level.
+        position (np.ndarray): Index among the parent element's children (`spTree[position]`).
+        subtree_end (np.ndarray): End of the shape's row range (itself plus its descendants).
+        names, texts, keys, placeholder_types (list): Name, text frame text, placeholder key
+            (lowercased stripped text) and `p:ph/@type` of each shape.
+    """
+
+    def __init__(self, slide_partnames, columns, names, texts, keys, placeholder_types):
+        self.slide_partnames = slide_partnames
+        self.slide_starts = np.asarray(columns["slide_starts"], dtype=np.int32)
+        self.slide = np.asarray(columns["slide"], dtype=np.int32)
+        self.kind = np.asarray(columns["kind"], dtype=np.int8)
+        self.flags = np.asarray(columns["flags"], dtype=np.uint8)
+        self.depth = np.asarray(columns["depth"], dtype=np.int8)
+        self.parent = np.asarray(columns["parent"], dtype=np.int32)
+        self.position = np.asarray(columns["position"], dtype=np.int32)
+        self.subtree_end = np.asarray(columns["subtree_end"], dtype=np.int32)
+        self.names = names
+        self.texts = texts
+        self.keys = keys
+        self.placeholder_types = placeholder_types
+
+    @classmethod
+    def from_file(cls, path):
+        with zipfile.ZipFile(path) as package:
+            return cls._build(package)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        with zipfile.ZipFile(io.BytesIO(blob)) as package:
+            return cls._build(package)
+
+    @classmethod
+    def _build(cls, package):
+        slide_partnames = _slide_partnames(package)
+        columns = {name: [] for name in ("slide", "kind", "flags", "depth", "parent", "position", "subtree_end")}
+        columns["slide_starts"] = []
+        names, texts, keys, placeholder_types = [], [], [], []
+
+        for slide_number, partname in enumerate(slide_partnames):
+            columns["slide_starts"].append(len(names))
+            root = etree.fromstring(package.read(partname))
+            shape_tree = root.find(f"{_P}cSld/{_P}spTree")
+            if shape_tree is None:
+                continue
+
+            # Depth-first, in document order: (element, depth, parent row, position); a None
+            # element closes the group whose row is `parent` (its subtree ends here).
+            stack = [(child, 0, -1, position) for position, child in reversed(list(enumerate(shape_tree)))]
+            while stack:
+                element, depth, parent, position = stack.pop()
+                if element is None:
+                    columns["subtree_end"][parent] = len(names)
+                    continue
+                kind = _KINDS.get(element.tag)
+                if kind is None:
+                    continue  # nvGrpSpPr, grpSpPr, extLst, mc:AlternateContent...
+
+                row = len(names)
+                # Children by tag, one pass each, rather than `find` calls (several µs each).
+                parts = {child.tag: child for child in element}
+                non_visual = parts.get(_NON_VISUAL[kind])
+                nv = {child.tag: child for child in non_visual} if non_visual is not None else {}
+                properties = nv.get(_P + "cNvPr")
+                nv_pr = nv.get(_P + "nvPr")
+                nv_pr_parts = {child.tag: child for child in nv_pr} if nv_pr is not None else {}
+                ph = nv_pr_parts.get(_P + "ph")
+
+                flags = PLACEHOLDER if ph is not None else 0
+                text = key = ""
+                if kind == SHAPE:
+                    flags |= HAS_TEXT_FRAME
+                    shape_properties = nv.get(_P + "cNvSpPr")
+                    if shape_properties is not None and shape_properties.get("txBox") in ("1", "true"):
+                        flags |= TEXT_BOX
+                    sp_pr = parts.get(_P + "spPr")
+                    if sp_pr is not None and any(child.tag == _A + "blipFill" for child in sp_pr):
+                        flags |= PICTURE_FILL
+                    tx_body = parts.get(_P + "txBody")
+                    if tx_body is not None:
+                        text = _text(tx_body)
+                        key = text.strip().lower()
+                elif kind == PICTURE:
+                    if any(tag in nv_pr_parts for tag in _MEDIA_TAGS):
+                        flags |= MEDIA
+                    elif ph is None:
+                        flags |= IMAGE
+
+                columns["slide"].append(slide_number)
+                columns["kind"].append(kind)
+                columns["flags"].append(flags)
+                columns["depth"].append(depth)
+                columns["parent"].append(parent)
+                columns["position"].append(position)
+                columns["subtree_end"].append(row + 1)
+                names.append(properties.get("name", "") if properties is not None else "")
+                texts.append(text)
+                keys.append(key)
+                placeholder_types.append((ph.get("type") or "body") if ph is not None else None)
+
+                if kind == GROUP:
+                    stack.append((None, depth, row, position))
+                    stack.extend(
+                        (child, depth + 1, row, child_position)
+                        for child_position, child in reversed(list(enumerate(element)))
+                    )
+        columns["slide_starts"].append(len(names))
+        return cls(slide_partnames, columns, names, texts, keys, placeholder_types)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def slide_count(self):
+        return len(self.slide_partnames)
+
+    def _rows(self, slide, recursive):
+        """Rows of a slide's shapes: all of them, or only those directly on the slide."""
+        rows = np.arange(self.slide_starts[slide], self.slide_starts[slide + 1])
+        return rows if recursive else rows[self.depth[rows] == 0]
+
+    def shape(self, row):
+        return IndexedShape(
+            id=int(row),
+            slide=int(self.slide[row]),
+            name=self.names[row],
+            kind=KIND_NAMES[self.kind[row]],
+            depth=int(self.depth[row]),
+            position=int(self.position[row]),
+            text=self.texts[row],
+            placeholder=self.placeholder_types[row],
+        )
+
+    def count_textboxes(self, slide, recursive=False):
+        """Shapes of a slide that have a text frame (top-level only by default, like `slide.shapes`)."""
+        rows = self._rows(slide, recursive)
+        return int(np.count_nonzero(self.flags[rows] & HAS_TEXT_FRAME))
+
+    def get_textboxes(self, slide, recursive=False):
+        """The shapes counted by `count_textboxes`, as IndexedShape."""
+        rows = self._rows(slide, recursive)
+        return [self.shape(row) for row in rows[(self.flags[rows] & HAS_TEXT_FRAME) != 0]]
+
+    def count_images(self, slide, recursive=True):
+        """
+        Pictures on a slide.
+
+        With `recursive` (the default), also counts picture-filled shapes and
+        looks inside groups, as `count_images_in_shape` over every shape;
+        otherwise counts only the pictures directly on the slide.
+        """
+        if not recursive:
+            rows = self._rows(slide, False)
+            return int(np.count_nonzero(self.flags[rows] & IMAGE))
+        start, end = self.slide_starts[slide], self.slide_starts[slide + 1]
+        return int(np.count_nonzero(self.flags[start:end] & (IMAGE | PICTURE_FILL)))
+
+    def count_images_in_shape(self, row):
+        """Pictures and picture-filled shapes in a shape and, for a group, everything it contains."""
+        return int(np.count_nonzero(self.flags[row:self.subtree_end[row]] & (IMAGE | PICTURE_FILL)))
+
+    def image_counts(self):
+        """`count_images(slide)` of every slide, in one vectorized pass."""
+        images = ((self.flags & (IMAGE | PICTURE_FILL)) != 0).astype(np.int64)
+        totals = np.concatenate(([0], np.cumsum(images)))
+        return totals[self.slide_starts[1:]] - totals[self.slide_starts[:-1]]
+
+    def placeholders(self, slide):
+        """Placeholder key -> rows of the top-level text frames of a slide whose whole text is that key."""
+        found = {}
+        for row in self._rows(slide, False):
+            if self.flags[row] & HAS_TEXT_FRAME and self.keys[row]:
+                found.setdefault(self.keys[row], []).append(int(row))
+        return found
+
+    def slide_types(self):
+        """
+        Slide type -> template slide indices, from each slide's placeholder keys.
+
+        A slide with "contentN" placeholders is of type "ContentN" (the largest
+        N); one with a "title" placeholder but no content is a "Title" slide;
+        other slides are left out.
+        """
+        types = {}
+        for slide in range(self.slide_count):
+            keys = self.placeholders(slide)
+            numbers = [int(key[7:]) for key in keys if key.startswith("content") and key[7:].isdigit()]
+            if numbers:
+                types.setdefault(f"Content{max(numbers)}", []).append(slide)
+            elif "title" in keys:
+                types.setdefault("Title", []).append(slide)
+        return types
+
+    def find_slides(self, keys):
+        """Slides whose placeholder keys are exactly `keys` (case-insensitive)."""
+        wanted = {key.lower() for key in keys}
+        return [slide for slide in range(self.slide_count) if set(self.placeholders(slide)) == wanted]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path):
+    """Returns the shape index of a .pptx, built once per process (and again if the file changes)."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is None:
+        index = ShapeIndex.from_file(path)
+        with _indexes_lock:
+            _indexes[key] = index
+    return index
+
+
+def count_textboxes(path, slide):
+    return get_index(path).count_textboxes(slide)
+
+
+def get_textboxes(path, slide):
+    return get_index(path).get_textboxes(slide)
+
+
+def count_images(path, slide):
+    return get_index(path).count_images(slide)
@@ -0,0 +1,261 @@
+"""
+In-process cache of finished summaries, with in-flight request coalescing.
+
+Entries are keyed by a content hash of the input document and a canonical
+tuple of the summary options, expire after a TTL and are evicted least
+recently used beyond a maximum size. Concurrent identical requests share one
+computation: the first caller computes, the others wait for its result (or
+its exception, which is never cached).
+
+`stats()` reports hits, misses and coalesced requests, i.e. how many
+pipeline runs and paid LLM calls the cache saved.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app import config
+from app.services.embedding_cache import normalize_text
+
+
+def hash_text(text):
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def hash_file(file_path, block_size=1 << 20):
+    """Content hash of a file, read in blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# app.config settings that change a summary, part of every cache key: models and
+# provider, embedding backend (quantized vectors change chunking and clustering),
+# prompt budget, summary mode, map-reduce tree and extractive engine.
+OUTPUT_SETTINGS = (
+    "LLM_PROVIDER", "COHERE_MODEL", "LLM_MAX_OUTPUT_TOKENS",
+    "LLM_CONTEXT_WINDOW", "LLM_MAX_PROMPT_TOKENS", "LLM_TOKEN_SAFETY_MARGIN",
+    "EMBEDDING_MODEL", "EMBEDDING_BACKEND",
+    "SUMMARY_MODE",
+    "MAP_REDUCE_GROUP_BY", "MAP_REDUCE_GROUP_TOKENS", "MAP_REDUCE_FAN_OUT", "MAP_REDUCE_MAX_DEPTH",
+    "MAP_REDUCE_PARTIAL_WORDS",
+    "EXTRACTIVE_LOCAL", "EXTRACTIVE_FALLBACK", "EXTRACTIVE_FALLBACK_AFTER", "EXTRACTIVE_METHOD",
+    "EXTRACTIVE_DIVERSITY",
+)
+
+# Options the pipeline lowercases before use (PromptBuilder); every other string
+# option reaches the prompt or a comparison as given, so its case matters.
+CASE_INSENSITIVE_OPTIONS = frozenset({"summary_tone"})
+
+
+def canonical_value(value):
+    """Hashable, normalized form of an option value (whitespace-insensitive strings)."""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical_value(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, canonical_value(item)) for key, item in value.items()))
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def summary_key(file_path, text, options):
+    """
+    Cache key of one summary request.
+
+    Args:
+        file_path (str): Input file, hashed by content (only used when `text` is
+            None or a section of the file is requested).
+        text (str): Input text, hashed after whitespace normalization.
+        options (dict): Every summarize_document option, defaults included.
+            Strings are compared with normalized whitespace, and case-insensitively
+            only for CASE_INSENSITIVE_OPTIONS.
+
+    Returns:
+        str: Hex digest of the document hash, the canonical options and the
+            settings that change the output (OUTPUT_SETTINGS).
+    """
+    documents = []
+    if text is not None:
+        documents.append(("text", hash_text(text)))
+    if file_path is not None and (text is None or options.get("paragraph_title")):
+        documents.append(("file", hash_file(file_path)))
+
+    canonical = {}
+    for name, value in sorted(options.items()):
+        # A structure is a template file: what matters is its content, not its path.
+        if name == "structure" and value is not None:
+            value = hash_file(value)
+        value = canonical_value(value)
+        if name in CASE_INSENSITIVE_OPTIONS and isinstance(value, str):
+            value = value.lower()
+        canonical[name] = value
+
+    settings = tuple(getattr(config, name) for name in OUTPUT_SETTINGS)
+    payload = repr((tuple(documents), tuple(canonical.items()), settings))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """
+    TTL + LRU cache with coalescing of concurrent computations.
+
+    Args:
+        max_entries (int): Entries kept before evicting the least recently used.
+        ttl (float): Seconds an entry stays valid.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for `key`, or computes it once with `compute()`.
+
+        Callers arriving while the same key is being computed wait for that
+        computation instead of starting their own.
+        """
+        found, value, future = self.claim(key)
+        if found:
+            return value
+        if future is not None:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as exc:
+            self.abandon(key, exc)
+            raise
+        self.resolve(key, value)
+        return value
+
+    def claim(self, key, owner=None):
+        """
+        Looks `key` up and, when it is missing, either joins its computation or starts one.
+
+        Args:
+            key (str): Cache key.
+            owner (object, optional): Stored as the `owner` attribute of the in-flight
+                future, so that callers joining it can follow the computation (e.g. a job's stream).
+
+        Returns:
+            tuple: (found, value, future). When not found, `future` is the in-flight
+            computation of another caller, or None when this caller now owns it and
+            must end it with `resolve` or `abandon`.
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return True, value, None
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return False, None, future
+            future = Future()
+            future.owner = owner
+            self._in_flight[key] = future
+            self.misses += 1
+            return False, None, None
+
+    def resolve(self, key, value, store=True):
+        """Ends a claimed computation with its value (cached unless `store` is False)."""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+            if store:
+                self._store(key, value)
+        if future is not None:
+            future.set_result(value)
+
+    def abandon(self, key, exc):
+        """Ends a claimed computation with an error, raised in the callers waiting for it."""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_exception(exc)
+
+    def get(self, key, default=None):
+        """Returns the cached value for `key` (counted as a hit or a miss), or `default`."""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Stores a value computed outside `get_or_compute` (e.g. assembled from a stream)."""
+        with self._lock:
+            self._store(key, value)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drops one entry, or every entry when `key` is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / requests if requests else 0.0,
+                "computations_saved": self.hits + self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "in_flight": len(self._in_flight),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Returns the process-wide summary cache configured in app.config."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(config.RESULT_CACHE_MAX_ENTRIES, config.RESULT_CACHE_TTL)
+        return _cache
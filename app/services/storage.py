@@ -0,0 +1,475 @@
+"""
+File storage (uploaded documents and generated decks).
+
+Transfers are streamed so that memory per transfer stays constant whatever
+the file size (scanned PDFs run to hundreds of MB):
+
+- uploads larger than one chunk go through an upload session, split into
+  `config.STORAGE_CHUNK_SIZE` parts sent `config.STORAGE_PARALLEL_PARTS` at a
+  time (a concurrent session, so parts may arrive in any order); at most that
+  many parts are in memory at once;
+- downloads are written to disk as they arrive, large files in parallel
+  byte ranges written at their offsets; `iter_download` yields the bytes
+  instead, and `download_temp` hands a local copy to the ingestion pipeline;
+- one authenticated client, with a pooled HTTP session, is shared by every
+  transfer of the process.
+
+Backends: "dropbox", and "local", a directory on disk with the same interface
+and the same chunked transfer paths, for tests and offline work. Others can be added with `register_backend`.
+"""
+import contextlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from app import config
+
+# Concurrent upload sessions require every part but the last to be a multiple of 4 MiB.
+_SESSION_ALIGNMENT = 4 * 1024 * 1024
+# Buffer of the streamed copies (download bodies, local files).
+_COPY_BUFFER = 1024 * 1024
+
+
+class StorageError(RuntimeError):
+    """Raised when a transfer fails (wraps the backend's own error)."""
+
+
+@dataclass
+class StoredFile:
+    """
+    A file in storage.
+
+    Attributes:
+        path (str): Its path in storage, e.g. "/uploads/<uid>/<name>.pdf".
+        size (int): Size in bytes.
+        rev (str): Backend revision (None when the backend has none).
+        content_hash (str): Backend content hash (None when the backend has none).
+    """
+    path: str
+    size: int
+    rev: str = None
+    content_hash: str = None
+
+
+def _parts(size, chunk_size):
+    """(offset, length) of each part of a `size`-byte file."""
+    return [(offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size)]
+
+
+def _aligned(chunk_size):
+    return max(_SESSION_ALIGNMENT, chunk_size // _SESSION_ALIGNMENT * _SESSION_ALIGNMENT)
+
+
+def _read_at(fd, offset, length):
+    data = os.pread(fd, length, offset)
+    if len(data) != length:
+        raise StorageError(f"File changed during upload (short read at offset {offset})")
+    return data
+
+
+def _partial_path(local_path):
+    """Temporary name next to `local_path`, renamed over it once the download completes."""
+    directory, name = os.path.split(os.path.abspath(local_path))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f".{name}.part")
+
+
+class _ChunkedStorage:
+    """
+    Chunked, parallel transfers on top of a backend's primitives: one-call
+    uploads, upload sessions (start, append a part at an offset, finish), and
+    downloads of a whole file or of a byte range. Backends set `chunk_size`
+    and `parallel_parts`.
+    """
+
+    def upload(self, local_path, remote_path, overwrite=True):
+        """
+        Uploads a local file; large files in parallel parts of a concurrent upload session.
+
+        Returns:
+            StoredFile: The uploaded file.
+        """
+        size = os.path.getsize(local_path)
+        with open(local_path, "rb") as source:
+            if size <= self.chunk_size:
+                return self._upload_small(source.read(), remote_path, overwrite)
+            if self.parallel_parts == 1:
+                return self.upload_fileobj(source, remote_path, overwrite)
+
+            fd = source.fileno()
+            session_id = self._session_start(b"", concurrent=True)
+
+            def send(part):
+                offset, length = part
+                # The part is read in the worker, so only parts being sent are in memory.
+                self._session_append(session_id, offset, _read_at(fd, offset, length), close=offset + length == size)
+
+            try:
+                with ThreadPoolExecutor(self.parallel_parts, thread_name_prefix="storage-upload") as pool:
+                    list(pool.map(send, _parts(size, self.chunk_size)))
+                return self._session_finish(session_id, size, b"", remote_path, overwrite)
+            except BaseException:
+                self._session_abort(session_id)
+                raise
+
+    def upload_fileobj(self, fileobj, remote_path, overwrite=True):
+        """Uploads a readable binary stream (e.g. a request body) part by part, in order."""
+        chunk = fileobj.read(self.chunk_size)
+        following = fileobj.read(self.chunk_size)
+        if not following:
+            return self._upload_small(chunk, remote_path, overwrite)
+
+        session_id = self._session_start(chunk)
+        offset = len(chunk)
+        try:
+            while True:
+                chunk, following = following, fileobj.read(self.chunk_size)
+                if not following:
+                    return self._session_finish(session_id, offset, chunk, remote_path, overwrite)
+                self._session_append(session_id, offset, chunk)
+                offset += len(chunk)
+        except BaseException:
+            self._session_abort(session_id)
+            raise
+
+    def _download_range(self, remote_path, rev, fd, offset, length):
+        position = offset
+        for block in self._iter_range(remote_path, rev, offset, length):
+            os.pwrite(fd, block, position)
+            position += len(block)
+        if position != offset + length:
+            raise StorageError(f"Short read of {remote_path} at offset {offset}")
+
+    def download(self, remote_path, local_path):
+        """
+        Downloads a file to `local_path` (replaced only once complete); large files in parallel ranges.
+
+        Returns:
+            StoredFile: The downloaded file.
+        """
+        stored = self.metadata(remote_path)
+        partial = _partial_path(local_path)
+        try:
+            if stored.size <= self.chunk_size or self.parallel_parts == 1:
+                with open(partial, "wb") as target:
+                    for block in self.iter_download(remote_path):
+                        target.write(block)
+            else:
+                with open(partial, "wb") as target:
+                    target.truncate(stored.size)
+                    fd = target.fileno()
+                    with ThreadPoolExecutor(self.parallel_parts, thread_name_prefix="storage-download") as pool:
+                        list(pool.map(
+                            lambda part: self._download_range(remote_path, stored.rev, fd, *part),
+                            _parts(stored.size, self.chunk_size),
+                        ))
+            os.replace(partial, local_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(partial)
+            raise
+        return stored
+
+    def _session_abort(self, session_id):
+        """Drops what a failed upload session left behind (nothing by default)."""
+
+
+class DropboxStorage(_ChunkedStorage):
+    """
+    Dropbox backend.
+
+    Args:
+        access_token (str, optional): Defaults to config.DROPBOX_ACCESS_TOKEN.
+        refresh_token, app_key, app_secret (str, optional): Long-lived credentials, used
+            instead of a short-lived access token when set. Default to config.DROPBOX_*.
+        chunk_size (int, optional): Part size in bytes. Defaults to config.STORAGE_CHUNK_SIZE.
+        parallel_parts (int, optional): Parts in flight per transfer. Defaults to config.STORAGE_PARALLEL_PARTS.
+        max_connections (int, optional): HTTP connection pool size. Defaults to config.STORAGE_MAX_CONNECTIONS.
+        timeout (float, optional): Seconds per request. Defaults to config.STORAGE_TIMEOUT.
+    """
+
+    def __init__(self, access_token=None, refresh_token=None, app_key=None, app_secret=None,
+                 chunk_size=None, parallel_parts=None, max_connections=None, timeout=None):
+        import dropbox
+
+        self._dropbox = dropbox
+        self.chunk_size = _aligned(chunk_size or config.STORAGE_CHUNK_SIZE)
+        self.parallel_parts = max(1, parallel_parts or config.STORAGE_PARALLEL_PARTS)
+        self.session = dropbox.create_session(max_connections=max_connections or config.STORAGE_MAX_CONNECTIONS)
+        refresh_token = refresh_token or config.DROPBOX_REFRESH_TOKEN
+        if refresh_token:
+            credentials = {
+                "oauth2_refresh_token": refresh_token,
+                "app_key": app_key or config.DROPBOX_APP_KEY,
+                "app_secret": app_secret or config.DROPBOX_APP_SECRET,
+            }
+        else:
+            credentials = {"oauth2_access_token": access_token or config.DROPBOX_ACCESS_TOKEN}
+        self.client = dropbox.Dropbox(
+            session=self.session, timeout=timeout or config.STORAGE_TIMEOUT, **credentials
+        )
+
+    @staticmethod
+    def _stored(metadata):
+        return StoredFile(metadata.path_display, metadata.size, metadata.rev, metadata.content_hash)
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except self._dropbox.exceptions.DropboxException as exc:
+            raise StorageError(str(exc)) from exc
+
+    def _mode(self, overwrite):
+        files = self._dropbox.files
+        return files.WriteMode.overwrite if overwrite else files.WriteMode.add
+
+    def _upload_small(self, data, remote_path, overwrite):
+        return self._stored(self._call(self.client.files_upload, data, remote_path, mode=self._mode(overwrite)))
+
+    def _session_start(self, data, concurrent=False):
+        files = self._dropbox.files
+        session_type = files.UploadSessionType.concurrent if concurrent else None
+        return self._call(self.client.files_upload_session_start, data, session_type=session_type).session_id
+
+    def _session_append(self, session_id, offset, data, close=False):
+        cursor = self._dropbox.files.UploadSessionCursor(session_id=session_id, offset=offset)
+        self._call(self.client.files_upload_session_append_v2, data, cursor, close=close)
+
+    def _session_finish(self, session_id, offset, data, remote_path, overwrite):
+        files = self._dropbox.files
+        metadata = self._call(
+            self.client.files_upload_session_finish,
+            data,
+            files.UploadSessionCursor(session_id=session_id, offset=offset),
+            files.CommitInfo(path=remote_path, mode=self._mode(overwrite)),
+        )
+        return self._stored(metadata)
+
+    def metadata(self, remote_path):
+        return self._stored(self._call(self.client.files_get_metadata, remote_path))
+
+    def iter_download(self, remote_path, chunk_size=_COPY_BUFFER):
+        """Yields the bytes of a file as they arrive."""
+        _, response = self._call(self.client.files_download, remote_path)
+        try:
+            yield from response.iter_content(chunk_size)
+        finally:
+            response.close()
+
+    def _iter_range(self, remote_path, rev, offset, length):
+        # A client sharing the pooled session and credentials, sending a Range header.
+        ranged = self.client.clone(headers={"Range": f"bytes={offset}-{offset + length - 1}"})
+        _, response = self._call(ranged.files_download, remote_path, rev=rev)
+        try:
+            yield from response.iter_content(_COPY_BUFFER)
+        finally:
+            response.close()
+
+    def shared_link(self, remote_path):
+        """URL of a shared link to the file (the existing one if it was already shared)."""
+        try:
+            return self.client.sharing_create_shared_link_with_settings(remote_path).url
+        except self._dropbox.exceptions.ApiError as exc:
+            if not (hasattr(exc.error, "is_shared_link_already_exists") and exc.error.is_shared_link_already_exists()):
+                raise StorageError(str(exc)) from exc
+        links = self._call(self.client.sharing_list_shared_links, path=remote_path, direct_only=True).links
+        if not links:
+            raise StorageError(f"No shared link for {remote_path}")
+        return links[0].url
+
+    def delete(self, remote_path):
+        self._call(self.client.files_delete_v2, remote_path)
+
+    def close(self):
+        self.session.close()
+
+
+class LocalStorage(_ChunkedStorage):
+    """
+    Storage in a local directory, with the interface of DropboxStorage (for tests and offline work).
+
+    Transfers take the same chunked paths as DropboxStorage: upload sessions are
+    files under the root that parts are written into at their offsets, and
+    large downloads are reassembled from byte ranges, so tests can exercise
+    part splitting and reassembly with a small `chunk_size`.
+
+    Args:
+        root (str, optional): Directory holding the files. Defaults to config.STORAGE_LOCAL_ROOT.
+        chunk_size (int, optional): Part size in bytes. Defaults to config.STORAGE_CHUNK_SIZE.
+        parallel_parts (int, optional): Parts in flight per transfer. Defaults to config.STORAGE_PARALLEL_PARTS.
+    """
+
+    _SESSIONS = ".upload-sessions"
+
+    def __init__(self, root=None, chunk_size=None, parallel_parts=None):
+        self.root = Path(root or config.STORAGE_LOCAL_ROOT).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size or config.STORAGE_CHUNK_SIZE
+        self.parallel_parts = max(1, parallel_parts or config.STORAGE_PARALLEL_PARTS)
+        self._sessions = self.root / self._SESSIONS
+        self._sessions.mkdir(exist_ok=True)
+
+    def _path(self, remote_path):
+        path = (self.root / remote_path.lstrip("/")).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise StorageError(f"Path outside the storage root: {remote_path}")
+        return path
+
+    def _stored(self, remote_path):
+        path = self._path(remote_path)
+        if not path.is_file():
+            raise StorageError(f"Not found: {remote_path}")
+        stat = path.stat()
+        return StoredFile("/" + remote_path.lstrip("/"), stat.st_size, rev=str(stat.st_mtime_ns))
+
+    def _commit(self, partial, remote_path, overwrite):
+        path = self._path(remote_path)
+        if not overwrite and path.exists():
+            raise StorageError(f"Already exists: {remote_path}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(partial, path)
+        return self._stored(remote_path)
+
+    def _upload_small(self, data, remote_path, overwrite):
+        session_id = self._session_start(data)
+        return self._session_finish(session_id, len(data), b"", remote_path, overwrite)
+
+    def _session_path(self, session_id):
+        path = self._sessions / session_id
+        if not path.is_file():
+            raise StorageError(f"Unknown upload session: {session_id}")
+        return path
+
+    def _session_start(self, data, concurrent=False):
+        descriptor, path = tempfile.mkstemp(dir=self._sessions)
+        with os.fdopen(descriptor, "wb") as session:
+            session.write(data)
+        return os.path.basename(path)
+
+    def _session_append(self, session_id, offset, data, close=False):
+        with open(self._session_path(session_id), "r+b") as session:
+            os.pwrite(session.fileno(), data, offset)
+
+    def _session_finish(self, session_id, offset, data, remote_path, overwrite):
+        path = self._session_path(session_id)
+        try:
+            with open(path, "r+b") as session:
+                os.pwrite(session.fileno(), data, offset)
+                size = os.fstat(session.fileno()).st_size
+            if size != offset + len(data):
+                raise StorageError(f"Upload session {session_id} holds {size} bytes, expected {offset + len(data)}")
+            return self._commit(path, remote_path, overwrite)
+        except BaseException:
+            self._session_abort(session_id)
+            raise
+
+    def _session_abort(self, session_id):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._sessions / session_id)
+
+    def metadata(self, remote_path):
+        return self._stored(remote_path)
+
+    def iter_download(self, remote_path, chunk_size=_COPY_BUFFER):
+        self._stored(remote_path)
+        with open(self._path(remote_path), "rb") as source:
+            while True:
+                block = source.read(chunk_size)
+                if not block:
+                    return
+                yield block
+
+    def _iter_range(self, remote_path, rev, offset, length):
+        if self._stored(remote_path).rev != rev:
+            raise StorageError(f"{remote_path} changed during download")
+        with open(self._path(remote_path), "rb") as source:
+            source.seek(offset)
+            while length > 0:
+                block = source.read(min(_COPY_BUFFER, length))
+                if not block:
+                    return
+                length -= len(block)
+                yield block
+
+    def shared_link(self, remote_path):
+        self._stored(remote_path)
+        return self._path(remote_path).as_uri()
+
+    def delete(self, remote_path):
+        self._stored(remote_path)
+        self._path(remote_path).unlink()
+
+    def close(self):
+        pass
+
+
+_backends = {
+    "dropbox": DropboxStorage,
+    "local": LocalStorage,
+}
+
+
+def register_backend(name, factory):
+    """Registers a storage backend factory (a zero-argument callable returning a backend)."""
+    _backends[name] = factory
+
+
+_storage = None
+_storage_key = None
+_storage_lock = threading.Lock()
+
+
+def get_storage(backend=None):
+    """Returns the process-wide storage for `backend` (defaults to config.STORAGE_BACKEND)."""
+    global _storage, _storage_key
+    backend = backend or config.STORAGE_BACKEND
+    with _storage_lock:
+        # Per process: a forked worker must not share the parent's HTTP connections.
+        if _storage is None or _storage_key != (backend, os.getpid()):
+            if backend not in _backends:
+                raise ValueError(f"Unknown storage backend: {backend!r}")
+            _storage, _storage_key = _backends[backend](), (backend, os.getpid())
+        return _storage
+
+
+@contextlib.contextmanager
+def download_temp(remote_path, storage=None):
+    """
+    Downloads a file to a temporary path (same extension) for the ingestion pipeline; removed afterwards.
+
+        with storage.download_temp(path) as local_path:
+            text = ingestion.read_text(local_path)
+    """
+    storage = storage or get_storage()
+    extension = os.path.splitext(remote_path)[1]
+    descriptor, local_path = tempfile.mkstemp(prefix="docai-", suffix=extension)
+    os.close(descriptor)
+    try:
+        storage.download(remote_path, local_path)
+        yield local_path
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(local_path)
+
+
+def upload_file(local_path, dropbox_path):
+    """Uploads a file (overwriting) and returns a shared link to it."""
+    storage = get_storage()
+    storage.upload(local_path, dropbox_path)
+    return storage.shared_link(dropbox_path)
+
+
+def download_file(dropbox_path, local_path):
+    """Downloads a file to `local_path`."""
+    return get_storage().download(dropbox_path, local_path)
+
+
+def close():
+    global _storage
+    with _storage_lock:
+        storage, _storage = _storage, None
+    if storage is not None:
+        storage.close()
@@ -0,0 +1,725 @@
+"""
+Document summarization pipeline: read, chunk by idea, cluster, select central
+chunks and summarize them with the LLM. "extractive" summaries are picked
+from the document's own sentences in-process instead (see extractive.py).
+
+Heavy dependencies (spaCy, sentence-transformers, sklearn, the LLM client) are
+imported lazily and the models come from the shared `model_registry`. Each
+stage is measured with `instrumentation.stage` (wrap a call in
+`instrumentation.trace()` for its per-stage report); details of the clusters
+and selections are logged at DEBUG level.
+"""
+import inspect
+import logging
+
+import numpy as np
+from collections import Counter
+from dataclasses import dataclass, field
+
+from app import config
+from app.services import (
+    extractive, ingestion, instrumentation, llm_gateway, model_registry, result_cache, token_budget,
+)
+from app.services.chunker import iter_semantic_chunks, iter_sentences
+from app.services.cluster_selection import select_clusters
+from app.services.embedding_cache import get_embedding_cache
+from app.services.map_reduce import map_reduce_prompt
+from app.services.outline import extract_section_from_file, extract_section_from_text
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class PipelineContext:
+    """
+    Carries the artifacts of one document through the pipeline stages.
+
+    Each expensive artifact (sentence and chunk embeddings, the fitted
+    clustering model, labels and centroids) is produced once by the stage
+    that owns it and read from here by every later stage.
+    """
+    text: str
+    sentences: list = field(default_factory=list)
+    sentence_embeddings: np.ndarray = None
+    chunks: list = field(default_factory=list)
+    chunk_embeddings: np.ndarray = None
+    chunk_tokens: list = None
+    kmeans: object = None
+    labels: np.ndarray = None
+    centroids: np.ndarray = None
+    cluster_result: dict = None
+
+
+def embed_texts(texts):
+    """
+    Embeds texts with the shared embedding model.
+
+    Goes through the persistent embedding cache when it is enabled, so only
+    text that was never embedded before reaches `encode`.
+    """
+    model = model_registry.get_embedding_model()
+    cache = get_embedding_cache()
+    if cache is None:
+        return model.encode(texts, convert_to_numpy=True)
+    return cache.encode(model, model_registry.get_model_name("embedding"), texts)
+
+
+def read_text_from_file(file_path):
+    """
+    Reads text from a TXT, PDF, or DOCX file.
+
+    Materializes the whole document; use `ingestion.iter_segments` to stream
+    pages/paragraphs or read only a range.
+    """
+    return ingestion.read_text(file_path)
+
+
+def chunk_text_by_idea(text, threshold=0.7, max_tokens=200, context=None, embed=None):
+    """
+    Splits text into sentences and groups them into coherent chunks based on semantic similarity.
+    
+    - text: Input text to be chunked (a string, or an iterable of pages/paragraphs).
+    - threshold: Similarity score to merge sentences (higher = stricter).
+    - max_tokens: Max tokenizer token count per chunk.
+    - context: Optional PipelineContext that receives the sentences and their embeddings.
+    - embed: Optional function mapping texts to embeddings (defaults to `embed_texts`).
+    
+    Returns: List of text chunks. Use `chunker.iter_semantic_chunks` directly to
+    consume them as a stream.
+    """
+    chunks = list(iter_semantic_chunks(text, threshold, max_tokens, context=context, embed=embed or embed_texts))
+    log.debug("Total chunks created: %d", len(chunks))
+    return chunks
+
+
+def cluster_text_chunks(chunks, n_clusters=None, predefined_themes=None, num_samples=2, embeddings=None,
+                        embed=None, select=None):
+    """
+    Clusters text chunks using embeddings and K-Means.
+    
+    - If `n_clusters` is None, it determines the optimal number of clusters
+      (see cluster_selection; the method defaults to config.CLUSTER_SELECTION).
+    - If `predefined_themes` is provided, assigns chunks to the closest theme.
+    - Logs cluster distribution, percentage of chunks per cluster, and example chunks (DEBUG).
+
+    Args:
+        chunks (list): List of text chunks.
+        n_clusters (int, optional): Number of clusters (if known).
+        predefined_themes (list, optional): List of themes to cluster around.
+        num_samples (int, optional): Number of sample chunks to display per cluster.
+        embeddings (np.ndarray, optional): Precomputed chunk embeddings (encoded here if omitted).
+        embed (callable, optional): Function mapping texts to embeddings (defaults to `embed_texts`).
+        select (callable, optional): Replacement for `cluster_selection.select_clusters`
+            (e.g. one that runs it in another process).
+
+    Returns:
+        dict: A dictionary containing:
+            - 'labels': Assigned cluster labels for each chunk.
+            - 'cluster_counts': Count of chunks per cluster.
+            - 'percentages': Percentage of chunks per cluster.
+            - 'samples': Example chunks from each cluster.
+            - 'embeddings': Chunk embeddings used for clustering.
+            - 'kmeans': Fitted KMeans model (None when clustering around themes).
+            - 'centroids': Cluster centers, indexed by cluster label.
+    """
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    embed = embed or embed_texts
+    select = select or select_clusters
+
+    # Step 1: Generate embeddings for the text chunks (unless the caller already has them)
+    if embeddings is None:
+        with instrumentation.stage("embed", items=len(chunks)):
+            embeddings = embed(chunks)
+
+    # Step 2: Thematic Clustering (if predefined themes exist)
+    kmeans = None
+    if predefined_themes:
+        with instrumentation.stage("embed", items=len(predefined_themes)):
+            theme_embeddings = embed(predefined_themes)
+        with instrumentation.stage("cluster", items=len(chunks), clusters=len(predefined_themes)):
+            labels = np.argmax(cosine_similarity(embeddings, theme_embeddings), axis=1)
+        centroids = theme_embeddings
+    else:
+        # Step 3-4: Cluster using KMeans, determining the optimal number of clusters
+        # if `n_clusters` is not provided (the winning fit is kept, not refitted)
+        with instrumentation.stage("cluster", items=len(chunks)) as span:
+            selection = select(embeddings, n_clusters=n_clusters)
+            span.count(clusters=selection.k)
+        kmeans, labels = selection.model, selection.labels
+        centroids = kmeans.cluster_centers_
+
+    # Step 5: Compute Cluster Distribution & Percentages
+    cluster_counts = Counter(labels)
+    total_chunks = len(chunks)
+    cluster_percentages = {cluster: round((count / total_chunks) * 100, 2) for cluster, count in cluster_counts.items()}
+
+    # Step 6: Collect Sample Chunks
+    cluster_dict = {i: [] for i in set(labels)}  
+    for idx, cluster_id in enumerate(labels):
+        cluster_dict[cluster_id].append(chunks[idx])
+    cluster_samples = {cluster_id: texts[:num_samples] for cluster_id, texts in cluster_dict.items()}
+
+    # Step 7: Log Cluster Information
+    if log.isEnabledFor(logging.DEBUG):
+        for cluster_id, count in sorted(cluster_counts.items()):
+            log.debug("Cluster %s: %d chunks (%s%%)", cluster_id, count, cluster_percentages[cluster_id])
+        for cluster_id, texts in cluster_samples.items():
+            for text in texts:
+                log.debug("Cluster %s sample: %s...", cluster_id, text[:200])
+
+    return {
+        "labels": labels,
+        "cluster_counts": cluster_counts,
+        "percentages": cluster_percentages,
+        "samples": cluster_samples,
+        "embeddings": embeddings,
+        "kmeans": kmeans,
+        "centroids": centroids,
+    }
+    
+def allocate_representative_chunks(cluster_percentages, sum_representative_chunks):
+    """
+    Allocates representative chunks to each cluster based on percentage distribution.
+
+    Args:
+        cluster_percentages (dict): Dictionary with cluster IDs as keys and percentage of chunks as values.
+        sum_representative_chunks (int): Total number of representative chunks.
+
+    Returns:
+        dict: Mapping of cluster ID to allocated representative chunks.
+    """
+
+    # Step 1: Compute raw allocations
+    raw_allocations = {cluster: (percent / 100) * sum_representative_chunks for cluster, percent in cluster_percentages.items()}
+
+    # Step 2: Round to nearest integer
+    allocated_chunks = {cluster: round(value) for cluster, value in raw_allocations.items()}
+
+    # Step 3: Adjust rounding errors to ensure total sum matches `sum_representative_chunks`
+    total_allocated = sum(allocated_chunks.values())
+    difference = sum_representative_chunks - total_allocated
+
+    # Step 4: Adjust the largest clusters (to fix rounding differences)
+    sorted_clusters = sorted(allocated_chunks, key=lambda x: -cluster_percentages[x])  # Sort by highest percentage
+    for i in range(abs(difference)):
+        if difference > 0:
+            allocated_chunks[sorted_clusters[i]] += 1  # Add chunk
+        elif difference < 0:
+            allocated_chunks[sorted_clusters[i]] -= 1  # Remove chunk
+
+    return allocated_chunks
+
+
+def rank_chunks_by_centrality(embeddings, labels, centroids):
+    """
+    Orders the chunks of every cluster from most to least central.
+
+    A chunk is central when its distance to the cluster center is close to the
+    cluster's mean distance.
+
+    Returns:
+        dict: Mapping of cluster ID to chunk indices, most central first.
+    """
+    labels = np.asarray(labels)
+    distances = np.linalg.norm(np.asarray(embeddings) - np.asarray(centroids)[labels], axis=1)
+    ranked = {}
+    for cluster_id in np.unique(labels):
+        indices = np.flatnonzero(labels == cluster_id)
+        mean_dist = distances[indices].mean()
+        order = np.argsort(np.abs(distances[indices] - mean_dist), kind="stable")
+        ranked[cluster_id] = indices[order].tolist()
+    return ranked
+
+
+def select_chunks_within_budget(context, budget, model=None):
+    """
+    Selects the most central chunks of every cluster that fit in `budget` tokens
+    once merged with `merge_representative_chunks`.
+
+    Each chunk is tokenized once (cached on the context). Clusters get a share of
+    the budget proportional to their size; leftover tokens go to the next most
+    central chunks overall.
+
+    Args:
+        context (PipelineContext): Chunks, embeddings, labels and centroids of the document.
+        budget (int): Tokens available for the merged text.
+        model (str, optional): LLM whose tokenizer is used.
+
+    Returns:
+        dict: Mapping of cluster ID to selected representative chunks.
+    """
+    if context.chunk_tokens is None:
+        context.chunk_tokens = token_budget.count_tokens_batch(context.chunks, model)
+
+    ranked = rank_chunks_by_centrality(context.chunk_embeddings, context.labels, context.centroids)
+    weights = {cluster_id: len(indices) for cluster_id, indices in ranked.items()}
+    header_tokens = max(token_budget.count_tokens(_cluster_header(cluster_id), model) for cluster_id in ranked)
+    selected = token_budget.select_within_budget(
+        ranked, context.chunk_tokens, weights, budget, group_cost=header_tokens + 1, item_cost=1
+    )
+
+    def merged_tokens():
+        return token_budget.count_tokens(merge_representative_chunks(
+            {cluster_id: [context.chunks[i] for i in indices] for cluster_id, indices in selected.items()}), model)
+
+    # Token boundaries can shift when texts are joined: verify the exact count and trim if
+    # needed, subtracting each dropped chunk's own count and re-counting once per pass.
+    total = merged_tokens() if selected else 0
+    while selected and total > budget:
+        while selected and total > budget:
+            last_cluster = max(selected, key=lambda cluster_id: len(selected[cluster_id]))
+            total -= context.chunk_tokens[selected[last_cluster].pop()] + 1
+            if not selected[last_cluster]:
+                del selected[last_cluster]
+                total -= header_tokens + 1
+        total = merged_tokens() if selected else 0
+
+    if log.isEnabledFor(logging.DEBUG):
+        for cluster_id, indices in selected.items():
+            log.debug("Cluster %s: %d selected chunks", cluster_id, len(indices))
+
+    return {cluster_id: [context.chunks[i] for i in indices] for cluster_id, indices in selected.items()}
+
+
+def select_central_chunks(chunks, embeddings, labels, centroids, representative_chunk_allocation):
+    """
+    Selects the most central chunks for each cluster based on precomputed representative chunk allocation.
+
+    Args:
+        chunks (list): List of text chunks.
+        embeddings (list): Corresponding list of chunk embeddings.
+        labels (list): Cluster labels assigned to each chunk.
+        centroids (np.ndarray): Cluster centers indexed by label, from the same fit as `labels`.
+        representative_chunk_allocation (dict): Number of representative chunks per cluster.
+
+    Returns:
+        dict: Mapping of cluster ID to selected representative chunks.
+    """
+    # Step 1-2: Rank the chunks of each cluster by centrality and keep the allocated number
+    ranked = rank_chunks_by_centrality(embeddings, labels, centroids)
+    representative_chunks = {}
+    for cluster_id, count in representative_chunk_allocation.items():
+        indices = ranked.get(cluster_id, [])[:count]
+        if indices:
+            representative_chunks[cluster_id] = [chunks[idx] for idx in indices]
+
+    if log.isEnabledFor(logging.DEBUG):
+        for cluster_id, count in representative_chunk_allocation.items():
+            log.debug("Cluster %s: %d selected chunks", cluster_id, count)
+
+    return representative_chunks
+
+
+def _cluster_header(cluster_id):
+    return f"\n🔹 **Cluster {cluster_id}**:\n"
+
+
+def merge_representative_chunks(central_chunks):
+    """
+    Merges all selected representative chunks into a single formatted string.
+
+    Args:
+        central_chunks (dict): Dictionary mapping cluster IDs to selected representative chunks.
+
+    Returns:
+        str: A single string containing all representative chunks, formatted with separators.
+    """
+    merged_text = []
+
+    for cluster_id, chunks in central_chunks.items():
+        merged_text.append(_cluster_header(cluster_id))
+        for chunk in chunks:
+            merged_text.append(chunk.strip())  # Remove extra spaces
+
+    return "\n".join(merged_text)
+
+
+class PromptBuilder:
+    """Builds a customizable prompt for document summarization."""
+    
+    def __init__(self, merged_text, instruction=None):
+        self.instruction = instruction or (
+            "You are an expert at summarizing long documents. Your task is to generate a **well-structured summary** "
+            "of the text while keeping the key ideas and removing unnecessary details."
+        )
+        self.merged_text = merged_text
+        self.summary_length = None
+        self.format_type = "paragraph"
+        self.tone = "neutral"
+        self.language = "English"
+        self.vocabulary = "abstractive"
+        self.structure = None
+
+    def set_summary_length(self, length):
+        self.summary_length = length
+        return self
+
+    def set_format(self, format_type):
+        self.format_type = format_type
+        return self
+
+    def set_tone(self, tone):
+        self.tone = tone
+        return self
+    
+    def set_language(self, language):
+        self.language = language
+        return self
+    
+    def set_vocabulary(self, vocabulary):
+        """Sets the vocabulary for the summarization."""
+        if vocabulary in ["abstractive", "extractive"]:
+            self.vocabulary = vocabulary
+        return self
+    
+    def set_structure(self,structure):
+        self.structure = structure
+        return self
+
+
+    def build(self):
+        """Construct the final prompt based on the settings."""
+        prompt = f"{self.instruction}\n\n"
+
+        prompt += f"TEXT:\n{self.merged_text}\n\n"
+        if (self.structure != None):
+            prompt += (
+            "The answer must strictly follow the structure below. "
+            "Keep all titles, numberings (1, 2, 3...) and lettered sub-points (a, b, c...), "
+            "and add the corresponding paragraphs under each section without altering the format:\n"
+            f"{self.structure}\n\n"
+            )
+        
+        prompt += (
+            f"The summary should be approximately {self.summary_length} words long, "
+            f"written in {'bullet points' if self.format_type == 'bullet points' else 'normal text'} format. "
+            f"Please use a {self.tone.lower()} tone, write in {self.language}, and apply "
+            f"{self.vocabulary.lower()} summarization techniques.\n\n"
+            "Now, provide the summary:"
+        )
+
+        return prompt
+
+
+def build_summary_prompt(merged_text, summary_length, format_type, tone, language, vocabulary, structure):
+    """Builds the summarization prompt with PromptBuilder from the user's settings."""
+    builder = PromptBuilder(merged_text)
+    builder.set_summary_length(summary_length) \
+       .set_format(format_type) \
+       .set_tone(tone) \
+       .set_language(language) \
+       .set_vocabulary(vocabulary) \
+       .set_structure(structure)
+    return builder.build()
+
+
+def summarize_with_together(merged_text, summary_length, format_type, tone, language, vocabulary,structure):
+    """Generates a summary using Together AI with customizable parameters."""
+
+    # Use PromptBuilder to construct the prompt dynamically
+    prompt = build_summary_prompt(merged_text, summary_length, format_type, tone, language, vocabulary, structure)
+
+    # Call the LLM through the shared gateway (pooled client, bounded concurrency, retries)
+    return complete(prompt)
+
+
+def complete(prompt):
+    """Sends the final prompt to the LLM through the gateway (the "llm" stage)."""
+    with instrumentation.stage("llm") as span:
+        summary = llm_gateway.complete(prompt, max_tokens=config.LLM_MAX_OUTPUT_TOKENS, temperature=0.1)
+        if span:
+            span.count(output_tokens=token_budget.count_tokens(summary))
+    return summary
+
+
+def stream_with_together(merged_text, summary_length, format_type, tone, language, vocabulary, structure):
+    """Like `summarize_with_together`, but yields the summary as text deltas while the LLM writes it."""
+    prompt = build_summary_prompt(merged_text, summary_length, format_type, tone, language, vocabulary, structure)
+    yield from llm_gateway.stream(prompt, max_tokens=config.LLM_MAX_OUTPUT_TOKENS, temperature=0.1)
+
+
+
+def adjust_summary_length(summary_length, nb_words):
+    if summary_length == "low":
+        summary_length_calculated = round(0.1 * nb_words)
+        summary_length_calculated = max(150, min(350, summary_length_calculated))
+    elif summary_length == "moderate":
+        summary_length_calculated = round(0.2 * nb_words)
+        summary_length_calculated = max(400, min(650, summary_length_calculated))
+    elif summary_length == "high":
+        summary_length_calculated = round(0.3 * nb_words)
+        summary_length_calculated = max(700, min(1200, summary_length_calculated))
+    else:
+        # If it's already a number, convert it safely
+        try:
+            summary_length_calculated = round(float(summary_length))
+        except ValueError:
+            raise ValueError("Invalid summary_length value. It must be 'low', 'moderate', 'high', or a number.")
+
+    # Ensure final result is between 50 and 2000, even for custom numbers
+    summary_length_final = max(150, min(1700, summary_length_calculated))
+
+    return summary_length_final
+
+
+
+def _no_progress(stage, **details):
+    pass
+
+
+def read_document(file_path, text, paragraph_title=None, progress=None):
+    """
+    The text to summarize: `text`, or the file's.
+
+    With `paragraph_title`, only that section is read: from the file when there
+    is one (its other pages or paragraphs are never parsed, see outline.py), else from `text`.
+    """
+    if paragraph_title:
+        (progress or _no_progress)("reading")
+        with instrumentation.stage("read") as span:
+            if file_path is not None:
+                text = extract_section_from_file(file_path, paragraph_title)
+            else:
+                text = extract_section_from_text(text, paragraph_title)
+            span.count(characters=len(text))
+    elif text is None:
+        (progress or _no_progress)("reading")
+        with instrumentation.stage("read") as span:
+            text = read_text_from_file(file_path)
+            span.count(characters=len(text))
+    return text
+
+
+def extractive_summary(text, summary_length=150, summary_format="paragraph", context=None, embed=None):
+    """
+    Summarizes text locally, without the LLM, from its most central sentences (see extractive.py).
+
+    Args:
+        text (str): The document.
+        summary_length (int or str): Words, or "low" / "moderate" / "high" (see `adjust_summary_length`).
+        summary_format (str): "paragraph" or "bullet points".
+        context (PipelineContext, optional): Reuses its sentences and their embeddings
+            when the chunking stage already produced them.
+        embed (callable, optional): Embedding function (defaults to `embed_texts`).
+
+    Returns:
+        str: The summary.
+    """
+    if context is not None and context.sentence_embeddings is not None:
+        sentences, embeddings = context.sentences, context.sentence_embeddings
+    else:
+        with instrumentation.stage("split") as span:
+            sentences = list(iter_sentences(text))
+            span.count(items=len(sentences))
+        with instrumentation.stage("embed", items=len(sentences)):
+            embeddings = (embed or embed_texts)(sentences) if sentences else None
+    if type(summary_length) == str:
+        summary_length = adjust_summary_length(summary_length, len(text.split()))
+    with instrumentation.stage("extract", items=len(sentences)):
+        return extractive.summarize(sentences, embeddings, summary_length, summary_format)
+
+
+def prepare_summary_prompt(file_path, text, themes=None, summary_format="paragraph", summary_length=150, summary_tone="neutral", language="english", vocabulary="abstractive", structure=None, paragraph_title=None, mode=None, progress=None, embed=None, select=None, context=None, complete_many=None):
+    """
+    Runs the CPU stages of the pipeline and returns the final LLM prompt.
+
+    Long documents (over 3700 words) are chunked by idea, then either:
+    - "select": the most central chunks of every cluster that fit the prompt
+      budget go into the prompt, or
+    - "map_reduce": every chunk is summarized through a map-reduce tree of
+      LLM calls (see map_reduce.py) and the prompt merges the partial summaries.
+    `mode` defaults to config.SUMMARY_MODE; "auto" uses map-reduce only when
+    the chunks do not all fit in the prompt budget.
+
+    Args:
+        progress (callable, optional): Called as `progress(stage, **details)` when a
+            stage starts ("reading", "chunking", "clustering", "selecting", "map",
+            "reduce"). It may raise to abort the pipeline.
+        embed, select (callable, optional): Embedding and cluster-selection functions,
+            as for `cluster_text_chunks` (used by the batch engine to share them
+            across documents).
+        complete_many (callable, optional): Sends the map-reduce LLM calls, as
+            `llm_gateway.complete_many` (used by the batch engine to bound them).
+        context (PipelineContext, optional): Receives the document's text and, for long
+            documents, its sentences and their embeddings (e.g. for an extractive fallback).
+
+    Returns:
+        str: The prompt to send to the LLM.
+    """
+    progress = progress or _no_progress
+    structure_text = ""  # Always define to avoid UnboundLocalError
+
+    text = read_document(file_path, text, paragraph_title, progress)
+    if context is None:
+        context = PipelineContext(text=text)
+    context.text = text
+
+    # Handle structure or themes as structure guide
+    if structure is not None:
+        structure_text = read_text_from_file(structure)
+    elif themes:
+        if isinstance(themes, list):
+            structure_text = "\n".join(themes)
+        else:
+            raise TypeError(f"Expected 'themes' to be a list, got {type(themes).__name__}")
+      
+    nb_words = len(text.split())
+    if type(summary_length) == str:  
+        summary_length = adjust_summary_length(summary_length, nb_words)
+    if nb_words <= 3700:
+        return _final_prompt(text, summary_length, summary_format, summary_tone, language, vocabulary, structure_text)
+
+    progress("chunking", words=nb_words)
+    context.chunks = chunk_text_by_idea(text, context=context, embed=embed)
+    chunks = context.chunks
+    context.chunk_tokens = token_budget.count_tokens_batch(chunks)
+
+    # Step 2: Token budget left for document text: the model's context window minus
+    # the exact prompt scaffolding (instructions, structure) and the reserved output
+    scaffolding = build_summary_prompt("", summary_length, summary_format, summary_tone, language, vocabulary, structure_text)
+    budget = token_budget.prompt_budget(token_budget.count_tokens(scaffolding))
+
+    mode = mode or config.SUMMARY_MODE
+    if mode == "auto":
+        mode = "map_reduce" if sum(context.chunk_tokens) + len(chunks) > budget else "select"
+    if mode not in ("select", "map_reduce"):
+        raise ValueError(f"Unknown summary mode: {mode!r}. Use 'auto', 'select' or 'map_reduce'.")
+
+    # Step 3: Perform Text Clustering (embeds the chunks and fits KMeans once)
+    if mode == "select" or config.MAP_REDUCE_GROUP_BY == "cluster":
+        progress("clustering", chunks=len(chunks))
+        if (themes == []):
+            cluster_result = cluster_text_chunks(chunks, embed=embed, select=select)
+        else:
+            cluster_result = cluster_text_chunks(chunks, predefined_themes = themes, embed=embed, select=select)
+        context.cluster_result = cluster_result
+        context.chunk_embeddings = cluster_result["embeddings"]
+        context.kmeans = cluster_result["kmeans"]
+        context.labels = np.asarray(cluster_result["labels"])
+        context.centroids = cluster_result["centroids"]
+
+    if mode == "map_reduce":
+        # Step 4: Summarize every chunk through the map-reduce tree
+        return map_reduce_prompt(
+            context, summary_length, summary_format, summary_tone, language, vocabulary, structure_text,
+            progress=progress, complete_many=complete_many,
+        )
+
+    # Step 4: Select the most central chunks per cluster that fit the budget
+    # (reusing the embeddings and fit from Step 3) and Merge
+    progress("selecting", chunks=len(chunks), budget=budget)
+    with instrumentation.stage("select", items=len(chunks)) as span:
+        selected_chunks = select_chunks_within_budget(context, budget)
+        span.count(selected=sum(len(selected) for selected in selected_chunks.values()))
+    merged_text = merge_representative_chunks(selected_chunks)
+    return _final_prompt(merged_text, summary_length, summary_format, summary_tone, language, vocabulary, structure_text)
+
+
+def _final_prompt(merged_text, summary_length, summary_format, summary_tone, language, vocabulary, structure_text):
+    """`build_summary_prompt` measured as the "prompt" stage, with the prompt's token count."""
+    with instrumentation.stage("prompt") as span:
+        prompt = build_summary_prompt(merged_text, summary_length, summary_format, summary_tone, language, vocabulary, structure_text)
+        if span:
+            span.count(tokens=token_budget.count_tokens(prompt))
+    return prompt
+
+
+def complete_or_fallback(prompt, context, summary_length, summary_format):
+    """
+    Sends the prompt to the LLM, falling back to the local extractive summary of
+    `context` when the call fails or has not answered within
+    config.EXTRACTIVE_FALLBACK_AFTER seconds (unless config.EXTRACTIVE_FALLBACK is off).
+
+    Returns:
+        tuple: (summary, engine), engine being "llm" or "fallback".
+    """
+    answer = llm_gateway.submit(prompt, max_tokens=config.LLM_MAX_OUTPUT_TOKENS, temperature=0.1)
+    try:
+        with instrumentation.stage("llm") as span:
+            summary = answer.result(config.EXTRACTIVE_FALLBACK_AFTER or None)
+            if span:
+                span.count(output_tokens=token_budget.count_tokens(summary))
+        return summary, "llm"
+    except (llm_gateway.LLMError, TimeoutError) as exc:
+        if not config.EXTRACTIVE_FALLBACK:
+            raise
+        answer.cancel()
+        return fallback_summary(context, summary_length, summary_format, exc), "fallback"
+
+
+def fallback_summary(context, summary_length, summary_format, exc):
+    """The local extractive summary of `context` standing in for an LLM answer that failed with `exc`."""
+    log.warning("LLM unavailable (%r), falling back to the extractive summary", exc)
+    return extractive_summary(context.text, summary_length, summary_format, context=context)
+
+
+def _summarize(file_path, text, themes=None, summary_format="paragraph", summary_length=150, summary_tone="neutral", language="english", vocabulary="abstractive", structure=None, paragraph_title=None, mode=None):
+    """`summarize_document`, also returning the engine that wrote the summary ("llm", "extractive" or "fallback")."""
+    if vocabulary == "extractive" and config.EXTRACTIVE_LOCAL:
+        text = read_document(file_path, text, paragraph_title)
+        return extractive_summary(text, summary_length, summary_format), "extractive"
+
+    context = PipelineContext(text=text)
+    try:
+        prompt = prepare_summary_prompt(
+            file_path, text, themes, summary_format, summary_length, summary_tone, language, vocabulary,
+            structure, paragraph_title, mode, context=context,
+        )
+    except (llm_gateway.LLMError, TimeoutError) as exc:
+        # The map-reduce mode already calls the LLM for its partial summaries.
+        if not config.EXTRACTIVE_FALLBACK:
+            raise
+        return fallback_summary(context, summary_length, summary_format, exc), "fallback"
+    return complete_or_fallback(prompt, context, summary_length, summary_format)
+
+
+def summarize_document(file_path, text, themes=None, summary_format="paragraph", summary_length=150, summary_tone="neutral", language="english", vocabulary = "abstractive", structure = None, paragraph_title=None, mode=None):  
+    """
+    Summarizes a document (read from `file_path` when `text` is None).
+
+    See `prepare_summary_prompt` for the pipeline; its prompt is then sent to
+    the LLM (Step 5). "extractive" requests skip the LLM entirely and are
+    answered from the document's most central sentences (see `extractive_summary`),
+    which also stand in for the LLM's answer when it is down or too slow.
+    """
+    summary, _ = _summarize(
+        file_path, text, themes, summary_format, summary_length, summary_tone, language, vocabulary,
+        structure, paragraph_title, mode,
+    )
+    return summary
+
+
+def summary_cache_key(file_path, text, **options):
+    """Result-cache key of a `summarize_document` call (options are completed with their defaults)."""
+    bound = inspect.signature(summarize_document).bind(file_path, text, **options)
+    bound.apply_defaults()
+    options = {name: value for name, value in bound.arguments.items() if name not in ("file_path", "text")}
+    return result_cache.summary_key(file_path, text, options)
+
+
+def summarize_document_cached(file_path, text, **options):
+    """
+    `summarize_document` behind the process-wide result cache.
+
+    Identical requests (same document content and options) are answered from
+    the cache, and concurrent identical requests share one computation.
+    Takes the same arguments as `summarize_document`.
+    """
+    if not config.RESULT_CACHE_ENABLED:
+        return summarize_document(file_path, text, **options)
+
+    key = summary_cache_key(file_path, text, **options)
+    engines = []
+
+    def compute():
+        summary, engine = _summarize(file_path, text, **options)
+        engines.append(engine)
+        return summary
+
+    cache = result_cache.get_result_cache()
+    summary = cache.get_or_compute(key, compute)
+    if engines == ["fallback"]:
+        # Stand-in for an unavailable LLM: the next request should try it again.
+        cache.invalidate(key)
+    return summary
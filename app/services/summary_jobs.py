@@ -0,0 +1,410 @@
+"""
+Asynchronous summarization jobs.
+
+A job is accepted immediately and runs in two phases:
+
+- the CPU stages (reading, chunking, embedding, clustering, selection or the
+  map-reduce tree) run on a bounded thread pool, off the event loop, and
+  report their progress as they go;
+- the final LLM call is streamed on the event loop through the gateway, token
+  by token.
+
+"extractive" jobs are written by the local extractive engine in the CPU phase
+and never reach the LLM; the same engine answers the other jobs when the LLM
+fails (or stays silent for `config.EXTRACTIVE_FALLBACK_AFTER` seconds) before
+its first token.
+
+Identical jobs (same document and options) running at the same time are
+computed once: the first one claims the result-cache key, the others replay
+its progress and tokens as they come (and run the pipeline themselves if it
+is cancelled; a "restarted" progress event then tells clients to drop the
+tokens received so far).
+
+Every job keeps an append-only list of events ("status", "progress", "token",
+"done", "error") that any number of clients can follow, or resume from an
+event id, while the job runs (see the SSE endpoint in app/routes/summary.py).
+Finished jobs are kept for `config.JOB_TTL` seconds.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app import config
+from app.services import instrumentation, llm_gateway, result_cache, token_budget
+from app.services.summary_generator import (
+    PipelineContext, extractive_summary, fallback_summary, prepare_summary_prompt, read_document, summary_cache_key,
+)
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when `config.JOB_MAX_PENDING` jobs are already waiting or running."""
+
+
+class JobCancelled(Exception):
+    """Raised inside the pipeline (at its next stage) when its job was cancelled."""
+
+
+class SummaryJob:
+    """
+    State and event log of one summarization job. Only mutated on the event loop.
+
+    Args:
+        job_id (str): Identifier returned to the client.
+        file_path (str): Uploaded document, or None.
+        text (str): Pasted text, or None.
+        options (dict): `summarize_document` options.
+        cleanup (callable, optional): Called once the pipeline no longer needs the files.
+    """
+
+    def __init__(self, job_id, file_path, text, options, cleanup=None):
+        self.id = job_id
+        self.file_path = file_path
+        self.text = text
+        self.options = options
+        self.cleanup = cleanup
+        self.status = "queued"
+        self.stage = None
+        self.parts = []
+        self.error = None
+        self.cached = False
+        self.engine = None
+        self.claimed = None  # result-cache key this job computes for the jobs following it
+        self.trace = instrumentation.Trace(job_id)
+        self.cancelled = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self.task = None
+        self._changed = asyncio.Event()
+
+    @property
+    def summary(self):
+        return "".join(self.parts)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def emit(self, event, **data):
+        self.events.append((len(self.events), event, data))
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def set_status(self, status, **data):
+        if self.finished:
+            return  # late updates from a worker of a cancelled job
+        self.status = status
+        if status == "running":
+            self.started_at = time.time()
+        elif status in FINISHED:
+            self.finished_at = time.time()
+        self.emit("status", status=status, **data)
+
+    def set_stage(self, stage, details):
+        if self.finished:
+            return
+        self.stage = stage
+        self.emit("progress", stage=stage, **details)
+
+    async def follow(self, start=0, heartbeat=None):
+        """
+        Yields `(event id, event, data)` from event `start` on until the job finishes.
+
+        With `heartbeat` (seconds), yields None whenever nothing happened for
+        that long, so that the caller can keep its connection alive.
+        """
+        index = start
+        while True:
+            changed = self._changed
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+
+class SummaryJobs:
+    """
+    Accepts jobs and runs them.
+
+    Args:
+        workers (int, optional): Threads for the CPU stages. Defaults to config.JOB_WORKERS.
+        max_pending (int, optional): Unfinished jobs accepted at once. Defaults to config.JOB_MAX_PENDING.
+        ttl (float, optional): Seconds a finished job stays queryable. Defaults to config.JOB_TTL.
+    """
+
+    def __init__(self, workers=None, max_pending=None, ttl=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.JOB_WORKERS, thread_name_prefix="summary-job")
+        self.max_pending = max_pending or config.JOB_MAX_PENDING
+        self.ttl = config.JOB_TTL if ttl is None else ttl
+        self.jobs = {}
+
+    def get(self, job_id):
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def pending(self):
+        return sum(not job.finished for job in self.jobs.values())
+
+    def submit(self, file_path, text, options, cleanup=None):
+        """Registers a job and starts it on the running event loop. Raises JobQueueFull when saturated."""
+        self._prune()
+        if self.pending() >= self.max_pending:
+            raise JobQueueFull(f"{self.max_pending} summarization jobs are already pending")
+        job = SummaryJob(uuid.uuid4().hex, file_path, text, options, cleanup)
+        self.jobs[job.id] = job
+        job.emit("status", status="queued")
+        job.task = asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    async def cancel(self, job):
+        """Stops a job: its LLM stream at once, its CPU stages at the next stage boundary."""
+        if job.finished:
+            return
+        job.cancelled = True
+        job.task.cancel()
+        await asyncio.wait([job.task])
+
+    def stats(self):
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"jobs": len(self.jobs), "pending": self.pending(), "by_status": statuses}
+
+    def shutdown(self):
+        for job in self.jobs.values():
+            job.cancelled = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _prune(self):
+        horizon = time.time() - self.ttl
+        for job_id in [job.id for job in self.jobs.values() if job.finished and job.finished_at < horizon]:
+            del self.jobs[job_id]
+
+    def _prepare(self, job, loop):
+        """
+        Worker thread: the cache lookup and the CPU stages.
+
+        Returns:
+            tuple: (cache key, engine, result, context). The result is the summary
+            when the engine is "cache", "extractive" or "fallback", the LLM prompt for "llm", and
+            the in-flight computation of an identical request for "follow".
+        """
+        def progress(stage, **details):
+            if job.cancelled:
+                raise JobCancelled()
+            loop.call_soon_threadsafe(job.set_stage, stage, details)
+
+        if job.cancelled:
+            raise JobCancelled()
+        loop.call_soon_threadsafe(job.set_status, "running")
+
+        key = None
+        if config.RESULT_CACHE_ENABLED:
+            key = summary_cache_key(job.file_path, job.text, **job.options)
+            found, cached, computing = result_cache.get_result_cache().claim(key, owner=job)
+            if found:
+                return key, "cache", cached, None
+            if computing is not None:
+                return key, "follow", computing, None
+            job.claimed = key
+
+        options = job.options
+        if options.get("vocabulary") == "extractive" and config.EXTRACTIVE_LOCAL:
+            text = read_document(job.file_path, job.text, options.get("paragraph_title"), progress)
+            progress("extracting")
+            summary = extractive_summary(
+                text, options.get("summary_length", 150), options.get("summary_format", "paragraph"),
+            )
+            return key, "extractive", summary, None
+
+        context = PipelineContext(text=job.text)
+        try:
+            prompt = prepare_summary_prompt(job.file_path, job.text, progress=progress, context=context, **options)
+        except (llm_gateway.LLMError, TimeoutError) as exc:
+            # The map-reduce mode already calls the LLM for its partial summaries.
+            if not config.EXTRACTIVE_FALLBACK:
+                raise
+            progress("fallback", error=str(exc) or type(exc).__name__)
+            summary = fallback_summary(
+                context, options.get("summary_length", 150), options.get("summary_format", "paragraph"), exc,
+            )
+            return key, "fallback", summary, None
+        return key, "llm", prompt, context
+
+    def _fallback(self, job, context):
+        """Worker thread: the extractive summary standing in for the LLM's."""
+        return extractive_summary(
+            context.text, job.options.get("summary_length", 150), job.options.get("summary_format", "paragraph"),
+            context=context,
+        )
+
+    def _append(self, job, delta):
+        job.parts.append(delta)
+        job.emit("token", delta=delta)
+
+    async def _generate(self, job, prompt, context):
+        """
+        Streams the LLM's answer into the job. Returns the engine that wrote it:
+        "llm", or "fallback" when the LLM failed or timed out before its first token.
+        """
+        job.set_stage("generating", {})
+        deltas = llm_gateway.astream(prompt, max_tokens=config.LLM_MAX_OUTPUT_TOKENS, temperature=0.1)
+        try:
+            with instrumentation.stage("llm") as span:
+                try:
+                    first = await asyncio.wait_for(deltas.__anext__(), config.EXTRACTIVE_FALLBACK_AFTER or None)
+                except StopAsyncIteration:
+                    return "llm"
+                except (llm_gateway.LLMError, asyncio.TimeoutError) as exc:
+                    if not config.EXTRACTIVE_FALLBACK:
+                        raise
+                    failure = exc
+                else:
+                    failure = None
+                    self._append(job, first)
+                    async for delta in deltas:
+                        self._append(job, delta)
+                    if span:
+                        span.count(output_tokens=token_budget.count_tokens(job.summary))
+            if failure is None:
+                return "llm"
+        finally:
+            await deltas.aclose()
+
+        job.set_stage("fallback", {"error": str(failure) or type(failure).__name__})
+        self._append(job, await asyncio.wrap_future(self._in_worker(self._fallback, job, context)))
+        return "fallback"
+
+    def _in_worker(self, function, *args):
+        """Runs `function` on the pool in a copy of the current context (so that its stages join the job's trace)."""
+        return self.executor.submit(contextvars.copy_context().run, function, *args)
+
+    async def _follow(self, job, computing):
+        """
+        Replays the computation of an identical request into `job`: the progress and
+        tokens of the job computing it, or its result when it runs outside the job manager.
+
+        Returns:
+            str: The engine that wrote the summary, or None when the job followed was
+            cancelled (its partial tokens are dropped, and the caller runs the pipeline itself).
+        """
+        leader = getattr(computing, "owner", None)
+        if not isinstance(leader, SummaryJob):
+            self._append(job, await asyncio.wrap_future(computing))
+            job.cached = True
+            return "cache"
+
+        job.set_stage("following", {"job": leader.id})
+        async for event in leader.follow():
+            if event is None:
+                continue
+            _, name, data = event
+            if name == "progress":
+                job.set_stage(data["stage"], {key: value for key, value in data.items() if key != "stage"})
+            elif name == "token":
+                self._append(job, data["delta"])
+        if leader.status == "done":
+            job.cached = True
+            return leader.engine
+        if leader.status == "failed":
+            raise RuntimeError(leader.error)
+        try:
+            await asyncio.wrap_future(computing)  # settles once the cancelled job's worker has stopped
+        except Exception:
+            pass
+        job.parts.clear()
+        job.set_stage("restarted", {})
+        return None
+
+    def _abandon(self, job, exc):
+        """Releases the job's cache claim, if it still holds one (the jobs following it give up or restart)."""
+        key, job.claimed = job.claimed, None
+        if key is not None:
+            result_cache.get_result_cache().abandon(key, exc)
+
+    async def _run(self, job):
+        # Stages measured here, or in the workers started from here, join the job's trace.
+        with instrumentation.use_trace(job.trace):
+            loop = asyncio.get_running_loop()
+            prepared = self._in_worker(self._prepare, job, loop)
+            try:
+                while True:
+                    key, engine, result, context = await asyncio.wrap_future(prepared)
+                    if engine != "follow":
+                        break
+                    followed = await self._follow(job, result)
+                    if followed is not None:
+                        break
+                    prepared = self._in_worker(self._prepare, job, loop)
+
+                if engine == "follow":
+                    engine = followed
+                elif engine == "llm":
+                    engine = await self._generate(job, result, context)
+                else:
+                    job.cached = engine == "cache"
+                    self._append(job, result)
+                job.engine = engine
+                if job.claimed is not None:
+                    key, job.claimed = job.claimed, None
+                    # A fallback only stands in for the LLM: the next request should try it again.
+                    result_cache.get_result_cache().resolve(key, job.summary, store=engine != "fallback")
+                job.trace.finish()
+                job.emit("done", summary=job.summary, cached=job.cached, engine=job.engine, metrics=job.trace.report())
+                job.set_status("done")
+            except (asyncio.CancelledError, JobCancelled):
+                job.cancelled = True
+                job.set_status("cancelled")
+                # The worker may still claim the key after the cancellation.
+                prepared.add_done_callback(lambda _: self._abandon(job, JobCancelled()))
+            except Exception as exc:
+                job.error = str(exc) or type(exc).__name__
+                job.emit("error", message=job.error)
+                job.set_status("failed", error=job.error)
+                self._abandon(job, exc)
+            finally:
+                if job.cleanup is not None:
+                    # The worker may still be reading the files when the job was cancelled.
+                    prepared.add_done_callback(lambda _: job.cleanup())
+
+
+def remove_files(paths):
+    """Cleanup helper for uploaded temporary files."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_jobs():
+    """Returns the process-wide job manager."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = SummaryJobs()
+        return _jobs
+
+
+def shutdown():
+    global _jobs
+    with _jobs_lock:
+        jobs, _jobs = _jobs, None
+    if jobs is not None:
+        jobs.shutdown()
@@ -0,0 +1,129 @@
+"""
+Token accounting for the summarization prompt.
+
+Token counts come from the real tiktoken encoder (cached per model) and are
+computed once per chunk. The prompt budget is derived from the target model's
+context window (capped by `config.LLM_MAX_PROMPT_TOKENS`) minus the exact
+tokens of the prompt scaffolding and the reserved output tokens, and `select_within_budget` packs the most central
+chunks of every cluster into that budget.
+
+Models tiktoken does not know (e.g. Cohere's) are counted with a close OpenAI
+encoding, and `config.LLM_TOKEN_SAFETY_MARGIN` absorbs the difference.
+"""
+from functools import lru_cache
+
+from app import config
+
+# Context windows (input + output tokens) of the models we target.
+CONTEXT_WINDOWS = {
+    "command-a-03-2025": 256_000,
+    "command-r-plus": 128_000,
+    "command-r": 128_000,
+    "gpt-3.5-turbo": 16_385,
+    "gpt-4o": 128_000,
+    "gpt-4o-mini": 128_000,
+}
+DEFAULT_CONTEXT_WINDOW = 8_000
+FALLBACK_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=None):
+    """tiktoken encoder for `model` (built once per process)."""
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model or config.COHERE_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+
+
+def count_tokens(text, model=None):
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def count_tokens_batch(texts, model=None):
+    """Token counts of many texts in one (multi-threaded) encoder call."""
+    encoded = get_encoding(model).encode_batch(list(texts), disallowed_special=())
+    return [len(tokens) for tokens in encoded]
+
+
+def context_window(model=None):
+    model = model or config.COHERE_MODEL
+    if config.LLM_CONTEXT_WINDOW:
+        return config.LLM_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def prompt_budget(overhead_tokens, model=None, max_output_tokens=None):
+    """
+    Tokens left for document text in the prompt.
+
+    Args:
+        overhead_tokens (int): Exact tokens of the prompt without the document text.
+        model (str, optional): Target LLM. Defaults to config.COHERE_MODEL.
+        max_output_tokens (int, optional): Tokens reserved for the answer.
+
+    Returns:
+        int: Remaining budget (never negative).
+    """
+    max_output_tokens = config.LLM_MAX_OUTPUT_TOKENS if max_output_tokens is None else max_output_tokens
+    window = context_window(model) * (1 - config.LLM_TOKEN_SAFETY_MARGIN)
+    if config.LLM_MAX_PROMPT_TOKENS:
+        window = min(window, config.LLM_MAX_PROMPT_TOKENS + max_output_tokens)
+    return max(0, int(window) - max_output_tokens - overhead_tokens)
+
+
+def select_within_budget(candidates, token_counts, weights, budget, group_cost=0, item_cost=0):
+    """
+    Picks items from ranked groups so that their total cost fits in `budget`.
+
+    Each group first gets a share of the budget proportional to its weight and
+    takes its best-ranked items that fit in that share, skipping any item too
+    large for what is left (a greedy 0/1 knapsack per group). The remaining
+    budget is then filled across all groups, best rank first.
+
+    Args:
+        candidates (dict): Group id -> item indices, best first.
+        token_counts (sequence): Token count of every item.
+        weights (dict): Group id -> relative weight (e.g. share of chunks).
+        budget (int): Total tokens available.
+        group_cost (int): Extra tokens paid once per group that gets an item (e.g. a header).
+        item_cost (int): Extra tokens paid per item (e.g. a separator).
+
+    Returns:
+        dict: Group id -> selected item indices, in rank order, for groups with at least one item.
+    """
+    total_weight = sum(weights.values()) or 1
+    selected = {group: [] for group in candidates}
+    taken = set()
+    spent = 0
+
+    def cost(group, index):
+        return token_counts[index] + item_cost + (0 if selected[group] else group_cost)
+
+    for group, ranked in candidates.items():
+        share = budget * weights.get(group, 0) / total_weight
+        group_spent = 0
+        for index in ranked:
+            item = cost(group, index)
+            if group_spent + item <= share and spent + item <= budget:
+                selected[group].append(index)
+                taken.add(index)
+                group_spent += item
+                spent += item
+
+    # Leftover budget: best remaining rank across groups first.
+    leftovers = sorted(
+        ((rank, group, index) for group, ranked in candidates.items()
+         for rank, index in enumerate(ranked) if index not in taken),
+        key=lambda entry: entry[0],
+    )
+    for _, group, index in leftovers:
+        item = cost(group, index)
+        if spent + item <= budget:
+            selected[group].append(index)
+            spent += item
+
+    rank = {index: position for ranked in candidates.values() for position, index in enumerate(ranked)}
+    return {group: sorted(indices, key=rank.get) for group, indices in selected.items() if indices}
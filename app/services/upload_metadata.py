@@ -0,0 +1,314 @@
+"""
+Metadata of the users' uploaded files (the Firestore `uploads` collection).
+
+Listing a user's uploads no longer streams every full document:
+
+- pages are read with cursor-based pagination, newest first (ordered by
+  `uploaded_at`, then document id, so the order is total and a cursor never
+  skips or repeats a document);
+- only the fields the profile page shows are fetched (a projection):
+  filename, dropbox_path, url and uploaded_at;
+- pages are kept in a per-user read-through cache, dropped whenever that
+  user's uploads change through this module (and after
+  `config.UPLOADS_CACHE_TTL` seconds, for writes made elsewhere);
+- writes are batched (up to 500 per Firestore batch).
+
+Backends: "firestore" (also works against the emulator: set
+FIRESTORE_EMULATOR_HOST) and "memory", an in-process stand-in with the same
+ordering and cursor semantics, for tests and offline work.
+
+The Firestore query needs a composite index on `uploads`: user_id ascending,
+uploaded_at descending, __name__ descending.
+"""
+import base64
+import json
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from app import config
+
+LISTED_FIELDS = ("filename", "dropbox_path", "url", "uploaded_at")
+# Firestore's limit on the writes of one batch.
+MAX_BATCH_WRITES = 500
+
+
+@dataclass
+class UploadRecord:
+    """One uploaded file, as listed on the profile page."""
+    id: str
+    filename: str = None
+    dropbox_path: str = None
+    url: str = None
+    uploaded_at: datetime = None
+
+
+@dataclass
+class UploadPage:
+    """
+    A page of a user's uploads.
+
+    Attributes:
+        items (list): UploadRecord, newest first.
+        next_cursor (str): Opaque cursor of the next page, None on the last page.
+    """
+    items: list = field(default_factory=list)
+    next_cursor: str = None
+
+
+def encode_cursor(uploaded_at, document_id):
+    """Opaque, URL-safe cursor after the document (`uploaded_at`, `document_id`)."""
+    value = {"dt": uploaded_at.isoformat()} if isinstance(uploaded_at, datetime) else uploaded_at
+    payload = json.dumps([value, document_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of `encode_cursor`: (uploaded_at, document_id). Raises ValueError if malformed."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, document_id = json.loads(payload)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+    if isinstance(value, dict) and "dt" in value:
+        value = datetime.fromisoformat(value["dt"])
+    return value, document_id
+
+
+class FirestoreBackend:
+    """
+    The `uploads` collection in Firestore.
+
+    Args:
+        client (google.cloud.firestore.Client, optional): Defaults to a client for
+            config.FIRESTORE_PROJECT (credentials from GOOGLE_APPLICATION_CREDENTIALS).
+        collection (str, optional): Defaults to config.UPLOADS_COLLECTION.
+    """
+
+    def __init__(self, client=None, collection=None):
+        from google.cloud import firestore
+
+        self._firestore = firestore
+        self.client = client or firestore.Client(project=config.FIRESTORE_PROJECT or None)
+        self.collection = self.client.collection(collection or config.UPLOADS_COLLECTION)
+
+    def fetch_page(self, user_id, fields, limit, after=None):
+        """(document id, data limited to `fields`) of up to `limit` uploads of a user, after a cursor."""
+        firestore = self._firestore
+        query = (
+            self.collection
+            .where(filter=firestore.FieldFilter("user_id", "==", user_id))
+            .order_by("uploaded_at", direction=firestore.Query.DESCENDING)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
+            .select(list(fields))
+            .limit(limit)
+        )
+        if after is not None:
+            uploaded_at, document_id = after
+            query = query.start_after({"uploaded_at": uploaded_at, "__name__": document_id})
+        return [(snapshot.id, snapshot.to_dict()) for snapshot in query.stream()]
+
+    def commit(self, writes):
+        """Applies ("set", id, data) / ("delete", id, None) writes, MAX_BATCH_WRITES per batch."""
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.client.batch()
+            for operation, document_id, data in writes[start:start + MAX_BATCH_WRITES]:
+                reference = self.collection.document(document_id)
+                if operation == "set":
+                    batch.set(reference, data)
+                else:
+                    batch.delete(reference)
+            batch.commit()
+
+
+class MemoryBackend:
+    """
+    In-process stand-in for the `uploads` collection, with Firestore's ordering and cursors.
+
+    Each user's documents are kept sorted by (uploaded_at, id), so a page is a
+    binary search plus a slice.
+    """
+
+    def __init__(self):
+        self._documents = {}
+        self._order = {}
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def fetch_page(self, user_id, fields, limit, after=None):
+        with self._lock:
+            keys = self._order.get(user_id, [])
+            end = bisect_left(keys, tuple(after)) if after is not None else len(keys)
+            page = keys[max(0, end - limit):end][::-1]
+            self.reads += len(page)
+            return [
+                (document_id, {name: self._documents[document_id][name] for name in fields
+                               if name in self._documents[document_id]})
+                for _, document_id in page
+            ]
+
+    def commit(self, writes):
+        with self._lock:
+            for operation, document_id, data in writes:
+                previous = self._documents.pop(document_id, None)
+                if previous is not None:
+                    self._order[previous["user_id"]].remove((previous["uploaded_at"], document_id))
+                if operation == "set":
+                    self._documents[document_id] = dict(data)
+                    insort(self._order.setdefault(data["user_id"], []), (data["uploaded_at"], document_id))
+
+
+class UploadMetadata:
+    """
+    Reads and writes upload metadata through a backend, with a per-user page cache.
+
+    Args:
+        backend: FirestoreBackend, MemoryBackend or any object with `fetch_page` and `commit`.
+        page_size (int, optional): Default page size. Defaults to config.UPLOADS_PAGE_SIZE.
+        cache_ttl (float, optional): Seconds a cached page is served. Defaults to config.UPLOADS_CACHE_TTL.
+        cache_users (int, optional): Users whose pages are kept (least recently used evicted).
+            Defaults to config.UPLOADS_CACHE_USERS.
+    """
+
+    def __init__(self, backend, page_size=None, cache_ttl=None, cache_users=None):
+        self.backend = backend
+        self.page_size = page_size or config.UPLOADS_PAGE_SIZE
+        self.cache_ttl = config.UPLOADS_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.cache_users = cache_users or config.UPLOADS_CACHE_USERS
+        self._pages = OrderedDict()  # user id -> {(cursor, page size): (expires at, UploadPage)}
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._invalidations = 0
+
+    def list_uploads(self, user_id, cursor=None, page_size=None):
+        """
+        One page of a user's uploads, newest first.
+
+        Args:
+            user_id (str): The user.
+            cursor (str, optional): `next_cursor` of the previous page.
+            page_size (int, optional): Defaults to `self.page_size`.
+
+        Returns:
+            UploadPage: The page (served from the cache when possible).
+        """
+        page_size = page_size or self.page_size
+        key = (cursor, page_size)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pages.get(user_id, {}).get(key)
+            if entry is not None and entry[0] > now:
+                self._pages.move_to_end(user_id)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+
+        after = decode_cursor(cursor) if cursor else None
+        # One extra document tells whether there is a next page.
+        rows = self.backend.fetch_page(user_id, LISTED_FIELDS, page_size + 1, after)
+        items = [UploadRecord(id=document_id, **data) for document_id, data in rows[:page_size]]
+        next_cursor = encode_cursor(items[-1].uploaded_at, items[-1].id) if len(rows) > page_size else None
+        page = UploadPage(items, next_cursor)
+
+        if self.cache_ttl > 0:
+            with self._lock:
+                self._pages.setdefault(user_id, {})[key] = (now + self.cache_ttl, page)
+                self._pages.move_to_end(user_id)
+                while len(self._pages) > self.cache_users:
+                    self._pages.popitem(last=False)
+        return page
+
+    def iter_uploads(self, user_id, page_size=None):
+        """Yields every upload of a user, newest first, one page at a time."""
+        cursor = None
+        while True:
+            page = self.list_uploads(user_id, cursor, page_size)
+            yield from page.items
+            cursor = page.next_cursor
+            if cursor is None:
+                return
+
+    def record_upload(self, user_id, filename, dropbox_path, url, uploaded_at=None):
+        """Records one upload. Returns its UploadRecord."""
+        return self.record_uploads([
+            {"user_id": user_id, "filename": filename, "dropbox_path": dropbox_path, "url": url,
+             "uploaded_at": uploaded_at}
+        ])[0]
+
+    def record_uploads(self, uploads):
+        """
+        Records uploads in batched writes and drops the cached pages of their users.
+
+        Args:
+            uploads (list): Dicts with user_id, filename, dropbox_path, url and
+                optionally uploaded_at (defaults to now, UTC) and id.
+
+        Returns:
+            list: The UploadRecord of each upload.
+        """
+        writes, records = [], []
+        for upload in uploads:
+            data = dict(upload)
+            document_id = data.pop("id", None) or uuid.uuid4().hex
+            data["uploaded_at"] = data.get("uploaded_at") or datetime.now(timezone.utc)
+            writes.append(("set", document_id, data))
+            records.append(UploadRecord(id=document_id, **{name: data.get(name) for name in LISTED_FIELDS}))
+        self.backend.commit(writes)
+        for user_id in {upload["user_id"] for upload in uploads}:
+            self.invalidate(user_id)
+        return records
+
+    def delete_uploads(self, user_id, document_ids):
+        """Deletes uploads of a user in batched writes."""
+        self.backend.commit([("delete", document_id, None) for document_id in document_ids])
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._pages.pop(user_id, None) is not None:
+                self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "invalidations": self._invalidations,
+                "cached_users": len(self._pages),
+            }
+
+
+_backends = {
+    "firestore": FirestoreBackend,
+    "memory": MemoryBackend,
+}
+
+
+def register_backend(name, factory):
+    """Registers a metadata backend factory (a zero-argument callable returning a backend)."""
+    _backends[name] = factory
+
+
+_metadata = None
+_metadata_lock = threading.Lock()
+
+
+def get_upload_metadata():
+    """Returns the process-wide UploadMetadata for config.METADATA_BACKEND."""
+    global _metadata
+    with _metadata_lock:
+        if _metadata is None:
+            if config.METADATA_BACKEND not in _backends:
+                raise ValueError(f"Unknown metadata backend: {config.METADATA_BACKEND!r}")
+            _metadata = UploadMetadata(_backends[config.METADATA_BACKEND]())
+        return _metadata
+
+
+def fetch_user_files(user_id):
+    """Every upload of a user (newest first), read page by page with the listed fields only."""
+    return list(get_upload_metadata().iter_uploads(user_id))
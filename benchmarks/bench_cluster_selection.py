@@ -0,0 +1,63 @@
+"""
+Benchmark: fast vs exhaustive cluster-count selection.
+
+Generates synthetic chunk embeddings (Gaussian blobs on the unit sphere, the
+shape of normalized sentence embeddings) and reports, for each size, the k
+each method picks, its wall-clock time, the sampled silhouette of its final
+labels and the agreement (adjusted Rand index) between the two labelings.
+
+    python -m benchmarks.bench_cluster_selection --sizes 500 2000 5000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.cluster_selection import exhaustive_selection, fast_selection
+
+
+def make_embeddings(n, dim, true_k, spread, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(true_k, dim))
+    labels = rng.integers(true_k, size=n)
+    points = centers[labels] + rng.normal(scale=spread, size=(n, dim))
+    return (points / np.linalg.norm(points, axis=1, keepdims=True)).astype(np.float32)
+
+
+def main():
+    from sklearn.metrics import adjusted_rand_score, silhouette_score
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--true-k", type=int, default=6)
+    parser.add_argument("--spread", type=float, default=0.6)
+    parser.add_argument("--time-budget", type=float, default=0.0)
+    parser.add_argument("--skip-exhaustive-above", type=int, default=20000,
+                        help="Don't run the exhaustive search above this many chunks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    header = f"{'chunks':>7} {'method':>10} {'k':>3} {'seconds':>9} {'silhouette':>10} {'ARI vs exh.':>11}"
+    print(header)
+    print("-" * len(header))
+    for n in args.sizes:
+        embeddings = make_embeddings(n, args.dim, args.true_k, args.spread, args.seed)
+        results = {}
+        if n <= args.skip_exhaustive_above:
+            results["exhaustive"] = exhaustive_selection(embeddings)
+        start = time.perf_counter()
+        results["fast"] = fast_selection(embeddings, time_budget=args.time_budget)
+        results["fast"].seconds = time.perf_counter() - start
+
+        for method, selection in results.items():
+            silhouette = silhouette_score(embeddings, selection.labels, sample_size=min(n, 2000), random_state=0)
+            agreement = (
+                f"{adjusted_rand_score(results['exhaustive'].labels, selection.labels):.3f}"
+                if "exhaustive" in results else "n/a"
+            )
+            print(f"{n:>7} {method:>10} {selection.k:>3} {selection.seconds:>9.2f} {silhouette:>10.3f} {agreement:>11}")
+
+
+if __name__ == "__main__":
+    main()
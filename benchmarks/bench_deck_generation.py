@@ -0,0 +1,127 @@
+"""
+Benchmark: bulk deck generation on the process pool.
+
+Builds a synthetic template (15 slides: 5 per slide type, each with text
+placeholders, a picture and a hyperlink), then for each deck size renders a
+batch of decks with `build_presentations` and reports decks/second,
+slides/second and the peak RSS of the workers. With --single, also renders
+one deck of each size in a fresh process, in memory (`Deck.save`) and
+streamed (`DeckWriter`), and reports the memory each added to the process.
+
+    python -m benchmarks.bench_deck_generation --sizes 10 100 500 --decks 40 20 8
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from app.services.pptx_generator import _peak_rss_mb, build_presentations, get_template
+
+SLIDE_TYPES = ("Title", "Content1", "Content2")
+
+
+def make_template(path):
+    from PIL import Image
+    from pptx import Presentation
+    from pptx.util import Inches, Pt
+
+    prs = Presentation()
+    blank = prs.slide_layouts[6]
+    for index in range(15):
+        slide = prs.slides.add_slide(blank)
+        keys = ["title", "content1", "content2"][: 1 + index // 5]
+        for position, key in enumerate(keys):
+            box = slide.shapes.add_textbox(Inches(0.5), Inches(0.3 + 1.5 * position), Inches(8), Inches(1))
+            run = box.text_frame.paragraphs[0].add_run()
+            run.text = key
+            run.font.size = Pt(32 if position == 0 else 18)
+        image = io.BytesIO()
+        Image.new("RGB", (256, 256), (index * 15, 100, 200)).save(image, "PNG")
+        image.seek(0)
+        slide.shapes.add_picture(image, Inches(7), Inches(5), Inches(2), Inches(2))
+        link = slide.shapes.add_textbox(Inches(0.5), Inches(6.5), Inches(3), Inches(0.5)).text_frame.paragraphs[0].add_run()
+        link.text = "source"
+        link.hyperlink.address = "https://example.com"
+    prs.save(path)
+
+
+def make_slides(count, seed):
+    return [
+        {
+            "type": SLIDE_TYPES[(seed + number) % 3],
+            "title": f"Section {number + 1}",
+            "content1": f"Finding {number} of deck {seed}. " * 6,
+            "content2": f"Detail {number} of deck {seed}. " * 4,
+        }
+        for number in range(count)
+    ]
+
+
+def single_deck(template_path, output_path, slides, streamed):
+    """Renders one deck in this (fresh) process; returns (seconds, MB the deck added to the peak RSS)."""
+    engine = get_template(template_path)
+    before = _peak_rss_mb()
+    start = time.perf_counter()
+    if streamed:
+        engine.write(output_path, make_slides(slides, 0))
+    else:
+        engine.render(make_slides(slides, 0)).save(output_path)
+    return time.perf_counter() - start, _peak_rss_mb() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500], help="Slides per deck")
+    parser.add_argument("--decks", type=int, nargs="+", default=[40, 20, 8], help="Decks of each size")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-memory-mb", type=int, default=None)
+    parser.add_argument("--single", action="store_true", help="Also compare one in-memory and one streamed deck")
+    args = parser.parse_args()
+    deck_counts = (args.decks * len(args.sizes))[: len(args.sizes)] if len(args.decks) == 1 else args.decks
+
+    with tempfile.TemporaryDirectory() as directory:
+        template_path = os.path.join(directory, "Template.pptx")
+        make_template(template_path)
+
+        header = f"{'slides':>6} {'decks':>5} {'seconds':>8} {'decks/s':>8} {'slides/s':>9} {'worker RSS MB':>13} {'MB/deck':>8}"
+        print(header)
+        print("-" * len(header))
+        for slides, count in zip(args.sizes, deck_counts):
+            decks = (
+                (os.path.join(directory, f"deck-{slides}-{number}.pptx"), make_slides(slides, number))
+                for number in range(count)
+            )
+            start = time.perf_counter()
+            results = list(build_presentations(template_path, decks, args.workers, args.max_memory_mb))
+            seconds = time.perf_counter() - start
+            failed = [result for result in results if result.error]
+            written = [result.output_path for result in results if not result.error]
+            size_mb = sum(os.path.getsize(path) for path in written) / max(len(written), 1) / 1024 / 1024
+            print(
+                f"{slides:>6} {count:>5} {seconds:>8.2f} {count / seconds:>8.1f} {count * slides / seconds:>9.0f} "
+                f"{max(result.worker_peak_rss_mb for result in results):>13.1f} {size_mb:>8.2f}"
+                + (f"  ({len(failed)} failed: {failed[0].error})" if failed else "")
+            )
+            for path in written:
+                os.remove(path)
+
+        if args.single:
+            print()
+            header = f"{'slides':>6} {'mode':>9} {'seconds':>8} {'added RSS MB':>12}"
+            print(header)
+            print("-" * len(header))
+            for slides in args.sizes:
+                for streamed in (False, True):
+                    # A process per measurement: peak RSS only ever grows.
+                    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                        output_path = os.path.join(directory, "single.pptx")
+                        seconds, added = pool.submit(single_deck, template_path, output_path, slides, streamed).result()
+                    mode = "streamed" if streamed else "in-memory"
+                    print(f"{slides:>6} {mode:>9} {seconds:>8.3f} {added:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: embedding backends, their throughput and their agreement with fp32.
+
+Splits a synthetic corpus (see bench_pipeline.make_corpus) into sentences and,
+for each backend, reports:
+
+- sentences/second, with the backend's length-bucketed dynamic batching and
+  with SentenceTransformer's own fixed batches (`--plain-batch-size`);
+- the cosine similarity of its sentence vectors to the fp32 "torch" ones (mean and minimum);
+- how stable the pipeline's decisions stay: the F1 of its semantic chunk
+  boundaries against the fp32 ones (`chunker.iter_semantic_chunks`), and the
+  adjusted Rand index of the chunk clusters (k fixed to the one picked on the
+  fp32 vectors), plus the k it would pick itself.
+
+    python -m benchmarks.bench_embedding_backends --backends torch torch-int8 onnx onnx-int8
+    python -m benchmarks.bench_embedding_backends --words 20000 --threads 4
+
+A backend whose boundary F1 or clustering ARI falls below --min-boundary-f1 /
+--min-ari fails the check, and the exit status is 1; so does an unavailable
+fp32 reference. tests/test_embedding_backends.py runs the same check on a stub
+model in CI.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app import config
+from app.services.chunker import iter_semantic_chunks, iter_sentences
+from app.services.cluster_selection import select_clusters
+from app.services.embedding_backends import load_backend
+from benchmarks.bench_pipeline import make_corpus
+
+
+def throughput(encode, sentences, repeat):
+    """Best sentences/second over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(sentences)
+        best = min(best, time.perf_counter() - started)
+    return len(sentences) / best
+
+
+def boundaries(chunks):
+    """Character offsets where each chunk ends (chunks are joined by single spaces)."""
+    return set(np.cumsum([len(chunk) + 1 for chunk in chunks]).tolist())
+
+
+def boundary_f1(reference, candidate):
+    if not reference and not candidate:
+        return 1.0
+    common = len(reference & candidate)
+    return 2 * common / (len(reference) + len(candidate))
+
+
+def unit(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def main():
+    from sklearn.metrics import adjusted_rand_score
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx", "onnx-int8"])
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL)
+    parser.add_argument("--words", type=int, default=10000, help="Words in the corpus")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=config.EMBEDDING_THREADS, help="Intra-op threads (0: default)")
+    parser.add_argument("--batch-tokens", type=int, default=config.EMBEDDING_BATCH_TOKENS)
+    parser.add_argument("--plain-batch-size", type=int, default=32, help="Batch size of the unbucketed runs")
+    parser.add_argument("--threshold", type=float, default=0.7, help="Chunking similarity threshold")
+    parser.add_argument("--max-tokens", type=int, default=200, help="Chunking token limit")
+    parser.add_argument("--min-boundary-f1", type=float, default=0.95)
+    parser.add_argument("--min-ari", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config.EMBEDDING_THREADS = args.threads
+    config.EMBEDDING_BATCH_TOKENS = args.batch_tokens
+    config.EMBEDDING_CACHE_ENABLED = False
+    text = make_corpus(args.words, args.seed)
+    sentences = list(iter_sentences(text))
+    backends = ["torch"] + [name for name in args.backends if name != "torch"]
+
+    reference = None
+    failures = []
+    header = (f"{'backend':>11} {'sent/s':>9} {'plain/s':>9} {'cos mean':>9} {'cos min':>8} "
+              f"{'chunks':>6} {'bound F1':>8} {'k':>3} {'ARI':>6}")
+    print(f"{len(sentences)} sentences, {args.model}, threads={args.threads or 'default'}")
+    print(header)
+    print("-" * len(header))
+    for name in backends:
+        try:
+            backend = load_backend(args.model, name)
+        except Exception as exc:
+            print(f"{name:>11} unavailable: {exc}")
+            if reference is None:
+                # Without the fp32 vectors there is nothing to check the other backends against.
+                print("The fp32 'torch' reference backend is unavailable: no accuracy check.")
+                sys.exit(1)
+            continue
+        backend.set_threads(args.threads)
+        backend.encode(sentences[:64])  # warm-up
+
+        bucketed = throughput(backend.encode, sentences, args.repeat)
+        plain = throughput(
+            lambda texts: backend.model.encode(texts, batch_size=args.plain_batch_size, show_progress_bar=False),
+            sentences, args.repeat,
+        )
+        vectors = backend.encode(sentences)
+        chunks = list(iter_semantic_chunks(text, args.threshold, args.max_tokens, embed=backend.encode))
+
+        if reference is None:
+            reference = {"vectors": unit(vectors), "chunks": chunks}
+            reference["chunk_vectors"] = backend.encode(chunks)
+            reference["k"] = select_clusters(reference["chunk_vectors"]).k
+            reference["labels"] = select_clusters(reference["chunk_vectors"], n_clusters=reference["k"]).labels
+
+        cosines = np.einsum("ij,ij->i", unit(vectors), reference["vectors"])
+        f1 = boundary_f1(boundaries(reference["chunks"]), boundaries(chunks))
+        # Clusters of the same (fp32) chunks, so that only the vectors differ.
+        chunk_vectors = backend.encode(reference["chunks"])
+        labels = select_clusters(chunk_vectors, n_clusters=reference["k"]).labels
+        ari = adjusted_rand_score(reference["labels"], labels)
+        k = select_clusters(chunk_vectors).k
+        print(
+            f"{name:>11} {bucketed:>9.0f} {plain:>9.0f} {cosines.mean():>9.4f} {cosines.min():>8.4f} "
+            f"{len(chunks):>6} {f1:>8.3f} {k:>3} {ari:>6.3f}"
+        )
+        if f1 < args.min_boundary_f1 or ari < args.min_ari:
+            failures.append(f"{name}: boundary F1 {f1:.3f}, ARI {ari:.3f}")
+
+    if failures:
+        print()
+        print("Below the accuracy thresholds:")
+        print("\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Benchmark: every stage of `summarize_document`, over synthetic corpora of increasing size.
+
+Generates deterministic documents (paragraphs of sentences drawn from a few
+topic vocabularies) of each size, and summarizes each one `--repeat` times
+with the LLM replaced by an in-process stub (its latency is --llm-latency), so
+that only our own stages are measured. The result and embedding caches are off.
+The real sentence splitter and embedding model are used, loaded before timing.
+
+For every size and mode it reports the median, over the repeats, of each stage's
+wall time, CPU time, peak memory and counters (see app/services/instrumentation.py).
+
+    python -m benchmarks.bench_pipeline --sizes 1000 5000 20000 80000
+    python -m benchmarks.bench_pipeline --json baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json --tolerance 0.25
+
+With --baseline, a stage whose median wall time grew by more than the tolerance
+(and by more than --min-delta seconds, to ignore noise on tiny stages) is
+reported as a regression and the exit status is 1.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tracemalloc
+
+import numpy as np
+
+from app import config
+from app.services import instrumentation, llm_gateway, model_registry
+from app.services.llm_stub import _answer
+from app.services.summary_generator import summarize_document
+
+TOPICS = {
+    "energy": "solar wind turbine grid storage battery power plant emissions carbon capacity demand",
+    "finance": "revenue margin capital investors quarter growth debt equity cash dividend forecast",
+    "health": "patients clinical trial treatment dose outcomes hospital vaccine symptoms therapy risk",
+    "software": "latency deployment service cache database queue release incident throughput api",
+    "climate": "temperature rainfall drought ocean ice sea level adaptation flood heatwave",
+    "policy": "regulation law committee vote reform agency compliance budget minister tariff",
+}
+FILLER = "the a of in and to with for on that this which across during while after".split()
+MODES = {
+    "select": {"mode": "select"},
+    "map_reduce": {"mode": "map_reduce"},
+    "extractive": {"vocabulary": "extractive"},
+}
+
+
+def make_corpus(words, seed=0):
+    """A document of about `words` words: paragraphs on one topic each, topics drifting along."""
+    rng = np.random.default_rng(seed)
+    names = sorted(TOPICS)
+    vocabularies = {name: TOPICS[name].split() for name in names}
+    paragraphs, total = [], 0
+    while total < words:
+        topic = vocabularies[names[rng.integers(len(names))]]
+        sentences = []
+        for _ in range(rng.integers(3, 8)):
+            length = int(rng.integers(8, 24))
+            tokens = [topic[i] if rng.random() < 0.6 else FILLER[i % len(FILLER)]
+                      for i in rng.integers(len(topic), size=length)]
+            sentences.append(" ".join(tokens).capitalize() + ".")
+            total += length
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+class StubProvider:
+    """In-process LLM stand-in answering like app/services/llm_stub.py, after `latency` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    async def complete(self, prompt, max_tokens, temperature):
+        await asyncio.sleep(self.latency)
+        return " ".join(_answer(prompt, max_tokens))
+
+    async def stream(self, prompt, max_tokens, temperature):
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(_answer(prompt, max_tokens)):
+            yield word if i == 0 else " " + word
+
+    async def aclose(self):
+        pass
+
+
+def run_once(text, options):
+    with instrumentation.trace() as trace:
+        summarize_document(None, text, **options)
+    return trace
+
+
+def median_stages(traces):
+    """Per stage: the median of each measure over the traces (0 for a run without the stage)."""
+    per_run = [trace.stages() for trace in traces]
+    names = list(dict.fromkeys(name for stages in per_run for name in stages))
+    medians = {}
+    for name in names:
+        measures = list(dict.fromkeys(key for stages in per_run for key in stages.get(name, {})))
+        medians[name] = {
+            key: statistics.median(stages.get(name, {}).get(key, 0) for stages in per_run) for key in measures
+        }
+    medians["total"] = {"wall": statistics.median(trace.wall for trace in traces)}
+    return medians
+
+
+def print_table(size, mode, stages):
+    for name, measures in stages.items():
+        counts = {key: value for key, value in measures.items() if key not in ("calls", "wall", "cpu", "peak_mb")}
+        print(
+            f"{size:>7} {mode:>10} {name:>8} {measures.get('calls', 1):>5.0f} {measures['wall'] * 1000:>10.1f} "
+            f"{measures.get('cpu', 0) * 1000:>10.1f} {measures.get('peak_mb', 0):>8.1f}  "
+            + " ".join(f"{key}={value:.0f}" for key, value in counts.items())
+        )
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """Lines describing the stages slower than in `baseline`."""
+    regressions = []
+    for run_key, stages in results.items():
+        for name, measures in stages.items():
+            before = baseline.get(run_key, {}).get(name)
+            if before is None:
+                continue
+            delta = measures["wall"] - before["wall"]
+            if delta > min_delta and measures["wall"] > before["wall"] * (1 + tolerance):
+                regressions.append(
+                    f"{run_key} {name}: {before['wall'] * 1000:.1f} ms -> {measures['wall'] * 1000:.1f} ms "
+                    f"(+{delta / before['wall'] * 100 if before['wall'] else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 80000], help="Words per document")
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["select", "extractive"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub waits per call")
+    parser.add_argument("--summary-length", default="moderate")
+    parser.add_argument("--tracemalloc", action="store_true", help="Peak memory from tracemalloc instead of the RSS")
+    parser.add_argument("--profile", default="", help="Stages to run under cProfile (comma-separated, or *)")
+    parser.add_argument("--profile-dir", default=None, help="Where to dump the cProfile files")
+    parser.add_argument("--json", help="Write the results to this file (e.g. as the next baseline)")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown per stage (fraction)")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns below this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    llm_gateway.register_provider("bench-stub", lambda: StubProvider(args.llm_latency))
+    config.LLM_PROVIDER = "bench-stub"
+    config.RESULT_CACHE_ENABLED = False
+    config.EMBEDDING_CACHE_ENABLED = False
+    config.EXTRACTIVE_FALLBACK = False
+    if args.tracemalloc:
+        config.METRICS_TRACEMALLOC = True
+        tracemalloc.start()
+    profiler = None
+    if args.profile:
+        stages = None if args.profile == "*" else args.profile.split(",")
+        profiler = instrumentation.add_hook(instrumentation.StageProfiler(stages, args.profile_dir))
+
+    # Load the models and warm every code path up before timing anything.
+    model_registry.warm_up()
+    for mode in args.modes:
+        run_once(make_corpus(4000, args.seed), dict(MODES[mode], summary_length=args.summary_length))
+
+    results = {}
+    header = (f"{'words':>7} {'mode':>10} {'stage':>8} {'calls':>5} {'wall ms':>10} {'cpu ms':>10} "
+              f"{'peak MB':>8}  counts")
+    print(header)
+    print("-" * len(header))
+    for size in args.sizes:
+        text = make_corpus(size, args.seed)
+        for mode in args.modes:
+            options = dict(MODES[mode], summary_length=args.summary_length)
+            stages = median_stages([run_once(text, options) for _ in range(args.repeat)])
+            results[f"{size}/{mode}"] = stages
+            print_table(size, mode, stages)
+    llm_gateway.close()
+
+    if profiler is not None:
+        for name in profiler.profiled():
+            print(f"\n=== cProfile: {name} ===")
+            profiler.stats(name).sort_stats("cumulative").print_stats(15)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as source:
+            regressions = compare(results, json.load(source), args.tolerance, args.min_delta)
+        print()
+        print("\n".join(regressions) if regressions else "No regression against the baseline.")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: template inspection through python-pptx vs the shape index.
+
+Builds a synthetic template of N slides (text boxes, pictures, picture-filled
+shapes, nested groups) and answers, for every slide, count_textboxes,
+get_textboxes and the recursive count_images: once by walking python-pptx
+shapes (as in Extra code/testppt.ipynb), once from a `ShapeIndex`. Checks
+that both agree and reports the time of each, loading included.
+
+    python -m benchmarks.bench_pptx_index --slides 50 200 500
+"""
+import argparse
+import copy
+import io
+import os
+import tempfile
+import time
+
+from app.services.pptx_index import ShapeIndex
+
+
+def make_template(path, slides):
+    from PIL import Image
+    from pptx import Presentation
+    from pptx.enum.shapes import MSO_SHAPE
+    from pptx.util import Inches
+
+    image = io.BytesIO()
+    Image.new("RGB", (64, 64), (20, 100, 200)).save(image, "PNG")
+
+    prs = Presentation()
+    for number in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[number % 9])
+        for row in range(4):
+            slide.shapes.add_textbox(Inches(1), Inches(1 + row), Inches(4), Inches(1)).text = f"Text {number}.{row}"
+        image.seek(0)
+        picture = slide.shapes.add_picture(image, 0, 0)
+        group = slide.shapes.add_group_shape()
+        inner = group.shapes.add_group_shape()
+        for _ in range(2):
+            image.seek(0)
+            inner.shapes.add_picture(image, 0, 0)
+        inner.shapes.add_textbox(0, 0, 100, 100).text = "nested"
+        oval = slide.shapes.add_shape(MSO_SHAPE.OVAL, 0, 0, 100, 100)
+        blip_fill = copy.deepcopy(picture._element.blipFill)
+        blip_fill.tag = "{http://schemas.openxmlformats.org/drawingml/2006/main}blipFill"
+        oval._element.spPr.insert(2, blip_fill)
+    prs.save(path)
+
+
+def with_python_pptx(path):
+    from pptx import Presentation
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+    def count_images_in_shape(shape):
+        total = 0
+        if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+            total += 1
+        elif shape.shape_type != MSO_SHAPE_TYPE.GROUP:
+            try:
+                if shape.fill.type == 6:
+                    total += 1
+            except AttributeError:
+                pass
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            for subshape in shape.shapes:
+                total += count_images_in_shape(subshape)
+        return total
+
+    answers = []
+    for slide in Presentation(path).slides:
+        textboxes = [shape.text for shape in slide.shapes if shape.has_text_frame]
+        count = sum(1 for shape in slide.shapes if shape.has_text_frame)
+        answers.append((count, textboxes, sum(count_images_in_shape(shape) for shape in slide.shapes)))
+    return answers
+
+
+def with_index(path):
+    index = ShapeIndex.from_file(path)
+    return [
+        (index.count_textboxes(slide), [shape.text for shape in index.get_textboxes(slide)], index.count_images(slide))
+        for slide in range(index.slide_count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--slides", type=int, nargs="+", default=[50, 200, 500])
+    args = parser.parse_args()
+
+    header = f"{'slides':>6} {'python-pptx s':>13} {'index s':>8} {'speedup':>8} {'agree':>6}"
+    print(header)
+    print("-" * len(header))
+    with tempfile.TemporaryDirectory() as directory:
+        for slides in args.slides:
+            path = os.path.join(directory, f"template-{slides}.pptx")
+            make_template(path, slides)
+            start = time.perf_counter()
+            expected = with_python_pptx(path)
+            reference = time.perf_counter() - start
+            start = time.perf_counter()
+            answers = with_index(path)
+            indexed = time.perf_counter() - start
+            print(f"{slides:>6} {reference:>13.3f} {indexed:>8.3f} {reference / indexed:>7.1f}x {str(answers == expected):>6}")
+
+
+if __name__ == "__main__":
+    main()
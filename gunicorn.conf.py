@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for the DocAI API.
+
+The app and its models are loaded once in the master process and the workers
+are forked from it, so every worker shares the model weights copy-on-write.
+"""
+import gc
+import os
+
+from app import config
+from app.services import model_registry
+
+wsgi_app = "app.main:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("DOCAI_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("DOCAI_WORKERS", "2"))
+preload_app = True
+
+
+def when_ready(server):
+    # Load only; running inference here would start thread pools that do not survive fork.
+    if config.PRELOAD_MODELS:
+        model_registry.warm_up()
+    # Keep the collector from touching (and so copying) the preloaded objects in the workers.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    model_registry.after_fork()
@@ -12,11 +12,21 @@ import { Footer } from '../components/Footer';
 import { Document as DocxDocument, Packer, Paragraph, TextRun } from 'docx';
 import { saveAs } from 'file-saver';
 
+const API_URL = import.meta.env.VITE_API_URL ?? 'http://localhost:8000';
+
+// Preset lengths of the backend (scaled to the document, see adjust_summary_length)
+const SUMMARY_LENGTHS: { [key: string]: string } = {
+  short: 'low',
+  medium: 'moderate',
+  long: 'high',
+};
+
 export function SummaryPage() {
   const [file, setFile] = useState<File | null>(null);
   const [textContent, setTextContent] = useState('');
   const [summary, setSummary] = useState('');
   const [isProcessing, setIsProcessing] = useState(false);
+  const [processingStage, setProcessingStage] = useState('');
   const [selectedText, setSelectedText] = useState('');
   const [showActions, setShowActions] = useState(false);
   const [actionPosition, setActionPosition] = useState({ x: 0, y: 0 });
@@ -119,32 +129,70 @@ export function SummaryPage() {
     }
 
     setIsProcessing(true);
-    
-    // Simulate AI processing with preferences
-    setTimeout(() => {
-      const formatText = summaryFormat === 'bullet' ? 'bullet points' : 'paragraph';
-      const lengthText = summaryLength === 'custom' ? `${customWordCount} words` : summaryLength;
-      
-      let mockSummary = `Summary of "${file?.name || 'your text'}" (${formatText}, ${summaryType} style, ${summaryTone} tone, ${summaryLanguage}, ${lengthText} length):\n\n`;
-      
-      if (summaryFormat === 'bullet') {
-        mockSummary += `• Main topic identified and analyzed based on ${summaryType} approach\n• Content processed with ${summaryTone} tone in ${summaryLanguage}\n• Supporting arguments and evidence summarized\n• Key conclusions and recommendations highlighted\n• Action items extracted (if applicable)\n\nThe summary condenses the original content while preserving essential information and context.`;
-      } else {
-        mockSummary += `This ${summaryType} summary has been generated with a ${summaryTone} tone in ${summaryLanguage}. The AI has analyzed the content and extracted the main topics, supporting arguments, and key conclusions. All essential information has been preserved while condensing the original content to approximately ${lengthText} in length. The summary maintains context and provides a comprehensive overview of the document's core message and important details.`;
+    setProcessingStage('');
+    setSummary('');
+
+    const form = new FormData();
+    if (file) {
+      form.append('file', file);
+    } else {
+      form.append('text', textContent);
+    }
+    form.append('options', JSON.stringify({
+      summary_format: summaryFormat === 'bullet' ? 'bullet points' : 'paragraph',
+      summary_length: summaryLength === 'custom' ? Number(customWordCount) || 150 : SUMMARY_LENGTHS[summaryLength],
+      summary_tone: summaryTone,
+      language: summaryLanguage,
+    }));
+
+    const fail = (message: string) => {
+      setIsProcessing(false);
+      setProcessingStage('');
+      toast.error(message);
+    };
+
+    try {
+      // The job starts at once; progress and the summary itself arrive as Server-Sent Events
+      const response = await fetch(`${API_URL}/summary/jobs`, { method: 'POST', body: form });
+      if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        fail(typeof error.detail === 'string' ? error.detail : 'Could not start the summary');
+        return;
       }
-      
-      setSummary(mockSummary);
-      
-      addDocument({
-        name: file?.name || 'Text Summary',
-        type: 'summary',
-        content: textContent || file?.name || '',
-        result: mockSummary,
+      const job = await response.json();
+      const events = new EventSource(`${API_URL}${job.events_url}`);
+
+      events.addEventListener('progress', (e) => {
+        setProcessingStage(JSON.parse((e as MessageEvent).data).stage);
       });
-      
-      setIsProcessing(false);
-      toast.success('Summary generated successfully!');
-    }, 2000);
+      events.addEventListener('token', (e) => {
+        const { delta } = JSON.parse((e as MessageEvent).data);
+        setSummary((current) => current + delta);
+      });
+      events.addEventListener('done', (e) => {
+        const result = JSON.parse((e as MessageEvent).data).summary;
+        events.close();
+        setSummary(result);
+        addDocument({
+          name: file?.name || 'Text Summary',
+          type: 'summary',
+          content: textContent || file?.name || '',
+          result,
+        });
+        setIsProcessing(false);
+        setProcessingStage('');
+        toast.success('Summary generated successfully!');
+      });
+      events.addEventListener('error', (e) => {
+        const data = (e as MessageEvent).data;
+        // Without data this is a dropped connection: the browser resumes it from the last event
+        if (!data && events.readyState === EventSource.CONNECTING) return;
+        events.close();
+        fail(data ? JSON.parse(data).message : 'Lost the connection to the server');
+      });
+    } catch {
+      fail('Could not reach the server');
+    }
   };
 
   const handleDownloadDocx = () => {
@@ -339,7 +387,7 @@ export function SummaryPage() {
                   {isProcessing ? (
                     <>
                       <Loader2 className="size-4 mr-2 animate-spin" />
-                      Processing...
+                      {processingStage ? `Processing (${processingStage})...` : 'Processing...'}
                     </>
                   ) : (
                     <>
@@ -0,0 +1,92 @@
+import hashlib
+import re
+
+import numpy as np
+import pytest
+from sklearn.metrics import adjusted_rand_score
+
+from app.services import model_registry
+from app.services.chunker import iter_semantic_chunks, iter_sentences
+from app.services.cluster_selection import select_clusters
+from app.services.embedding_backends import EmbeddingBackend
+from benchmarks.bench_embedding_backends import boundaries, boundary_f1
+from benchmarks.bench_pipeline import make_corpus
+
+
+class StubModel:
+    """fp32 stand-in for a SentenceTransformer: hashed bag of words, recording each batch it is given."""
+
+    dim = 64
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        self.batches.append(list(texts))
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class Sentencizer:
+    """Stand-in for the spaCy sentencizer: splits after . ! and ?."""
+
+    class Doc:
+        def __init__(self, text):
+            self.sents = [type("Span", (), {"text": sentence})() for sentence in re.split(r"(?<=[.!?])\s+", text)]
+
+    def pipe(self, blocks, batch_size=8):
+        for block in blocks:
+            yield self.Doc(block)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = StubModel()
+    monkeypatch.setitem(model_registry._models, "sentencizer", Sentencizer())
+    monkeypatch.setitem(model_registry._models, "embedding", model)
+    return model
+
+
+def test_encode_returns_rows_in_input_order_across_buckets(model):
+    rng = np.random.default_rng(0)
+    texts = [" ".join(f"w{i}" for i in rng.integers(100, size=rng.integers(1, 60))) for _ in range(200)]
+    backend = EmbeddingBackend("stub", lambda: model, batch_tokens=256, max_batch_size=16)
+
+    vectors = backend.encode(texts)
+    bucketed = model.batches
+    model.batches = []
+
+    assert vectors.dtype == np.float32
+    np.testing.assert_array_equal(vectors, model.encode(texts))
+    assert len(bucketed) > 1
+    assert sorted(text for batch in bucketed for text in batch) == sorted(texts)
+    lengths = backend.token_lengths(texts)
+    for batch in bucketed:
+        assert len(batch) <= 16
+        assert len(batch) == 1 or len(batch) * max(len(text) // 4 + 2 for text in batch) <= 256
+    # Shortest texts first: each batch's texts are no longer than the next batch's.
+    batch_lengths = [[len(text) // 4 + 2 for text in batch] for batch in bucketed]
+    assert all(max(a) <= min(b) for a, b in zip(batch_lengths, batch_lengths[1:]))
+    assert max(lengths) == max(batch_lengths[-1])
+    np.testing.assert_array_equal(backend.encode(texts[7]), vectors[7])
+
+
+def test_batched_backend_keeps_chunks_and_clusters(model):
+    text = make_corpus(3000, seed=1)
+    backend = EmbeddingBackend("stub", lambda: model, batch_tokens=512, max_batch_size=32)
+
+    reference = list(iter_semantic_chunks(text, 0.3, 120, embed=model.encode))
+    chunks = list(iter_semantic_chunks(text, 0.3, 120, embed=backend.encode))
+
+    assert len(list(iter_sentences(text))) > len(reference) > 10
+    assert boundary_f1(boundaries(reference), boundaries(chunks)) == 1.0
+
+    reference_vectors = model.encode(reference)
+    k = select_clusters(reference_vectors).k
+    reference_labels = select_clusters(reference_vectors, n_clusters=k).labels
+    labels = select_clusters(backend.encode(reference), n_clusters=k).labels
+    assert k > 1
+    assert adjusted_rand_score(reference_labels, labels) == 1.0
@@ -0,0 +1,119 @@
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from app.services.embedding_cache import _PENDING_TIMEOUT_NS, EmbeddingCache
+
+
+class FailingInsert:
+    """Connection proxy whose INSERT INTO entries fails, as an integrity error or a crash would."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def executemany(self, sql, rows):
+        if sql.startswith("INSERT INTO entries"):
+            raise sqlite3.IntegrityError("simulated")
+        return self._db.executemany(sql, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def vectors(*values):
+    return np.array([[value] * 4 for value in values], dtype=np.float32)
+
+
+def test_rolled_back_put_keeps_evicted_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many("m", [b"a", b"b"], vectors(1, 2))
+
+    # Fails on the INSERT, after the LRU entries were evicted: the rollback must restore them intact.
+    db, cache._db = cache._db, FailingInsert(cache._db)
+    with pytest.raises(sqlite3.IntegrityError):
+        cache.put_many("m", [b"c", b"d"], vectors(9, 9))
+    cache._db = db
+
+    found = cache.get_many("m", [b"a", b"b"])
+    assert found[b"a"].tolist() == [1] * 4
+    assert found[b"b"].tolist() == [2] * 4
+
+
+def test_duplicate_keys_keep_the_last_vector(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many("m", [b"a", b"b"], vectors(1, 2))
+    cache.put_many("m", [b"c", b"c"], vectors(8, 9))
+
+    found = cache.get_many("m", [b"a", b"b", b"c"])
+    assert found[b"c"].tolist() == [9] * 4
+    assert len(found) == 2
+
+
+def test_replaced_entries_are_visible_after_the_put(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many("m", [b"a", b"b"], vectors(1, 2))
+    cache.put_many("m", [b"a", b"c"], vectors(5, 3))
+
+    found = cache.get_many("m", [b"a", b"b", b"c"])
+    assert found[b"a"].tolist() == [5] * 4
+    assert found[b"c"].tolist() == [3] * 4
+
+
+def claim(cache, keys, age_ns=0):
+    """Marks entries pending, as a concurrent put_many does until their vectors are written."""
+    cache._db.executemany(
+        "UPDATE entries SET last_used = ? WHERE key = ?",
+        [(-(time.time_ns() - age_ns), key) for key in keys],
+    )
+
+
+def test_pending_entries_are_never_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many("m", [b"a", b"b"], vectors(1, 2))
+    claim(cache, [b"a"])
+
+    # One slot can be freed (b's); c and d don't both fit, the last one is kept.
+    cache.put_many("m", [b"c", b"d"], vectors(3, 4))
+    slots = dict(cache._db.execute("SELECT key, slot FROM entries"))
+    assert set(slots) == {b"a", b"d"}
+    assert cache._open_vectors("m", 4, 2)[slots[b"a"]].tolist() == [1] * 4
+    assert cache.get_many("m", [b"d"])[b"d"].tolist() == [4] * 4
+
+    # A key another writer is storing is left to it.
+    cache.put_many("m", [b"a"], vectors(9))
+    assert cache._db.execute("SELECT last_used < 0 FROM entries WHERE key = ?", (b"a",)).fetchone() == (1,)
+
+
+def test_stale_pending_entries_are_reclaimed(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many("m", [b"a", b"b"], vectors(1, 2))
+    claim(cache, [b"a", b"b"], age_ns=2 * _PENDING_TIMEOUT_NS)
+
+    cache.put_many("m", [b"a", b"c"], vectors(5, 3))
+
+    found = cache.get_many("m", [b"a", b"b", b"c"])
+    assert found[b"a"].tolist() == [5] * 4
+    assert found[b"c"].tolist() == [3] * 4
+    assert b"b" not in found
+
+
+def test_final_update_needs_the_claim(tmp_path):
+    # A pending row reclaimed and claimed again by someone else is not published by the first writer.
+    cache = EmbeddingCache(str(tmp_path), max_entries=1)
+    cache.put_many("m", [b"a"], vectors(1))
+    original = cache._transaction
+    calls = []
+
+    def transaction():
+        calls.append(None)
+        if len(calls) == 2:  # between the index commit and the final update
+            claim(cache, [b"b"])
+        return original()
+
+    cache._transaction = transaction
+    cache.put_many("m", [b"b"], vectors(2))
+    cache._transaction = original
+
+    assert cache.get_many("m", [b"b"]) == {}
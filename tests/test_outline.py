@@ -0,0 +1,209 @@
+import zipfile
+
+import pytest
+
+from app.services import outline
+from app.services.outline import Outline, OutlineCache, Section, _close_sections, _docx_heading_levels
+
+MARKUP = """\
+Annual Report
+=============
+Opening words.
+
+# Overview
+Overview text, café.
+
+Scope
+-----
+Scope text.
+
+---
+
+Chapter 7: Results
+Results text.
+## Details ##
+Details text.
+Part II
+Closing text.
+"""
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    cache = OutlineCache(str(tmp_path / "outlines"))
+    monkeypatch.setattr(outline, "_cache", cache)
+    return cache
+
+
+def test_markup_headings():
+    headings = outline._markup_headings(outline._iter_char_lines(MARKUP))
+
+    assert [(title, level) for title, level, _ in headings] == [
+        ("Annual Report", 1), ("Overview", 1), ("Scope", 2), ("Chapter 7: Results", 1), ("Details", 2), ("Part II", 1),
+    ]
+    # An underlined heading starts at its text line, not at the underline.
+    assert MARKUP[headings[0][2]:].startswith("Annual Report")
+    assert MARKUP[headings[2][2]:].startswith("Scope\n")
+
+
+def test_sections_include_their_subsections():
+    sections = outline.text_outline(MARKUP).sections
+    by_title = {section.title: section for section in sections}
+
+    assert by_title["Overview"].next_title == "Chapter 7: Results"
+    assert by_title["Scope"].next_title == "Chapter 7: Results"
+    assert by_title["Chapter 7: Results"].next_title == "Part II"
+    assert by_title["Part II"].stop is None
+    assert outline.extract_section_from_text(MARKUP, "details") == "## Details ##\nDetails text."
+
+
+def test_txt_sections_are_read_by_byte_offset(tmp_path, cache):
+    path = tmp_path / "report.txt"
+    path.write_text(MARKUP, encoding="utf-8")
+
+    built = cache.get(str(path))
+
+    assert built.unit == "byte"
+    # "café" takes two bytes: offsets after it differ from character offsets.
+    scope = built.find("Scope")
+    assert scope.start == MARKUP.encode("utf-8").index(b"Scope\n")
+    assert outline.read_section(str(path), scope, built) == "Scope\n-----\nScope text.\n\n---"
+    assert outline.extract_section_from_file(str(path), "chapter 7").startswith("Chapter 7: Results\nResults text.")
+    assert outline.extract_section_from_file(str(path), "Overview").endswith("Scope text.\n\n---")
+
+
+def test_find():
+    found = Outline("char", "markup", [
+        Section("Introduction", 1, 0), Section("Chapter 7: Results and Discussion", 1, 10),
+        Section("Methods", 1, 20), Section("Appendix: Raw results", 1, 30),
+    ])
+
+    assert found.find("  INTRODUCTION. ").start == 0
+    assert found.find("chapter 7").start == 10
+    assert found.find("chapter").start == 10
+    assert found.find("raw results").start == 30
+    assert found.find("Methds").start == 20
+    assert found.find("chapter 70") is None
+    assert found.find("Conclusion") is None
+    assert found.find("") is None
+
+
+def test_close_sections_with_out_of_order_headings():
+    # A table of contents listing a later section first.
+    sections = _close_sections([("B", 1, 5), ("A", 1, 2), ("A.1", 2, 3), ("C", 1, 9)], end=12)
+
+    assert [(section.title, section.start, section.stop) for section in sections] == [
+        ("B", 5, 5), ("A", 2, 9), ("A.1", 3, 9), ("C", 9, 12),
+    ]
+    assert all(section.stop >= section.start for section in sections)
+
+
+def test_pdf_bookmarks_are_ordered_by_page(tmp_path):
+    pymupdf = pytest.importorskip("pymupdf")
+    path = str(tmp_path / "toc.pdf")
+    with pymupdf.open() as document:
+        for number in range(6):
+            document.new_page().insert_text((72, 72), f"Page {number + 1}")
+        document.set_toc([[1, "Results", 4], [1, "Introduction", 1], [2, "Background", 2], [1, "Appendix", 6]])
+        document.save(path)
+
+    built = outline.build_outline(path)
+
+    assert built.source == "bookmarks"
+    assert [(section.title, section.start, section.stop) for section in built.sections] == [
+        ("Introduction", 0, 4), ("Background", 1, 4), ("Results", 3, 6), ("Appendix", 5, None),
+    ]
+
+
+def test_pdf_font_headings(tmp_path):
+    pymupdf = pytest.importorskip("pymupdf")
+    path = str(tmp_path / "fonts.pdf")
+    body = "This is body text set in the regular font size of the document."
+    with pymupdf.open() as document:
+        for number in range(5):
+            page = document.new_page()
+            page.insert_text((72, 40), "ACME Quarterly", fontsize=16)  # running header
+            y = 100
+            if number in (1, 3):
+                title = ["Market Overview and", "Outlook"] if number == 1 else ["Risks"]
+                for line in title:
+                    page.insert_text((72, y), line, fontsize=20)
+                    y += 26
+            for _ in range(12):
+                page.insert_text((72, y), body, fontsize=11)
+                y += 16
+            page.insert_text((300, 800), str(number + 1), fontsize=16)  # page number
+        document.save(path)
+
+    headings = outline._pdf_font_headings(path)
+
+    assert headings == [("Market Overview and Outlook", 1, 1), ("Risks", 1, 3)]
+
+
+def styles_xml(*styles):
+    body = "".join(styles)
+    return (
+        '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"{body}</w:styles>"
+    )
+
+
+def style(style_id, name, based_on=None, outline_level=None):
+    parts = [f'<w:style w:type="paragraph" w:styleId="{style_id}"><w:name w:val="{name}"/>']
+    if based_on:
+        parts.append(f'<w:basedOn w:val="{based_on}"/>')
+    if outline_level is not None:
+        parts.append(f'<w:pPr><w:outlineLvl w:val="{outline_level}"/></w:pPr>')
+    parts.append("</w:style>")
+    return "".join(parts)
+
+
+def test_docx_heading_levels_follow_based_on(tmp_path):
+    path = tmp_path / "styles.docx"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/styles.xml", styles_xml(
+            style("Title", "Title"),
+            style("Heading1", "heading 1"),
+            style("Heading2", "heading 2", based_on="Heading1"),
+            style("Chapter", "Chapter", based_on="Heading1"),
+            style("SubChapter", "Sub chapter", based_on="Chapter"),
+            style("Callout", "Callout", outline_level=2),
+            style("Body", "Body text", outline_level=9),
+            style("Loop1", "Loop 1", based_on="Loop2"),
+            style("Loop2", "Loop 2", based_on="Loop1"),
+        ))
+    with zipfile.ZipFile(path) as archive:
+        levels = _docx_heading_levels(archive)
+
+    assert levels == {"Title": 0, "Heading1": 1, "Heading2": 2, "Chapter": 1, "SubChapter": 1, "Callout": 3}
+
+
+def test_docx_sections_are_read_by_paragraph_range(tmp_path, cache):
+    docx = pytest.importorskip("docx")
+    from docx.enum.style import WD_STYLE_TYPE
+
+    document = docx.Document()
+    chapter = document.styles.add_style("Chapter", WD_STYLE_TYPE.PARAGRAPH)
+    chapter.base_style = document.styles["Heading 1"]
+    document.add_paragraph("Preface text.")
+    document.add_paragraph("Introduction", style="Chapter")
+    document.add_paragraph("Intro text.")
+    document.add_heading("Background", level=2)
+    document.add_paragraph("Background text.")
+    document.add_paragraph("Results", style="Chapter")
+    document.add_paragraph("Results text.")
+    path = str(tmp_path / "report.docx")
+    document.save(path)
+
+    built = cache.get(path)
+
+    assert built.source == "styles"
+    assert [(section.title, section.level, section.start, section.stop) for section in built.sections] == [
+        ("Introduction", 1, 1, 5), ("Background", 2, 3, 5), ("Results", 1, 5, 7),
+    ]
+    assert outline.extract_section_from_file(path, "introduction") == (
+        "Introduction\nIntro text.\nBackground\nBackground text."
+    )
+    assert outline.extract_section_from_file(path, "Results") == "Results\nResults text."
+    with pytest.raises(ValueError, match="Headings: 'Introduction', 'Background', 'Results'"):
+        outline.extract_section_from_file(path, "Conclusion")
@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from app.services.storage import LocalStorage, StorageError
+
+CHUNK = 1024
+
+
+def write(path, size):
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return data
+
+
+class RecordingStorage(LocalStorage):
+    """LocalStorage recording the parts it is sent, failing the part at `fail_offset`."""
+
+    def __init__(self, *args, fail_offset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_offset = fail_offset
+        self.appended = []
+        self.ranges = []
+
+    def _session_append(self, session_id, offset, data, close=False):
+        if offset == self.fail_offset:
+            raise StorageError(f"part at {offset} failed")
+        self.appended.append((offset, len(data), close))
+        super()._session_append(session_id, offset, data, close)
+
+    def _iter_range(self, remote_path, rev, offset, length):
+        if offset == self.fail_offset:
+            raise StorageError(f"range at {offset} failed")
+        self.ranges.append((offset, length))
+        return super()._iter_range(remote_path, rev, offset, length)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return RecordingStorage(tmp_path / "root", chunk_size=CHUNK, parallel_parts=3)
+
+
+def session_files(storage):
+    return os.listdir(storage.root / LocalStorage._SESSIONS)
+
+
+@pytest.mark.parametrize("size", [CHUNK, CHUNK + 1, 3 * CHUNK, 3 * CHUNK + 17])
+def test_upload_splits_into_parts(storage, tmp_path, size):
+    data = write(tmp_path / "in.bin", size)
+
+    stored = storage.upload(str(tmp_path / "in.bin"), "/uploads/in.bin")
+
+    assert stored.size == size
+    assert (storage.root / "uploads" / "in.bin").read_bytes() == data
+    if size <= CHUNK:
+        assert storage.appended == []  # one call, no session
+    else:
+        parts = sorted(storage.appended)
+        assert [offset for offset, _, _ in parts] == list(range(0, size, CHUNK))
+        assert all(length == CHUNK for _, length, _ in parts[:-1])
+        assert sum(length for _, length, _ in parts) == size
+        assert [close for _, _, close in parts] == [False] * (len(parts) - 1) + [True]
+    assert session_files(storage) == []
+
+
+@pytest.mark.parametrize("size", [CHUNK, CHUNK + 1, 2 * CHUNK, 2 * CHUNK + 5])
+def test_upload_fileobj_sends_parts_in_order(storage, tmp_path, size):
+    data = write(tmp_path / "in.bin", size)
+
+    with open(tmp_path / "in.bin", "rb") as source:
+        storage.upload_fileobj(source, "/in.bin")
+
+    assert (storage.root / "in.bin").read_bytes() == data
+    # The first part starts the session and the last one finishes it.
+    middle = list(range(CHUNK, size - CHUNK, CHUNK)) if size > 2 * CHUNK else []
+    assert [offset for offset, _, _ in storage.appended] == middle
+
+
+def test_failed_part_fails_the_upload(tmp_path):
+    storage = RecordingStorage(tmp_path / "root", chunk_size=CHUNK, parallel_parts=3, fail_offset=CHUNK)
+    write(tmp_path / "in.bin", 4 * CHUNK)
+
+    with pytest.raises(StorageError, match="part at 1024 failed"):
+        storage.upload(str(tmp_path / "in.bin"), "/in.bin")
+
+    assert not (storage.root / "in.bin").exists()
+    assert session_files(storage) == []
+
+
+@pytest.mark.parametrize("size", [CHUNK, 3 * CHUNK + 17])
+def test_download_reassembles_ranges(storage, tmp_path, size):
+    data = write(tmp_path / "in.bin", size)
+    storage.upload(str(tmp_path / "in.bin"), "/in.bin")
+
+    stored = storage.download("/in.bin", str(tmp_path / "out.bin"))
+
+    assert stored.size == size
+    assert (tmp_path / "out.bin").read_bytes() == data
+    expected = [] if size <= CHUNK else [(offset, min(CHUNK, size - offset)) for offset in range(0, size, CHUNK)]
+    assert sorted(storage.ranges) == expected
+
+
+def test_streamed_download(storage, tmp_path):
+    data = write(tmp_path / "in.bin", 3 * CHUNK + 17)
+    storage.upload(str(tmp_path / "in.bin"), "/in.bin")
+
+    assert b"".join(storage.iter_download("/in.bin", chunk_size=100)) == data
+
+
+def test_failed_range_fails_the_download(storage, tmp_path):
+    write(tmp_path / "in.bin", 3 * CHUNK + 17)
+    storage.upload(str(tmp_path / "in.bin"), "/in.bin")
+    storage.fail_offset = 2 * CHUNK
+    (tmp_path / "out.bin").write_bytes(b"previous")
+
+    with pytest.raises(StorageError, match="range at 2048 failed"):
+        storage.download("/in.bin", str(tmp_path / "out.bin"))
+
+    # The previous file is left alone and no partial download remains.
+    assert (tmp_path / "out.bin").read_bytes() == b"previous"
+    assert sorted(os.listdir(tmp_path)) == ["in.bin", "out.bin", "root"]
+
+
+def test_no_overwrite(storage, tmp_path):
+    write(tmp_path / "in.bin", 3 * CHUNK)
+    storage.upload(str(tmp_path / "in.bin"), "/in.bin")
+
+    with pytest.raises(StorageError, match="Already exists"):
+        storage.upload(str(tmp_path / "in.bin"), "/in.bin", overwrite=False)
+    assert session_files(storage) == []
@@ -0,0 +1,153 @@
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.upload_metadata import (
+    LISTED_FIELDS, MAX_BATCH_WRITES, FirestoreBackend, MemoryBackend, UploadMetadata, decode_cursor,
+)
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class RecordingBackend(MemoryBackend):
+    """MemoryBackend recording the fields it is asked for and the write batches it commits."""
+
+    def __init__(self):
+        super().__init__()
+        self.fetched_fields = []
+        self.commits = []
+
+    def fetch_page(self, user_id, fields, limit, after=None):
+        self.fetched_fields.append(tuple(fields))
+        return super().fetch_page(user_id, fields, limit, after)
+
+    def commit(self, writes):
+        self.commits.append(len(writes))
+        super().commit(writes)
+
+
+def upload(user_id, number, **extra):
+    return {"user_id": user_id, "id": f"{user_id}-{number:03d}", "filename": f"f{number}.pdf",
+            "dropbox_path": f"/uploads/{user_id}/f{number}.pdf", "url": f"https://x/{number}",
+            "uploaded_at": START + timedelta(minutes=number), **extra}
+
+
+@pytest.fixture
+def backend():
+    return RecordingBackend()
+
+
+@pytest.fixture
+def metadata(backend):
+    return UploadMetadata(backend, page_size=3, cache_ttl=60, cache_users=8)
+
+
+def test_pages_follow_the_cursor_without_gaps_or_repeats(metadata):
+    # Two uploads share a timestamp: the document id breaks the tie.
+    uploads = [upload("u", number) for number in range(10)]
+    uploads.append({**upload("u", 10), "uploaded_at": uploads[4]["uploaded_at"]})
+    metadata.record_uploads(uploads + [upload("other", 0)])
+
+    pages, cursor = [], None
+    while True:
+        page = metadata.list_uploads("u", cursor)
+        pages.append([record.id for record in page.items])
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    listed = [document_id for page in pages for document_id in page]
+    expected = sorted(uploads, key=lambda item: (item["uploaded_at"], item["id"]), reverse=True)
+    assert listed == [item["id"] for item in expected]
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert [record.id for record in metadata.iter_uploads("u", page_size=4)] == listed
+
+
+def test_exact_multiple_of_the_page_size_has_no_empty_last_page(metadata):
+    metadata.record_uploads([upload("u", number) for number in range(6)])
+
+    first = metadata.list_uploads("u")
+    second = metadata.list_uploads("u", first.next_cursor)
+
+    assert len(second.items) == 3
+    assert second.next_cursor is None
+    assert decode_cursor(first.next_cursor) == (first.items[-1].uploaded_at, first.items[-1].id)
+
+
+def test_only_listed_fields_are_fetched(metadata, backend):
+    metadata.record_upload("u", "a.pdf", "/uploads/u/a.pdf", "https://x/a")
+    backend.commit([("set", "big", {**upload("u", 99), "text": "x" * 1000, "size": 123})])
+
+    page = metadata.list_uploads("u")
+
+    assert set(backend.fetched_fields) == {LISTED_FIELDS}
+    assert set(LISTED_FIELDS) == {"filename", "dropbox_path", "url", "uploaded_at"}
+    assert set(asdict(page.items[0])) == {"id", *LISTED_FIELDS}
+    assert backend.fetch_page("u", LISTED_FIELDS, 1)[0][1].keys() == set(LISTED_FIELDS)
+
+
+def test_pages_are_cached_until_an_upload(metadata, backend):
+    metadata.record_uploads([upload("u", number) for number in range(4)])
+    metadata.record_upload("v", "v.pdf", "/uploads/v/v.pdf", "https://x/v")
+    first = metadata.list_uploads("u")
+    metadata.list_uploads("v")
+    reads = backend.reads
+
+    assert metadata.list_uploads("u") is first
+    assert backend.reads == reads
+
+    record = metadata.record_upload("u", "new.pdf", "/uploads/u/new.pdf", "https://x/new")
+
+    page = metadata.list_uploads("u")
+    assert page.items[0].id == record.id
+    assert backend.reads > reads
+    # Another user's pages are not dropped.
+    reads = backend.reads
+    metadata.list_uploads("v")
+    assert backend.reads == reads
+    assert metadata.stats()["invalidations"] == 1
+
+
+def test_deletes_invalidate(metadata):
+    metadata.record_uploads([upload("u", number) for number in range(2)])
+    assert len(metadata.list_uploads("u").items) == 2
+
+    metadata.delete_uploads("u", ["u-001"])
+
+    assert [record.id for record in metadata.list_uploads("u").items] == ["u-000"]
+
+
+def test_uploads_are_written_in_one_batch(metadata, backend):
+    records = metadata.record_uploads([upload(user_id, number) for user_id in "ab" for number in range(5)])
+
+    assert backend.commits == [10]
+    assert [record.id for record in records] == [f"{user_id}-{number:03d}" for user_id in "ab" for number in range(5)]
+    assert len(list(metadata.iter_uploads("a"))) == len(list(metadata.iter_uploads("b"))) == 5
+
+
+class FakeBatch:
+    def __init__(self, batches):
+        self.writes = []
+        batches.append(self.writes)
+
+    def set(self, reference, data):
+        self.writes.append(("set", reference))
+
+    def delete(self, reference):
+        self.writes.append(("delete", reference))
+
+    def commit(self):
+        pass
+
+
+def test_firestore_commit_splits_batches():
+    batches = []
+    backend = FirestoreBackend.__new__(FirestoreBackend)
+    backend.client = type("Client", (), {"batch": lambda self: FakeBatch(batches)})()
+    backend.collection = type("Collection", (), {"document": lambda self, document_id: document_id})()
+
+    backend.commit([("set", str(number), {}) for number in range(2 * MAX_BATCH_WRITES + 1)])
+
+    assert [len(batch) for batch in batches] == [MAX_BATCH_WRITES, MAX_BATCH_WRITES, 1]
+    assert [reference for batch in batches for _, reference in batch] == [str(n) for n in range(2 * MAX_BATCH_WRITES + 1)]